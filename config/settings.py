@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.query_ripetute.QueryRipetuteMiddleware',  # N+1 a runtime (solo con QUERY_RIPETUTE_ATTIVO)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.AnnoAccademicoMiddleware',  # request.anno_accademico
     
     # Debug toolbar (solo in sviluppo)
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -204,10 +206,40 @@ ADMIN_INDEX_TITLE = "Benvenuto nel pannello di amministrazione UNIGEST"
 
 # Configurazione paginazione (numero di elementi per pagina)
 PAGINATION_PER_PAGE = 50
+AUTOCOMPLETE_PER_PAGINA = 20  # Risultati per pagina dei campi iscritto con autocompletamento
 
 # Configurazione sessioni
 SESSION_COOKIE_AGE = 86400  # 24 ore in secondi
-SESSION_SAVE_EVERY_REQUEST = True
+# La scadenza resta scorrevole: AnnoAccademicoMiddleware riscrive la sessione
+# al più una volta ogni SESSION_RINNOVO secondi invece che a ogni richiesta
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_RINNOVO = config('SESSION_RINNOVO', default=3600, cast=int)
+
+# Configurazione cache (statistiche di home, dashboard e report)
+# Senza Redis: FileBasedCache è condivisa tra i worker gunicorn della stessa macchina,
+# LocMemCache ('django.core.cache.backends.locmem.LocMemCache') vale per singolo processo
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+    }
+}
+STATISTICHE_CACHE_TIMEOUT = config('STATISTICHE_CACHE_TIMEOUT', default=600, cast=int)  # secondi
+# Lock su file contro lo stampede (core/lock.py), condivisi dai processi della macchina
+LOCK_DIR = config('LOCK_DIR', default=str(BASE_DIR / 'cache' / 'lock'))
+
+# Report e export generati in background dal comando worker_report (core/lavori.py)
+REPORT_IN_BACKGROUND = config('REPORT_IN_BACKGROUND', default=False, cast=bool)  # True: generati da worker_report
+REPORT_SCADENZA_ORE = config('REPORT_SCADENZA_ORE', default=24, cast=int)  # durata dei file in MEDIA_ROOT
+REPORT_TIMEOUT = config('REPORT_TIMEOUT', default=600, cast=int)  # secondi senza segnale dal worker prima di rimettere in coda un lavoro
+REPORT_CACHE_DIR = config('REPORT_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'report'))  # PDF già generati
+REPORT_CACHE_MB = config('REPORT_CACHE_MB', default=500, cast=int)  # oltre, cancellati i meno usati
+REPORT_PROCESSI = config('REPORT_PROCESSI', default=0, cast=int)  # processi per i pacchetti di report, 0 = uno per core
+
+# Rilevamento delle query ripetute (N+1) a runtime, vedi core/query_ripetute.py
+QUERY_RIPETUTE_ATTIVO = config('QUERY_RIPETUTE_ATTIVO', default=False, cast=bool)
+QUERY_RIPETUTE_SOGLIA = config('QUERY_RIPETUTE_SOGLIA', default=10, cast=int)  # esecuzioni per richiesta
+QUERY_RIPETUTE_CAMPIONE = config('QUERY_RIPETUTE_CAMPIONE', default=1.0, cast=float)  # frazione di richieste
 
 # Logging (per tracciare errori e attività)
 LOGGING = {
@@ -13,7 +13,7 @@ from .models import (
     Iscritto, Docente, Autorita,
     CategoriaCorso, GruppoCorso, Corso, AnnoAccademico, Quadrimestre,
     EdizioneCorso, IscrizioneAnnoAccademico, IscrizioneCorso,
-    Lezione, PresenzaLezione
+    Lezione, PresenzaLezione, LavoroReport
 )
 
 
@@ -352,3 +352,20 @@ class PresenzaLezioneAdmin(admin.ModelAdmin):
             '<span style="color: red; font-weight: bold;">✗ Assente</span>'
         )
     presente_display.short_description = "Stato"
+
+
+# ============================================================================
+# CONFIGURAZIONI ADMIN PER REPORT IN BACKGROUND
+# ============================================================================
+
+@admin.register(LavoroReport)
+class LavoroReportAdmin(admin.ModelAdmin):
+    list_display = ['descrizione', 'stato', 'richiesto_da', 'data_creazione', 'data_fine', 'tentativi', 'worker']
+    list_filter = ['stato', 'tipo']
+    search_fields = ['descrizione']
+    date_hierarchy = 'data_creazione'
+    list_select_related = ['richiesto_da']
+    readonly_fields = [
+        'tipo', 'parametri', 'chiave', 'richiesto_da', 'tentativi', 'worker', 'errore',
+        'file', 'nome_file', 'data_creazione', 'data_inizio', 'data_fine', 'data_segnale', 'scadenza'
+    ]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Collega i ricevitori dei segnali (invalidazione cache statistiche)
+        from core import signals  # noqa: F401
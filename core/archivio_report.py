@@ -0,0 +1,215 @@
+"""
+UNIGEST - Archivio dei report
+File: core/archivio_report.py
+Descrizione: Cache su disco dei PDF generati, indirizzata dal contenuto dei dati.
+
+La chiave di un report è l'hash di tipo, parametri e impronta dei dati che il
+report legge: numero di righe, somma delle chiavi e ultima data di modifica
+(data_modifica di iscritti, docenti e lezioni), o i valori stessi delle righe per
+le tabelle senza data di modifica (edizioni, corsi, categorie). Nella chiave entra
+anche la data del giorno, stampata nell'intestazione di ogni pagina. Finché i dati
+non cambiano, la stessa richiesta trova il PDF già pronto e lo scarica da disco;
+un report con dati cambiati ha un'altra chiave e viene rigenerato.
+
+Ogni PDF sta in REPORT_CACHE_DIR/<ab>/<chiave>/<nome del file>. Ogni lettura
+aggiorna la data di modifica del file, e oltre REPORT_CACHE_MB vengono cancellati
+i meno usati di recente (LRU). Un solo processo alla volta genera un report
+mancante (lock su file di core/lock.py, come in core/statistiche.py): le
+richieste uguali arrivate nel frattempo attendono il suo file invece di rigenerarlo.
+
+Le modifiche fatte senza aggiornare data_modifica (update() e SQL diretto) non
+cambiano l'impronta: valgono al più fino al giorno dopo, quando cambia la chiave.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils.text import get_valid_filename
+from core import lock
+from core.models import (
+    AnnoAccademico, CategoriaCorso, EdizioneCorso, IscrizioneAnnoAccademico,
+    IscrizioneCorso, Lezione
+)
+
+logger = logging.getLogger(__name__)
+
+# Durata del lock di generazione e attesa massima di chi trova il lock occupato
+TIMEOUT_LOCK = 300
+ATTESA_MAX = 120
+
+
+# ============================================================================
+# IMPRONTA DEI DATI
+# ============================================================================
+
+def _righe(queryset, *campi):
+    """Valori delle righe lette dal report, per le tabelle senza data di modifica"""
+    return list(queryset.values_list(*campi))
+
+
+def _insieme(queryset, *date_modifica):
+    """Numero, somma delle chiavi e ultime modifiche: cambiano se una riga viene aggiunta, tolta o modificata"""
+    return queryset.aggregate(
+        numero=Count('pk'), somma=Sum('pk'),
+        **{f'modifica_{i}': Max(campo) for i, campo in enumerate(date_modifica)}
+    )
+
+
+CAMPI_EDIZIONE = (
+    'corso__nome', 'anno_accademico__anno', 'quadrimestre__numero', 'docente__nome',
+    'giorni_settimana', 'ora_inizio', 'ora_fine',
+)
+
+
+def _iscritti_edizione(edizione_id):
+    return [
+        _righe(EdizioneCorso.objects.filter(pk=edizione_id), *CAMPI_EDIZIONE),
+        _insieme(IscrizioneCorso.objects.filter(edizione_corso_id=edizione_id), 'iscritto__data_modifica'),
+    ]
+
+
+def _lezioni_edizione(edizione_id):
+    return [
+        _righe(EdizioneCorso.objects.filter(pk=edizione_id), *CAMPI_EDIZIONE),
+        _insieme(Lezione.objects.filter(edizione_corso_id=edizione_id), 'data_modifica', 'docente__data_modifica'),
+    ]
+
+
+def _corsi_anno(anno_id):
+    return [
+        _righe(AnnoAccademico.objects.filter(pk=anno_id), 'anno'),
+        _righe(CategoriaCorso.objects.order_by('pk'), 'pk', 'nome', 'ordine'),
+        _righe(
+            EdizioneCorso.objects.filter(anno_accademico_id=anno_id).order_by('pk'),
+            'pk', 'corso__categoria_id', 'numero_iscritti', *CAMPI_EDIZIONE
+        ),
+    ]
+
+
+def _rubrica_anno(anno_id):
+    return [
+        _righe(AnnoAccademico.objects.filter(pk=anno_id), 'anno'),
+        _insieme(IscrizioneAnnoAccademico.objects.filter(anno_accademico_id=anno_id), 'iscritto__data_modifica'),
+    ]
+
+
+# tipo di report (core/lavori.py) -> funzione(**parametri) con i dati da cui dipende il PDF
+IMPRONTE = {
+    'foglio_presenze': _iscritti_edizione,
+    'elenco_iscritti': _iscritti_edizione,
+    'registro_lezioni': _lezioni_edizione,
+    'elenco_corsi_anno': _corsi_anno,
+    'rubrica_contatti': _rubrica_anno,
+}
+
+
+def chiave(tipo, **parametri):
+    """Chiave del report con i dati attuali; None per i tipi che non passano dall'archivio"""
+    if tipo not in IMPRONTE:
+        return None
+    contenuto = [tipo, parametri, date.today(), IMPRONTE[tipo](**parametri)]
+    return hashlib.sha256(
+        json.dumps(contenuto, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+# ============================================================================
+# FILE SU DISCO
+# ============================================================================
+
+def _directory():
+    return Path(settings.REPORT_CACHE_DIR)
+
+
+def _cartella(chiave):
+    return _directory() / chiave[:2] / chiave
+
+
+def cerca(chiave):
+    """Percorso del PDF archiviato con questa chiave, o None; segna il file come appena usato"""
+    try:
+        percorso = next(_cartella(chiave).iterdir())
+        os.utime(percorso)
+    except (FileNotFoundError, StopIteration):
+        return None
+    return percorso
+
+
+def salva(chiave, nome_file, contenuto):
+    """Archivia il contenuto (file aperto in binario) e restituisce il percorso del PDF"""
+    cartella = _cartella(chiave)
+    cartella.parent.mkdir(parents=True, exist_ok=True)
+    # Scritto in una cartella temporanea e rinominato: chi legge non vede mai un PDF a metà
+    provvisoria = Path(tempfile.mkdtemp(dir=cartella.parent, prefix='.tmp-'))
+    with open(provvisoria / get_valid_filename(nome_file), 'wb') as file:
+        contenuto.seek(0)
+        shutil.copyfileobj(contenuto, file)
+    try:
+        os.rename(provvisoria, cartella)
+    except OSError:
+        # Archiviato nel frattempo da un altro processo
+        shutil.rmtree(provvisoria, ignore_errors=True)
+    sfoltisci()
+    return cerca(chiave)
+
+
+def ottieni(chiave, genera):
+    """
+    PDF archiviato con questa chiave; se manca lo genera con genera(), che
+    restituisce (file, nome del file). Protezione dalle richieste simultanee:
+    genera solo chi ottiene il lock, gli altri attendono fino a ATTESA_MAX secondi
+    il suo file prima di generarlo da sé.
+    """
+    percorso = cerca(chiave)
+    if percorso:
+        return percorso
+
+    chiave_lock = f'archivio_report:{chiave}:lock'
+    token = lock.acquisisci(chiave_lock, TIMEOUT_LOCK)
+    if token is None:
+        scadenza = time.monotonic() + ATTESA_MAX
+        while time.monotonic() < scadenza:
+            time.sleep(0.2)
+            percorso = cerca(chiave)
+            if percorso:
+                return percorso
+        logger.warning("Report %s: lock di generazione occupato da oltre %ss", chiave, ATTESA_MAX)
+
+    try:
+        contenuto, nome_file = genera()
+        with contenuto:
+            return salva(chiave, nome_file, contenuto)
+    finally:
+        # Chi ha smesso di attendere non ha il lock e non lo cancella
+        lock.rilascia(chiave_lock, token)
+
+
+def sfoltisci(limite=None):
+    """Cancella i PDF usati meno di recente finché l'archivio supera il limite in byte. Restituisce quanti."""
+    if limite is None:
+        limite = settings.REPORT_CACHE_MB * 1024 * 1024
+    voci = []
+    for cartella in _directory().glob('??/*'):
+        if cartella.name.startswith('.tmp-'):
+            continue
+        for percorso in cartella.iterdir():
+            stat = percorso.stat()
+            voci.append((stat.st_mtime, stat.st_size, cartella))
+
+    totale = sum(dimensione for _, dimensione, _ in voci)
+    cancellati = 0
+    for _, dimensione, cartella in sorted(voci, key=lambda voce: voce[0]):
+        if totale <= limite:
+            break
+        shutil.rmtree(cartella, ignore_errors=True)
+        totale -= dimensione
+        cancellati += 1
+    return cancellati
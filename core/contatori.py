@@ -0,0 +1,68 @@
+"""
+UNIGEST - Contatori
+File: core/contatori.py
+Descrizione: Contatori denormalizzati di EdizioneCorso (numero_iscritti,
+numero_lezioni), per mostrare gli iscritti e le lezioni di centinaia di
+edizioni con una sola query invece di un COUNT per riga.
+
+I segnali su IscrizioneCorso e Lezione (core/signals.py) li aggiornano con un
+UPDATE ... SET n = n ± 1 nella stessa transazione del salvataggio o della
+cancellazione. Le scritture che non emettono segnali (bulk_create, SQL diretto)
+vanno seguite da ricalcola(), come fanno import_old_data e seed_synthetic;
+il comando ricalcola_contatori verifica e corregge i valori salvati.
+"""
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from core.models import EdizioneCorso, IscrizioneCorso, Lezione
+
+# Modello contato -> campo contatore su EdizioneCorso
+CONTATORI = {
+    IscrizioneCorso: 'numero_iscritti',
+    Lezione: 'numero_lezioni',
+}
+
+
+def sposta(modello, da_edizione_id, a_edizione_id):
+    """Una riga di modello passa da un'edizione all'altra (None per creazione o cancellazione)"""
+    campo = CONTATORI[modello]
+    if da_edizione_id:
+        # Il filtro > 0 evita un valore negativo se il contatore era già disallineato
+        EdizioneCorso.objects.filter(pk=da_edizione_id, **{f'{campo}__gt': 0}).update(**{campo: F(campo) - 1})
+    if a_edizione_id:
+        EdizioneCorso.objects.filter(pk=a_edizione_id).update(**{campo: F(campo) + 1})
+
+
+def _conteggio(modello):
+    """Subquery con il numero di righe di modello dell'edizione esterna"""
+    return Coalesce(Subquery(
+        modello.objects.filter(
+            edizione_corso=OuterRef('pk')
+        ).order_by().values('edizione_corso').annotate(n=Count('pk')).values('n')
+    ), Value(0))
+
+
+def disallineate(edizioni=None):
+    """Edizioni con almeno un contatore diverso dal conteggio reale, annotate con reale_<campo>"""
+    edizioni = EdizioneCorso.objects.all() if edizioni is None else edizioni
+    return edizioni.annotate(**{
+        f'reale_{campo}': _conteggio(modello) for modello, campo in CONTATORI.items()
+    }).exclude(**{
+        campo: F(f'reale_{campo}') for campo in CONTATORI.values()
+    }).select_related('corso', 'anno_accademico').order_by('pk')
+
+
+def ricalcola(edizioni=None, salva=True):
+    """
+    Riallinea i contatori ai conteggi reali (tutte le edizioni o il queryset indicato).
+    Restituisce le edizioni che erano disallineate, con i valori salvati nei campi
+    e quelli reali in reale_<campo>; con salva=False si limita a trovarle.
+    """
+    errate = list(disallineate(edizioni))
+    if salva:
+        # Ricontate nell'UPDATE stesso, non copiate dalla lettura precedente
+        for inizio in range(0, len(errate), 500):
+            EdizioneCorso.objects.filter(pk__in=[e.pk for e in errate[inizio:inizio + 500]]).update(**{
+                campo: _conteggio(modello) for modello, campo in CONTATORI.items()
+            })
+    return errate
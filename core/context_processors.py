@@ -4,7 +4,6 @@ File: core/context_processors.py
 Descrizione: Fornisce dati globali a tutti i template
 """
 
-from core.models import AnnoAccademico
 from datetime import date
 
 def calcola_anno_corrente():
@@ -33,35 +32,21 @@ def calcola_anno_corrente():
 
 def anno_accademico_corrente(request):
     """
-    Fornisce l'anno accademico selezionato a tutti i template
+    Fornisce l'anno accademico selezionato a tutti i template.
+    L'anno è risolto una volta per richiesta da AnnoAccademicoMiddleware
+    (request.anno_accademico) e la lista per il selettore viene dalla cache di
+    processo: nessuna query né scrittura di sessione a ogni pagina.
     """
-    # Ottieni anno dalla sessione
-    anno_id = request.session.get('anno_accademico_id')
+    from core.middleware import anni_accademici, risolvi_anno
 
-    if anno_id:
-        anno_attivo = AnnoAccademico.objects.filter(id=anno_id).first()
-    else:
-        # Se non c'è nella sessione, calcola l'anno corrente
-        anno_corrente_str = calcola_anno_corrente()
-        anno_attivo = AnnoAccademico.objects.filter(anno=anno_corrente_str).first()
-
-        # Se non esiste quell'anno, prendi l'anno marcato come attivo
-        if not anno_attivo:
-            anno_attivo = AnnoAccademico.objects.filter(attivo=True).first()
-
-        # Se ancora non c'è, prendi il più recente
-        if not anno_attivo:
-            anno_attivo = AnnoAccademico.objects.order_by('-anno').first()
-
-    # Salva in sessione
-    if anno_attivo:
-        request.session['anno_accademico_id'] = anno_attivo.id
-
-    # Lista di tutti gli anni per il selettore
-    anni_disponibili = AnnoAccademico.objects.all().order_by('-anno')
+    anno_attivo = getattr(request, 'anno_accademico', None)
+    if anno_attivo is None:
+        # Middleware non installato (es. RequestFactory nei test)
+        anno_attivo = risolvi_anno(request)
 
     return {
         'anno_attivo': anno_attivo,
-        'anni_disponibili': anni_disponibili,
+        # Lista di tutti gli anni per il selettore
+        'anni_disponibili': anni_accademici(),
         'anno_corrente_calcolato': calcola_anno_corrente(),  # Per debug
     }
@@ -0,0 +1,89 @@
+"""
+UNIGEST - Esportazioni
+File: core/esportazioni.py
+Descrizione: Esportazione dell'anagrafe iscritti in Excel e CSV a memoria limitata.
+
+Gli iscritti vengono letti a blocchi di BLOCCO righe con values_list e
+paginazione a chiave su (nominativo, matricola) (core/paginazione.py): ogni
+blocco è una query breve e nessun oggetto del modello viene costruito.
+Il CSV è generato man mano che viene scaricato (StreamingHttpResponse); l'Excel
+usa la modalità write-only di openpyxl, che scrive le righe sul file indicato
+invece di tenerle in memoria; lo genera il report iscritti_excel di core/lavori.py.
+"""
+
+import csv
+from openpyxl import Workbook
+from django.http import StreamingHttpResponse
+from core.models import Iscritto
+from core.paginazione import condizione_seek
+
+BLOCCO = 2000
+CHIAVE = ['nominativo', 'matricola']
+
+# (intestazione, campo letto con values_list)
+COLONNE_ISCRITTI = [
+    ('Matricola', 'matricola'),
+    ('Nominativo', 'nominativo'),
+    ('Sesso', 'sesso'),
+    ('Data Nascita', 'data_nascita'),
+    ('Comune', 'comune__nome'),
+    ('Telefono', 'telefono'),
+    ('Cellulare', 'cellulare'),
+    ('Email', 'email'),
+]
+
+SESSO = dict(Iscritto.SESSO_CHOICES)
+
+
+def blocchi_iscritti(blocco=BLOCCO):
+    """Righe già formattate degli iscritti, in liste di al più blocco righe"""
+    campi = [campo for _, campo in COLONNE_ISCRITTI]
+    queryset = Iscritto.objects.order_by(*CHIAVE).values_list(*campi)
+    ultima = None
+    while True:
+        righe = queryset.filter(condizione_seek(CHIAVE, ultima)) if ultima else queryset
+        righe = list(righe[:blocco])
+        if not righe:
+            return
+        yield [
+            [
+                matricola, nominativo, SESSO.get(sesso, sesso),
+                data_nascita.strftime('%d/%m/%Y') if data_nascita else '',
+                comune or '', telefono or '', cellulare or '', email or '',
+            ]
+            for matricola, nominativo, sesso, data_nascita, comune, telefono, cellulare, email in righe
+        ]
+        ultima = [righe[-1][1], righe[-1][0]]
+
+
+class _Eco:
+    """File finto per csv.writer: restituisce la riga invece di scriverla"""
+
+    def write(self, valore):
+        return valore
+
+
+def _csv_iscritti():
+    scrittore = csv.writer(_Eco(), delimiter=';')
+    # BOM: Excel riconosce l'UTF-8 e apre il file con le lettere accentate corrette
+    yield '\ufeff' + scrittore.writerow([intestazione for intestazione, _ in COLONNE_ISCRITTI])
+    for righe in blocchi_iscritti():
+        yield ''.join(scrittore.writerow(riga) for riga in righe)
+
+
+def risposta_csv_iscritti():
+    """StreamingHttpResponse con il CSV di tutti gli iscritti (separatore ;)"""
+    response = StreamingHttpResponse(_csv_iscritti(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename=iscritti.csv'
+    return response
+
+
+def scrivi_excel_iscritti(file):
+    """Scrive su file (aperto in binario) il foglio Excel di tutti gli iscritti, in modalità write-only"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Iscritti")
+    ws.append([intestazione for intestazione, _ in COLONNE_ISCRITTI])
+    for righe in blocchi_iscritti():
+        for riga in righe:
+            ws.append(riga)
+    wb.save(file)
@@ -6,6 +6,7 @@ Descrizione: Form per l'inserimento e modifica dati
 
 from django import forms
 from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 from .models import (
     Iscritto, Docente, Autorita, Corso, EdizioneCorso,
     IscrizioneAnnoAccademico, IscrizioneCorso, Lezione, PresenzaLezione,
@@ -13,6 +14,47 @@ from .models import (
 )
 
 
+# ============================================================================
+# WIDGET
+# ============================================================================
+
+class IscrittoAutocomplete(forms.Select):
+    """
+    Select per un iscritto compilata dal browser tramite l'endpoint
+    core:iscritto_autocomplete invece di elencare tutta la tabella: nell'HTML
+    finisce solo l'opzione selezionata, quindi la pagina pesa uguale con 100 o
+    100.000 iscritti. Con solo_assistenti la ricerca è limitata agli assistenti.
+    """
+    url = reverse_lazy('core:iscritto_autocomplete')
+
+    class Media:
+        js = ['js/autocomplete.js']
+
+    def __init__(self, attrs=None, solo_assistenti=False):
+        super().__init__(attrs)
+        self.solo_assistenti = solo_assistenti
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        url = str(self.url) + ('?assistenti=1' if self.solo_assistenti else '')
+        attrs.setdefault('data-autocomplete', url)
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        """Solo l'opzione vuota e quella selezionata, lette con una query per chiave primaria"""
+        campo = self.choices.field
+        selezionati = [v for v in value if str(v).isdigit()]
+        opzioni = []
+        if campo.empty_label is not None:
+            opzioni.append(self.create_option(name, '', campo.empty_label, not selezionati, 0))
+        if selezionati:
+            for iscritto in campo.queryset.filter(pk__in=selezionati):
+                opzioni.append(self.create_option(
+                    name, iscritto.pk, campo.label_from_instance(iscritto), True, len(opzioni)
+                ))
+        return [(None, opzioni, 0)]
+
+
 # ============================================================================
 # FORMS PER ANAGRAFICHE
 # ============================================================================
@@ -40,7 +82,7 @@ class IscrittoForm(forms.ModelForm):
             'luogo_nascita': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Città di nascita'}),
             'data_nascita': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'situazione': forms.Select(attrs={'class': 'form-control'}),
-            'coniuge': forms.Select(attrs={'class': 'form-control'}),
+            'coniuge': IscrittoAutocomplete(attrs={'class': 'form-control'}),
             'indirizzo': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Via, numero civico'}),
             'comune': forms.Select(attrs={'class': 'form-control'}),
             'telefono': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '051 1234567'}),
@@ -204,8 +246,8 @@ class EdizioneCorsoForm(forms.ModelForm):
                 'placeholder': 'Lascia vuoto per usare la descrizione del corso'
             }),
             'docente': forms.Select(attrs={'class': 'form-control'}),
-            'assistente': forms.Select(attrs={'class': 'form-control'}),
-            'vice_assistente': forms.Select(attrs={'class': 'form-control'}),
+            'assistente': IscrittoAutocomplete(attrs={'class': 'form-control'}, solo_assistenti=True),
+            'vice_assistente': IscrittoAutocomplete(attrs={'class': 'form-control'}, solo_assistenti=True),
             'giorni_settimana': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Es: Lunedì, Mercoledì'
@@ -251,7 +293,7 @@ class IscrizioneAnnoForm(forms.ModelForm):
         fields = ['anno_accademico', 'iscritto', 'numero_ricevuta', 'data_iscrizione']
         widgets = {
             'anno_accademico': forms.Select(attrs={'class': 'form-control'}),
-            'iscritto': forms.Select(attrs={'class': 'form-control'}),
+            'iscritto': IscrittoAutocomplete(attrs={'class': 'form-control'}),
             'numero_ricevuta': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Numero ricevuta'}),
             'data_iscrizione': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
@@ -289,22 +331,22 @@ class IscrizioneCorsoForm(forms.ModelForm):
         widgets = {
             'anno_accademico': forms.Select(attrs={'class': 'form-control'}),
             'edizione_corso': forms.Select(attrs={'class': 'form-control'}),
-            'iscritto': forms.Select(attrs={'class': 'form-control'}),
+            'iscritto': IscrittoAutocomplete(attrs={'class': 'form-control'}),
             'numero_ricevuta': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Numero ricevuta (opzionale)'}),
             'data_iscrizione': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Se c'è un anno accademico nel form, filtra le edizioni
-        if 'anno_accademico' in self.data or self.instance.pk:
-            try:
-                anno_id = int(self.data.get('anno_accademico', self.instance.anno_accademico_id))
-                self.fields['edizione_corso'].queryset = EdizioneCorso.objects.filter(
-                    anno_accademico_id=anno_id
-                ).select_related('corso')
-            except (ValueError, TypeError):
-                pass
+        # Filtra le edizioni sull'anno accademico del form (dati inviati, iniziale o
+        # dell'iscrizione), con corso, anno e quadrimestre letti nella stessa query per le etichette
+        anno = self.data.get('anno_accademico') or self.initial.get('anno_accademico') or self.instance.anno_accademico_id
+        edizioni = EdizioneCorso.objects.select_related('corso', 'anno_accademico', 'quadrimestre')
+        try:
+            edizioni = edizioni.filter(anno_accademico_id=int(getattr(anno, 'pk', anno)))
+        except (ValueError, TypeError):
+            pass
+        self.fields['edizione_corso'].queryset = edizioni
     
     def clean(self):
         """Validazione iscrizione duplicata"""
@@ -341,7 +383,8 @@ class IscrizioneCorsoForm(forms.ModelForm):
             # Verifica numero massimo partecipanti (se impostato)
             corso = edizione.corso
             if corso.numero_max_partecipanti:
-                num_iscritti = IscrizioneCorso.objects.filter(edizione_corso=edizione).count()
+                # Contatore dell'edizione: la modifica di un'iscrizione esistente non occupa un posto in più
+                num_iscritti = edizione.numero_iscritti - (self.instance.edizione_corso_id == edizione.pk)
                 if num_iscritti >= corso.numero_max_partecipanti:
                     raise ValidationError(
                         f'Il corso ha raggiunto il numero massimo di partecipanti '
@@ -0,0 +1,234 @@
+"""
+UNIGEST - Report in background
+File: core/lavori.py
+Descrizione: Coda su database dei report PDF e degli export pesanti.
+
+Con REPORT_IN_BACKGROUND=True le viste dei report non generano il file durante
+la richiesta: accodano un LavoroReport e rimandano alla pagina del lavoro, che
+ne controlla lo stato e avvia il download a file pronto. Il comando
+worker_report prende i lavori in ordine di arrivo, li esegue con le funzioni di core/reports.py e
+core/esportazioni.py e salva il risultato in MEDIA_ROOT, dove resta fino alla
+scadenza (REPORT_SCADENZA_ORE). Così i pochi worker gunicorn restano liberi.
+I PDF passano dall'archivio di core/archivio_report.py: un report con gli
+stessi dati non viene rigenerato.
+
+La presa in carico è un UPDATE condizionato sullo stato (in_coda -> in_corso),
+quindi più worker possono girare insieme anche senza SELECT ... FOR UPDATE
+SKIP LOCKED, non disponibile su SQLite. Una richiesta uguale a una ancora in
+attesa riusa quel lavoro invece di accodarne un secondo.
+
+Mentre un lavoro è in corso il worker ne aggiorna data_segnale ogni
+INTERVALLO_SEGNALE secondi: torna in coda solo il lavoro senza segnale da
+REPORT_TIMEOUT secondi (worker terminato), non quello che dura semplicemente
+a lungo come il pacchetto di tutte le edizioni di un anno.
+"""
+
+import logging
+import os
+import socket
+import tempfile
+import threading
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from core import archivio_report, esportazioni, reports
+from core.models import AnnoAccademico, EdizioneCorso, LavoroReport
+
+logger = logging.getLogger(__name__)
+
+SCADENZA = timedelta(hours=getattr(settings, 'REPORT_SCADENZA_ORE', 24))
+# Un lavoro in corso senza segnale dal worker da più di così è di un worker morto e torna in coda
+TIMEOUT_ESECUZIONE = timedelta(seconds=getattr(settings, 'REPORT_TIMEOUT', 600))
+# Ogni quanti secondi il worker segnala che il lavoro in corso è ancora vivo
+INTERVALLO_SEGNALE = 30
+MAX_TENTATIVI = 3
+
+
+# ============================================================================
+# TIPI DI REPORT
+# ============================================================================
+
+def _edizione(edizione_id):
+    return EdizioneCorso.objects.select_related(
+        'corso', 'docente', 'anno_accademico', 'quadrimestre'
+    ).get(pk=edizione_id)
+
+
+def _pdf_edizione(genera, prefisso):
+    def esegui(edizione_id):
+        edizione = _edizione(edizione_id)
+        return genera(edizione), f'{prefisso}_{edizione.corso.nome}.pdf'
+    return esegui
+
+
+def _pdf_anno(genera, prefisso):
+    def esegui(anno_id):
+        anno = AnnoAccademico.objects.get(pk=anno_id)
+        return genera(anno), f'{prefisso}_{anno.anno}.pdf'
+    return esegui
+
+
+def _excel_iscritti():
+    file = tempfile.TemporaryFile()
+    esportazioni.scrivi_excel_iscritti(file)
+    return file, 'iscritti.xlsx'
+
+
+def _pacchetto_edizioni(anno_id, quadrimestre=None):
+    from core import pacchetti
+    anno = AnnoAccademico.objects.get(pk=anno_id)
+    file = tempfile.TemporaryFile()
+    # Senza worker il pacchetto si genera nella richiesta web: niente pool di processi
+    pacchetti.scrivi_zip(file, anno_id, quadrimestre, None if settings.REPORT_IN_BACKGROUND else 1)
+    return file, f"report_edizioni_{anno.anno}{f'_Q{quadrimestre}' if quadrimestre is not None else ''}.zip"
+
+
+# tipo -> (descrizione, funzione(**parametri) che restituisce (file, nome del file))
+TIPI = {
+    'foglio_presenze': ('Foglio presenze', _pdf_edizione(reports.foglio_presenze_pdf, 'presenze')),
+    'elenco_iscritti': ('Elenco iscritti', _pdf_edizione(reports.elenco_iscritti_pdf, 'iscritti')),
+    'registro_lezioni': ('Registro lezioni', _pdf_edizione(reports.registro_lezioni_pdf, 'registro')),
+    'elenco_corsi_anno': ('Elenco corsi', _pdf_anno(reports.elenco_corsi_anno_pdf, 'corsi')),
+    'rubrica_contatti': ('Rubrica contatti', _pdf_anno(reports.rubrica_contatti_pdf, 'rubrica')),
+    'iscritti_excel': ('Export iscritti Excel', _excel_iscritti),
+    'pacchetto_edizioni': ('Report di tutte le edizioni', _pacchetto_edizioni),
+}
+
+
+def genera(tipo, **parametri):
+    """(file aperto in binario, nome del file) del report; i PDF passano dall'archivio"""
+    _, funzione = TIPI[tipo]
+    chiave = archivio_report.chiave(tipo, **parametri)
+    if chiave is None:
+        return funzione(**parametri)
+    percorso = archivio_report.ottieni(chiave, lambda: funzione(**parametri))
+    return open(percorso, 'rb'), percorso.name
+
+
+# ============================================================================
+# CODA
+# ============================================================================
+
+def accoda(tipo, descrizione, utente=None, **parametri):
+    """LavoroReport in attesa per tipo e parametri: quello già accodato se c'è, altrimenti uno nuovo"""
+    if tipo not in TIPI:
+        raise ValueError(f"Tipo di report sconosciuto: {tipo}")
+    chiave = ':'.join([tipo] + [f'{nome}={parametri[nome]}' for nome in sorted(parametri)])
+    lavoro = LavoroReport.objects.filter(
+        chiave=chiave, stato__in=[LavoroReport.STATO_IN_CODA, LavoroReport.STATO_IN_CORSO]
+    ).first()
+    if lavoro is None:
+        lavoro = LavoroReport.objects.create(
+            tipo=tipo, parametri=parametri, chiave=chiave,
+            descrizione=f'{TIPI[tipo][0]} - {descrizione}'[:255],
+            richiesto_da=utente if utente is not None and utente.is_authenticated else None,
+        )
+    return lavoro
+
+
+def nome_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def prendi_prossimo(worker):
+    """Prende in carico il lavoro in coda più vecchio; None se la coda è vuota"""
+    while True:
+        lavoro = LavoroReport.objects.filter(
+            stato=LavoroReport.STATO_IN_CODA
+        ).order_by('data_creazione', 'pk').first()
+        if lavoro is None:
+            return None
+        adesso = timezone.now()
+        # Un altro worker può averlo preso tra la SELECT e l'UPDATE: in quel caso si passa al successivo
+        preso = LavoroReport.objects.filter(pk=lavoro.pk, stato=LavoroReport.STATO_IN_CODA).update(
+            stato=LavoroReport.STATO_IN_CORSO, worker=worker, data_inizio=adesso, data_segnale=adesso,
+            tentativi=lavoro.tentativi + 1
+        )
+        if preso:
+            lavoro.stato, lavoro.worker, lavoro.data_inizio = LavoroReport.STATO_IN_CORSO, worker, adesso
+            lavoro.data_segnale = adesso
+            lavoro.tentativi += 1
+            return lavoro
+
+
+def segnala(lavoro):
+    """Aggiorna data_segnale del lavoro, se è ancora in corso presso il suo worker. Restituisce se l'ha aggiornata."""
+    return bool(LavoroReport.objects.filter(
+        pk=lavoro.pk, stato=LavoroReport.STATO_IN_CORSO, worker=lavoro.worker
+    ).update(data_segnale=timezone.now()))
+
+
+def _segnale(lavoro, fine):
+    """Thread del segnale: aggiorna data_segnale ogni INTERVALLO_SEGNALE secondi finché fine non è impostato"""
+    try:
+        while not fine.wait(INTERVALLO_SEGNALE):
+            try:
+                segnala(lavoro)
+            except Exception:
+                logger.exception("Segnale del lavoro %s non registrato", lavoro.pk)
+    finally:
+        # La connessione è propria del thread
+        connection.close()
+
+
+def esegui(lavoro):
+    """Genera il file del lavoro e lo salva in MEDIA_ROOT; in caso di errore lo registra nel lavoro"""
+    fine = threading.Event()
+    segnale = threading.Thread(target=_segnale, args=(lavoro, fine), name=f'segnale-{lavoro.pk}', daemon=True)
+    segnale.start()
+    try:
+        contenuto, nome_file = genera(lavoro.tipo, **lavoro.parametri)
+        with contenuto:
+            contenuto.seek(0)
+            lavoro.file.save(nome_file, File(contenuto), save=False)
+    except Exception:
+        logger.exception("Report %s (lavoro %s) non riuscito", lavoro.tipo, lavoro.pk)
+        lavoro.stato = LavoroReport.STATO_ERRORE
+        lavoro.errore = traceback.format_exc()[-5000:]
+    else:
+        lavoro.stato = LavoroReport.STATO_COMPLETATO
+        lavoro.nome_file = nome_file
+        lavoro.scadenza = timezone.now() + SCADENZA
+    finally:
+        fine.set()
+        segnale.join()
+    lavoro.data_fine = timezone.now()
+    lavoro.save(update_fields=['stato', 'errore', 'file', 'nome_file', 'scadenza', 'data_fine'])
+    return lavoro
+
+
+def recupera_bloccati():
+    """
+    Lavori in corso senza segnale dal worker da oltre TIMEOUT_ESECUZIONE (worker
+    terminato a metà): tornano in coda, o vanno in errore dopo MAX_TENTATIVI.
+    Restituisce quanti.
+    """
+    limite = timezone.now() - TIMEOUT_ESECUZIONE
+    bloccati = LavoroReport.objects.filter(
+        Q(data_segnale__lt=limite) | Q(data_segnale__isnull=True, data_inizio__lt=limite),
+        stato=LavoroReport.STATO_IN_CORSO,
+    )
+    in_errore = bloccati.filter(tentativi__gte=MAX_TENTATIVI).update(
+        stato=LavoroReport.STATO_ERRORE, errore='Interrotto troppe volte', data_fine=timezone.now()
+    )
+    rimessi = bloccati.update(stato=LavoroReport.STATO_IN_CODA, worker='')
+    return in_errore + rimessi
+
+
+def pulisci_scaduti():
+    """Cancella i lavori conclusi e scaduti insieme ai loro file. Restituisce quanti."""
+    adesso = timezone.now()
+    scaduti = LavoroReport.objects.filter(
+        Q(scadenza__lt=adesso) | Q(stato=LavoroReport.STATO_ERRORE, data_fine__lt=adesso - SCADENZA)
+    )
+    totale = 0
+    for lavoro in scaduti.iterator():
+        if lavoro.file:
+            lavoro.file.delete(save=False)
+        lavoro.delete()
+        totale += 1
+    return totale
@@ -0,0 +1,71 @@
+"""
+UNIGEST - Lock tra processi
+File: core/lock.py
+Descrizione: Lock con nome condivisi dai processi della stessa macchina (worker
+gunicorn, worker_report, processi di core/pacchetti.py), usati contro lo
+stampede da core/statistiche.py e core/archivio_report.py.
+
+Ogni lock è un file in LOCK_DIR creato con O_CREAT | O_EXCL: la creazione è
+atomica nel file system, quindi un solo processo la spunta. cache.add non
+basta: con FileBasedCache è has_key + set (due processi possono ottenerlo
+insieme) e LocMemCache vale per un solo processo. Il file contiene un token
+casuale e viene cancellato solo da chi lo ha creato.
+
+Un lock più vecchio della sua durata è di un processo terminato senza
+rilasciarlo e può essere preso da un altro. Questa ripresa non è atomica: due
+processi che la tentano insieme possono ottenere entrambi il lock, al più
+ripetendo una volta lo stesso calcolo.
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+from django.conf import settings
+
+
+def _percorso(nome):
+    return Path(settings.LOCK_DIR) / f"{hashlib.sha256(nome.encode()).hexdigest()[:32]}.lock"
+
+
+def acquisisci(nome, durata):
+    """
+    Prende il lock nome per al più durata secondi. Restituisce il token da
+    passare a rilascia(), o None se il lock è già di un altro processo.
+    """
+    percorso = _percorso(nome)
+    percorso.parent.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex
+    for _ in range(3):
+        try:
+            fd = os.open(percorso, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            try:
+                eta = time.time() - percorso.stat().st_mtime
+            except FileNotFoundError:
+                continue  # Rilasciato proprio ora: si riprova
+            if eta < durata:
+                return None
+            # Lock abbandonato da un processo terminato
+            try:
+                percorso.unlink()
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as file:
+            file.write(token)
+        return token
+    return None
+
+
+def rilascia(nome, token):
+    """Cancella il lock solo se è ancora quello preso con token"""
+    if token is None:
+        return
+    percorso = _percorso(nome)
+    try:
+        if percorso.read_text() == token:
+            percorso.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,47 @@
+"""
+UNIGEST - Aggiorna Statistiche Command
+File: core/management/commands/aggiorna_statistiche.py
+Descrizione: Calcola e salva in StatisticheAnno le statistiche degli anni
+accademici mancanti o superate da una modifica (con --tutte anche quelle già
+aggiornate), così che statistiche_anno, dashboard e confronto tra anni le
+leggano con una sola query. Utile dopo un'importazione o da cron nella notte.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import statistiche
+from core.models import AnnoAccademico
+
+
+class Command(BaseCommand):
+    help = "Precalcola le statistiche degli anni accademici (StatisticheAnno)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anno', help="Solo un anno accademico (es. 2024-2025)")
+        parser.add_argument('--tutte', action='store_true', help="Ricalcola anche le statistiche già aggiornate")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_LABEL('\n--- Statistiche degli anni accademici ---'))
+        anni = AnnoAccademico.objects.select_related('statistiche').order_by('anno')
+        if options['anno']:
+            anni = anni.filter(anno=options['anno'])
+            if not anni:
+                raise CommandError(f"Anno accademico {options['anno']} inesistente")
+
+        inizio = time.perf_counter()
+        ricalcolate = 0
+        for anno in anni:
+            riga = getattr(anno, 'statistiche', None)
+            if riga is not None and riga.aggiornate and not options['tutte']:
+                self.stdout.write(f"  • {anno.anno}: già aggiornate")
+                continue
+            inizio_anno = time.perf_counter()
+            with transaction.atomic():
+                riga = statistiche.snapshot_anno(anno.pk, forza=True)
+            ricalcolate += 1
+            self.stdout.write(
+                f"  • {anno.anno}: {riga.totale_iscritti} iscritti, {riga.totale_edizioni} edizioni, "
+                f"{riga.totale_lezioni} lezioni ({time.perf_counter() - inizio_anno:.2f}s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"  ✓ {ricalcolate} anni ricalcolati in {time.perf_counter() - inizio:.1f}s"))
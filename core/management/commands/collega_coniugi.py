@@ -0,0 +1,107 @@
+"""
+UNIGEST - Collega Coniugi Command
+File: core/management/commands/collega_coniugi.py
+Descrizione: Collega Iscritto.coniuge a partire dalle coppie (Matr, Moglie) del
+vecchio database, risolvendo tutte le matricole da una mappa in memoria e
+scrivendo con un unico bulk_update(['coniuge']) a blocchi.
+Verifica inoltre la simmetria dei collegamenti (A→B ma B→C).
+Usato anche come fase finale della sezione iscritti di import_old_data.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from core.models import Iscritto
+
+
+def collega_coppie(coppie, sovrascrivi=True, batch_size=1000, dry_run=False):
+    """
+    Collega le coppie (matricola, matricola coniuge) con una sola lettura della
+    tabella iscritti e un bulk_update a blocchi di batch_size.
+    Con sovrascrivi=False vengono collegati solo gli iscritti ancora senza coniuge.
+    Restituisce i contatori collegati / gia_collegati / non_trovati.
+    """
+    attuali = dict(Iscritto.objects.values_list('matricola', 'coniuge_id'))
+    esito = {'collegati': 0, 'gia_collegati': 0, 'non_trovati': 0}
+    da_salvare = {}
+    for matricola, matricola_coniuge in coppie:
+        if matricola not in attuali or matricola_coniuge not in attuali:
+            esito['non_trovati'] += 1
+            continue
+        coniuge_attuale = da_salvare.get(matricola, attuali[matricola])
+        if coniuge_attuale == matricola_coniuge or (coniuge_attuale and not sovrascrivi):
+            esito['gia_collegati'] += 1
+            continue
+        da_salvare[matricola] = matricola_coniuge
+
+    esito['collegati'] = len(da_salvare)
+    if da_salvare and not dry_run:
+        with transaction.atomic():
+            Iscritto.objects.bulk_update(
+                [Iscritto(matricola=m1, coniuge_id=m2) for m1, m2 in da_salvare.items()],
+                ['coniuge'], batch_size=batch_size
+            )
+    return esito
+
+
+def verifica_simmetria():
+    """
+    Controlla che i collegamenti siano reciproci. Restituisce tre liste di tuple:
+    incoerenti (A, B, C) con A→B ma B→C, unidirezionali (A, B) con A→B ma B senza
+    coniuge, autoriferiti (A,) con A→A.
+    """
+    coniugi = dict(Iscritto.objects.filter(coniuge__isnull=False).values_list('matricola', 'coniuge_id'))
+    incoerenti, unidirezionali, autoriferiti = [], [], []
+    for a, b in sorted(coniugi.items()):
+        if a == b:
+            autoriferiti.append((a,))
+        elif b not in coniugi:
+            unidirezionali.append((a, b))
+        elif coniugi[b] != a:
+            incoerenti.append((a, b, coniugi[b]))
+    return incoerenti, unidirezionali, autoriferiti
+
+
+class Command(BaseCommand):
+    help = 'Collega i coniugi degli iscritti dal vecchio database e verifica la simmetria dei collegamenti'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Mostra cosa verrebbe collegato senza salvare')
+        parser.add_argument('--sovrascrivi', action='store_true', help='Riallinea anche gli iscritti già collegati a un coniuge diverso')
+        parser.add_argument('--solo-verifica', action='store_true', help='Non legge il vecchio database, esegue solo la verifica di simmetria')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Righe per blocco di bulk_update (default 1000)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('\n' + '='*70))
+        self.stdout.write(self.style.SUCCESS(f"  UNIGEST - COLLEGA CONIUGI{' (DRY RUN)' if options['dry_run'] else ''}"))
+        self.stdout.write(self.style.SUCCESS('='*70))
+
+        if not options['solo_verifica']:
+            with connections['old_database'].cursor() as cursor:
+                cursor.execute("SELECT Matr, Moglie FROM `TAnagrafe` WHERE Moglie IS NOT NULL AND Moglie != 0")
+                coppie = cursor.fetchall()
+            self.stdout.write(f"\n  • Iscritti con coniuge nel vecchio DB: {len(coppie)}")
+
+            esito = collega_coppie(
+                coppie, sovrascrivi=options['sovrascrivi'],
+                batch_size=max(1, options['batch_size']), dry_run=options['dry_run']
+            )
+            self.stdout.write(self.style.SUCCESS(f"  ✓ Coniugi collegati: {esito['collegati']}"))
+            self.stdout.write(f"  • Già collegati: {esito['gia_collegati']}")
+            if esito['non_trovati']:
+                self.stdout.write(self.style.WARNING(f"  ⚠️ Matricole non trovate nel nuovo DB: {esito['non_trovati']}"))
+
+        incoerenti, unidirezionali, autoriferiti = verifica_simmetria()
+        self.stdout.write(self.style.MIGRATE_LABEL('\n--- Verifica simmetria ---'))
+        if not (incoerenti or unidirezionali or autoriferiti):
+            self.stdout.write(self.style.SUCCESS("  ✓ Tutti i collegamenti sono reciproci"))
+        for a, b, c in incoerenti:
+            self.stdout.write(self.style.ERROR(f"  ✗ {a} → {b}, ma {b} → {c}"))
+        for a, b in unidirezionali:
+            self.stdout.write(self.style.WARNING(f"  ⚠️ {a} → {b}, ma {b} non ha coniuge"))
+        for (a,) in autoriferiti:
+            self.stdout.write(self.style.ERROR(f"  ✗ {a} è collegato a se stesso"))
+
+        self.stdout.write('\n' + '='*70)
+        self.stdout.write(f"  📊 Totale con coniuge: {Iscritto.objects.filter(coniuge__isnull=False).count()}")
+        self.stdout.write(f"  Incoerenti: {len(incoerenti)} · Unidirezionali: {len(unidirezionali)} · Autoriferiti: {len(autoriferiti)}")
+        self.stdout.write('='*70 + '\n')
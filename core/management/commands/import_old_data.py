@@ -1,40 +1,307 @@
 """
 UNIGEST - Import Old Data Command
 File: core/management/commands/import_old_data.py
-Descrizione: Script v2.6 - SUPPORTO COMPLETO MYSQL/SQLITE.
+Descrizione: Script v2.7 - SUPPORTO COMPLETO MYSQL/SQLITE.
 Corregge il caricamento delle edizioni e supporta dinamicamente la destinazione SQLite o MySQL.
+Con --bulk le tabelle di lookup vengono precaricate in memoria e i record
+inseriti a blocchi con bulk_create invece di un get_or_create per riga.
+Con --incrementale vengono elaborate solo le righe legacy nuove o modificate
+rispetto all'esecuzione precedente, aggiornando i record già importati.
+L'avanzamento viene registrato per sezione e per blocco in ImportCheckpoint:
+con --resume un'importazione interrotta riprende dall'ultimo blocco consolidato.
+Per ogni sezione vengono misurati tempo, righe lette e scritte, query per
+database ed errori; con --report il riepilogo viene salvato anche in JSON.
+Con --sorgente i dati legacy vengono letti da un file mysqldump o da una
+cartella di CSV invece che dalla connessione old_database.
 """
 
+import hashlib
+import json
 import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
-from django.core.management.base import BaseCommand
-from django.db import connections
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from core.management.commands.collega_coniugi import collega_coppie
+from core.management.sorgente_file import apri_sorgente
+from core import contatori, statistiche
+from core.ricerca import ricostruisci as ricostruisci_indice_ricerca
 from core.models import (
     Comune, TitoloStudio, ProfessioneAttuale, ProfessionePassata,
     Iscritto, Docente, Autorita,
     CategoriaCorso, GruppoCorso, Corso, AnnoAccademico, Quadrimestre,
     EdizioneCorso, IscrizioneAnnoAccademico, IscrizioneCorso,
-    Lezione
+    Lezione, ImportWatermark, ImportRigaLegacy, ImportCheckpoint
 )
 
 logger = logging.getLogger(__name__)
 
+
+def picco_memoria_kb():
+    """
+    Picco di memoria residente (RSS) del processo in KB, None se il modulo
+    resource non è disponibile (es. Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Su macOS ru_maxrss è espresso in byte, su Linux in KB
+    return picco // 1024 if sys.platform == 'darwin' else picco
+
+
+def impronta_riga(row):
+    """Impronta compatta (16 caratteri esadecimali) del contenuto di una riga legacy"""
+    return hashlib.blake2b(repr(tuple(row)).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class MetricheSezione:
+    """
+    Metriche di una sezione dell'importazione: tempo, righe lette dal vecchio DB,
+    righe scritte, errori e query eseguite per database. Le query vengono contate
+    con connection.execute_wrapper, raggruppate anche per testo SQL (parametrizzato)
+    per individuare gli schemi di query più costosi.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.tempo = 0.0
+        self.righe_lette = self.righe_scritte = self.errori = 0
+        self.query = {}
+        self.schemi = {}
+        self.saltata = False
+        self.errore = None
+
+    def wrapper(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            inizio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.registra(alias, sql, time.perf_counter() - inizio)
+        return wrapper
+
+    def registra(self, alias, sql, durata):
+        for chiave, tabella in ((alias, self.query), ((alias, sql), self.schemi)):
+            voce = tabella.setdefault(chiave, [0, 0.0])
+            voce[0] += 1
+            voce[1] += durata
+
+    @property
+    def righe_al_secondo(self):
+        return round(self.righe_lette / self.tempo, 1) if self.tempo else 0.0
+
+    def to_dict(self, memoria=None, schemi=5):
+        principali = sorted(self.schemi.items(), key=lambda voce: voce[1][1], reverse=True)[:schemi]
+        return {
+            'nome': self.nome,
+            'saltata': self.saltata,
+            'tempo_s': round(self.tempo, 3),
+            'righe_lette': self.righe_lette,
+            'righe_scritte': self.righe_scritte,
+            'righe_al_secondo': self.righe_al_secondo,
+            'errori': self.errori,
+            'errore_critico': self.errore,
+            'query': {alias: numero for alias, (numero, _) in self.query.items()},
+            'tempo_query_s': {alias: round(durata, 3) for alias, (_, durata) in self.query.items()},
+            'query_principali': [
+                {'database': alias, 'sql': sql[:300], 'numero': numero, 'tempo_s': round(durata, 3)}
+                for (alias, sql), (numero, durata) in principali
+            ],
+            'memoria_picco_mb': round(memoria[0] / 1024, 1) if memoria else None,
+        }
+
+
+class BulkBuffer:
+    """
+    Accumula istanze non salvate e le scrive con bulk_create a blocchi di
+    batch_size, ognuno nella propria transazione.
+    Le righe vengono conteggiate in stats[key] solo a scrittura avvenuta: se un
+    blocco fallisce viene ripetuto riga per riga e le righe rifiutate finiscono
+    in stats['errori'], come succede con il get_or_create riga per riga.
+
+    Con update_fields il buffer aggiorna invece di ignorare i record esistenti:
+    insieme a unique_fields esegue un upsert (bulk_create con update_conflicts),
+    da solo un bulk_update per chiave primaria.
+    """
+
+    def __init__(self, command, model, key, ignore_conflicts=True, update_fields=None, unique_fields=None):
+        self.command = command
+        self.model = model
+        self.key = key
+        self.ignore_conflicts = ignore_conflicts
+        self.update_fields = update_fields
+        self.unique_fields = unique_fields
+        self.buffer = []
+        # I buffer della sezione vengono svuotati a ogni checkpoint (vedi Command.consolida)
+        buffers = getattr(command._locale, 'buffers', None)
+        if buffers is not None:
+            buffers.append(self)
+
+    def add(self, obj):
+        # Riga legacy da cui nasce l'oggetto, per scartarne l'impronta se la scrittura fallisce
+        delta = getattr(self.command._locale, 'delta', None)
+        self.buffer.append((obj, delta, delta.chiave_corrente if delta else None))
+        if len(self.buffer) >= self.command.batch_size:
+            self.flush()
+
+    def write(self, objs):
+        if self.update_fields and self.unique_fields:
+            self.model.objects.bulk_create(objs, update_conflicts=True, unique_fields=self.unique_fields, update_fields=self.update_fields)
+        elif self.update_fields:
+            self.model.objects.bulk_update(objs, self.update_fields)
+        else:
+            self.model.objects.bulk_create(objs, ignore_conflicts=self.ignore_conflicts)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        blocco, self.buffer = self.buffer, []
+        try:
+            with transaction.atomic():
+                self.write([obj for obj, _, _ in blocco])
+            self.command.stats[self.key] += len(blocco)
+        except Exception as e:
+            self.command.log(f"Blocco {self.model.__name__} rifiutato ({e}), ripeto riga per riga", 'warning')
+            for obj, delta, chiave in blocco:
+                try:
+                    with transaction.atomic():
+                        self.write([obj])
+                    self.command.stats[self.key] += 1
+                except Exception:
+                    self.command.stats['errori'] += 1
+                    if delta: delta.scarta(chiave)
+
+
+class DeltaTabella:
+    """
+    Stato incrementale di una tabella legacy: impronte delle righe già importate
+    (ImportRigaLegacy) e watermark della tabella (ImportWatermark).
+    Su MySQL, se CHECKSUM TABLE non è cambiato dall'ultima esecuzione la tabella
+    non viene nemmeno riletta. Le righe cancellate nel vecchio DB non vengono propagate.
+    """
+
+    def __init__(self, tabella, checksum):
+        self.tabella = tabella
+        self.checksum = checksum
+        self.watermark = ImportWatermark.objects.filter(tabella=tabella).first()
+        self.invariata = bool(checksum and self.watermark and self.watermark.checksum == checksum)
+        self.impronte = {} if self.invariata else dict(
+            ImportRigaLegacy.objects.filter(tabella=tabella).values_list('chiave', 'impronta')
+        )
+        self.elaborate = {}
+        self.chiave_corrente = None
+        self.saltata = False
+        self.chiave_max = self.watermark.chiave_max if self.watermark else ''
+        self.righe = self.watermark.righe if self.invariata else 0
+        self.nuove = self.modificate = self.scartate = 0
+        # Righe saltate con --resume perché già consolidate dall'esecuzione interrotta
+        self.riprese = 0
+
+    def filtra(self, command, rows, chiave):
+        """Restituisce solo le righe nuove o modificate, registrandone l'impronta"""
+        for row in rows:
+            self.righe += 1
+            valore = chiave(row)
+            k = '|'.join(map(str, valore)) if isinstance(valore, tuple) else str(valore)
+            if isinstance(valore, int) and (not self.chiave_max.isdigit() or valore > int(self.chiave_max)):
+                self.chiave_max = str(valore)
+            impronta = impronta_riga(row)
+            precedente = self.impronte.get(k)
+            if precedente == impronta:
+                continue
+            errori = command.stats['errori']
+            self.chiave_corrente = k
+            self.saltata = False
+            yield row
+            if command.stats['errori'] == errori and not self.saltata:
+                self.elaborate[k] = (impronta, precedente is None)
+                if precedente is None: self.nuove += 1
+                else: self.modificate += 1
+            else:
+                self.scartate += 1
+
+    def salta(self):
+        """
+        Riga corrente non importata perché mancano i record collegati (anno,
+        iscritto, edizione): nessuna impronta, verrà rielaborata alla prossima esecuzione
+        """
+        self.saltata = True
+
+    def scarta(self, chiave):
+        """Riga rifiutata in fase di scrittura: verrà rielaborata alla prossima esecuzione"""
+        elaborata = self.elaborate.pop(chiave, None)
+        if elaborata is not None:
+            if elaborata[1]: self.nuove -= 1
+            else: self.modificate -= 1
+            self.scartate += 1
+
+    def salva_impronte(self, batch_size):
+        """Registra le impronte delle righe elaborate finora (anche a ogni checkpoint)"""
+        impronte = [ImportRigaLegacy(tabella=self.tabella, chiave=k, impronta=v[0]) for k, v in self.elaborate.items()]
+        self.elaborate = {}
+        with transaction.atomic():
+            for i in range(0, len(impronte), batch_size):
+                ImportRigaLegacy.objects.bulk_create(
+                    impronte[i:i + batch_size], update_conflicts=True,
+                    unique_fields=['tabella', 'chiave'], update_fields=['impronta']
+                )
+
+    def salva(self, batch_size):
+        self.salva_impronte(batch_size)
+        # Il checksum si salva solo se tutte le righe sono andate a buon fine in
+        # questa esecuzione, altrimenti la prossima salterebbe le righe scartate
+        ImportWatermark.objects.update_or_create(tabella=self.tabella, defaults={
+            'checksum': self.checksum if not (self.scartate or self.riprese) else '',
+            'chiave_max': self.chiave_max, 'righe': self.righe + self.riprese,
+            'nuove': self.nuove, 'modificate': self.modificate,
+        })
+
+
 class Command(BaseCommand):
     help = 'Importa i dati dal vecchio database MySQL UNIPIEVE'
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true', help='Simula l\'importazione')
         parser.add_argument('--verbose', action='store_true', help='Dettagli aggiuntivi')
+        parser.add_argument('--bulk', action='store_true', help='Precarica le lookup e inserisce con bulk_create')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Righe per transazione, blocco di bulk_create e checkpoint (default 1000)')
+        parser.add_argument('--fetch-size', type=int, default=2000, help='Righe lette per fetchmany dal vecchio database (default 2000)')
+        parser.add_argument('--jobs', type=int, default=1, help='Sezioni indipendenti eseguite in parallelo (default 1, sequenziale)')
+        parser.add_argument('--incrementale', action='store_true', help='Elabora solo le righe legacy nuove o modificate dall\'ultima esecuzione')
+        parser.add_argument('--resume', action='store_true', help='Riprende un\'importazione interrotta dall\'ultimo checkpoint')
+        parser.add_argument('--report', metavar='PATH', help='Salva le metriche per sezione in un file JSON')
+        parser.add_argument('--sorgente', metavar='PATH', help='File mysqldump (.sql, .sql.gz) o cartella di CSV da leggere al posto di old_database')
+        parser.add_argument('--encoding', default='utf-8', help='Codifica della sorgente su file (default utf-8)')
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.stats = {
+        self.stats_totali = {
             'comuni': 0, 'titoli': 0, 'prof_att': 0, 'prof_pass': 0,
             'iscritti': 0, 'docenti': 0, 'autorita': 0,
             'categorie': 0, 'gruppi': 0, 'corsi': 0,
             'anni': 0, 'edizioni': 0, 'isc_anno': 0, 'isc_corso': 0,
             'lezioni': 0, 'errori': 0
         }
+        # Picco RSS (KB) rilevato alla fine di ogni sezione e crescita durante la sezione
+        self.memoria = {}
+        # Con --jobs > 1 ogni thread accumula le statistiche della propria sezione in
+        # self._locale.stats; vengono sommate a stats_totali sotto lock a fine sezione
+        self._locale = threading.local()
+        self._stats_lock = threading.Lock()
+        # Con --incrementale: stato delle tabelle legacy elaborate (per il riepilogo)
+        self.delte = {}
+        # Metriche per sezione (MetricheSezione), nell'ordine di completamento
+        self.metriche = {}
+
+    @property
+    def stats(self):
+        return getattr(self._locale, 'stats', self.stats_totali)
 
     def log(self, msg, level='info'):
         if level == 'error': self.stdout.write(self.style.ERROR(f"  ✗ {msg}"))
@@ -46,9 +313,18 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.dry_run = options['dry_run']
         self.verbose = options['verbose']
+        self.bulk = options['bulk']
+        self.batch_size = max(1, options['batch_size'])
+        self.fetch_size = max(1, options['fetch_size'])
+        self.jobs = max(1, options['jobs'])
+        self.incrementale = options['incrementale']
+        self.resume = options['resume']
+        self.report = options['report']
+        self.sorgente = apri_sorgente(options['sorgente'], options['encoding']) if options['sorgente'] else None
+        inizio = timezone.now()
 
         self.stdout.write(self.style.SUCCESS('\n' + '='*70))
-        self.stdout.write(self.style.SUCCESS(f"  UNIGEST - IMPORTAZIONE DATI (v2.6{' - DRY RUN' if self.dry_run else ''})"))
+        self.stdout.write(self.style.SUCCESS(f"  UNIGEST - IMPORTAZIONE DATI (v2.7{' - BULK' if self.bulk else ''}{' - INCREMENTALE' if self.incrementale else ''}{' - DRY RUN' if self.dry_run else ''})"))
         self.stdout.write(self.style.SUCCESS('='*70 + '\n'))
 
         # Cache oggetti per velocizzare e gestire dry-run
@@ -74,87 +350,446 @@ class Command(BaseCommand):
             self.cache['docente_generico'] = MagicMock(spec=Docente, id=99999, nome='DOCENTE GENERICO')
             self.cache['corso_generico'] = MagicMock(spec=Corso, codice=0, nome='CORSO GENERICO')
 
+        if not self.dry_run and not self.resume:
+            # Nuova importazione: i checkpoint dell'esecuzione precedente non servono più
+            ImportCheckpoint.objects.all().delete()
+
+        if self.bulk and not self.dry_run:
+            self.preload_lookup()
+
+        # (nome sezione, funzione, sezioni da cui dipende). L'ordine della lista è
+        # già topologico ed è quello usato in modalità sequenziale.
+        # Lo staff dipende dal supporto perché Docente.comune punta ai comuni importati lì.
         tasks = [
-            ('Tabelle Supporto', self.import_supporto),
-            ('Staff Docente', self.import_staff),
-            ('Anagrafica Iscritti', self.import_iscritti),
-            ('Catalogo Corsi', self.import_catalogo),
-            ('Anni Accademici', self.import_periodi),
-            ('Edizioni Annuali', self.import_edizioni),
-            ('Iscrizioni', self.import_iscrizioni),
-            ('Registro Lezioni', self.import_lezioni),
+            ('Tabelle Supporto', self.import_supporto, []),
+            ('Staff Docente', self.import_staff, ['Tabelle Supporto']),
+            ('Anagrafica Iscritti', self.import_iscritti, ['Tabelle Supporto']),
+            ('Catalogo Corsi', self.import_catalogo, []),
+            ('Anni Accademici', self.import_periodi, []),
+            ('Edizioni Annuali', self.import_edizioni, ['Staff Docente', 'Catalogo Corsi', 'Anni Accademici']),
+            ('Iscrizioni Anno', self.import_iscrizioni_anno, ['Anagrafica Iscritti', 'Anni Accademici']),
+            ('Iscrizioni Corsi', self.import_iscrizioni_corso, ['Anagrafica Iscritti', 'Edizioni Annuali']),
+            ('Registro Lezioni', self.import_lezioni, ['Edizioni Annuali']),
         ]
 
-        for section_name, task_func in tasks:
-            self.stdout.write(self.style.MIGRATE_LABEL(f'\n--- {section_name} ---'))
-            try:
-                task_func()
-            except Exception as e:
-                self.log(f"Errore critico in {section_name}: {e}", 'error')
-                if self.verbose:
-                    import traceback
-                    traceback.print_exc()
+        if self.jobs > 1 and connections['default'].vendor == 'sqlite' and not self.dry_run:
+            # Con le transazioni a blocchi due sezioni concorrenti si contenderebbero
+            # l'unico lock di scrittura di SQLite ("database is locked")
+            self.log("SQLite ammette un solo scrittore: con le transazioni a blocchi le sezioni vengono eseguite in sequenza", 'warning')
+            self.jobs = 1
+
+        if self.jobs > 1:
+            self.run_parallel(tasks)
+        else:
+            for section_name, task_func, _ in tasks:
+                self.run_section(section_name, task_func)
+
+        # Le scritture a blocchi non emettono segnali: statistiche in cache, contatori delle edizioni
+        # e indice di ricerca vanno aggiornati qui
+        if not self.dry_run:
+            statistiche.invalida_tutto()
+            with transaction.atomic():
+                contatori.ricalcola()
+                ricostruisci_indice_ricerca(batch_size=self.batch_size)
 
         self.print_summary()
+        if self.report:
+            self.write_report(inizio, options)
+
+    def run_section(self, section_name, task_func):
+        self.stdout.write(self.style.MIGRATE_LABEL(f'\n--- {section_name} ---'))
+        metriche = self.metriche[section_name] = MetricheSezione(section_name)
+        checkpoint = None
+        if not self.dry_run:
+            checkpoint, _ = ImportCheckpoint.objects.get_or_create(sezione=section_name, tabella='')
+            if checkpoint.completato:
+                self.log(f"{section_name} già completata nell'esecuzione interrotta, saltata", 'important')
+                metriche.saltata = True
+                return
+        memoria_prima = picco_memoria_kb()
+        stats_prima = dict(self.stats)
+        self._locale.sezione = section_name
+        self._locale.delte = []
+        self._locale.delta = None
+        self._locale.buffers = []
+        self._locale.metriche = metriche
+        inizio = time.perf_counter()
+        # Le connessioni sono per thread: i wrapper contano solo le query di questa sezione
+        try:
+            with connections['default'].execute_wrapper(metriche.wrapper('default')), \
+                    connections['old_database'].execute_wrapper(metriche.wrapper('old_database')):
+                task_func()
+                # Watermark e checksum si salvano solo a sezione conclusa, dopo l'ultimo flush dei buffer
+                if not self.dry_run:
+                    for delta in self._locale.delte:
+                        delta.salva(self.batch_size)
+                    checkpoint.completato = True
+                    checkpoint.save()
+        except Exception as e:
+            metriche.errore = str(e)
+            self.log(f"Errore critico in {section_name}: {e}", 'error')
+            if self.verbose:
+                import traceback
+                traceback.print_exc()
+        finally:
+            metriche.tempo = time.perf_counter() - inizio
+            metriche.errori = self.stats['errori'] - stats_prima['errori']
+            metriche.righe_scritte = sum(
+                self.stats[key] - stats_prima[key] for key in self.stats if key != 'errori'
+            )
+            self._locale.metriche = None
+            memoria_dopo = picco_memoria_kb()
+            if memoria_dopo is not None:
+                self.memoria[section_name] = (memoria_dopo, memoria_dopo - memoria_prima)
+
+    def run_parallel(self, tasks):
+        """
+        Esegue le sezioni in un pool di --jobs thread, avviando ogni sezione appena
+        le sue dipendenze sono terminate. Il picco RSS per sezione è in questo caso
+        indicativo, perché le sezioni concorrenti condividono il processo.
+        """
+        nomi = {name for name, _, _ in tasks}
+        for name, _, deps in tasks:
+            if not set(deps) <= nomi:
+                raise CommandError(f"Dipendenze sconosciute per {name}: {set(deps) - nomi}")
+
+        pending = {name: (func, set(deps)) for name, func, deps in tasks}
+        done = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='import') as pool:
+            while pending or running:
+                pronte = [name for name, (_, deps) in pending.items() if deps <= done]
+                for name in pronte:
+                    func, _ = pending.pop(name)
+                    running[pool.submit(self.run_section_worker, name, func)] = name
+                if not running:
+                    raise CommandError(f"Dipendenze circolari tra: {', '.join(pending)}")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done.add(running.pop(future))
+                    future.result()
+
+    def run_section_worker(self, section_name, task_func):
+        """
+        Corpo di un thread del pool: statistiche locali alla sezione e connessioni
+        Django proprie del thread (thread-local), chiuse a fine sezione.
+        """
+        self._locale.stats = dict.fromkeys(self.stats_totali, 0)
+        try:
+            self.run_section(section_name, task_func)
+            self.log(f"{section_name} completata", 'success')
+        finally:
+            with self._stats_lock:
+                for key, value in self._locale.stats.items():
+                    self.stats_totali[key] += value
+            del self._locale.stats
+            connections.close_all()
+
+    def stream(self, sql, tabella=None, saltate=None):
+        """
+        Come leggi(), ma le righe vengono elaborate in transazioni di batch_size
+        righe (vedi blocchi()). Se è indicata la tabella, a fine blocco vengono
+        svuotati i buffer della sezione e registrato in ImportCheckpoint il numero
+        di righe consolidate. Con --resume le righe già consolidate vengono saltate
+        senza elaborarle (saltate(row), se indicata, le riceve comunque). Se la riga
+        del checkpoint non corrisponde più, la tabella legacy è cambiata e la
+        lettura riparte da capo: le sezioni sono idempotenti.
+        """
+        if self.dry_run:
+            yield from self.leggi(sql)
+            return
+        checkpoint, da_saltare = None, 0
+        if tabella:
+            checkpoint, _ = ImportCheckpoint.objects.get_or_create(sezione=self._locale.sezione, tabella=tabella)
+            if checkpoint.completato and saltate is None:
+                self.log(f"{tabella}: già completata, saltata", 'important')
+                return
+            da_saltare = checkpoint.righe
+            if da_saltare:
+                self.log(f"{tabella}: ripresa dopo {da_saltare} righe già consolidate", 'important')
+        while True:
+            righe, ultima, rows = 0, None, self.leggi(sql)
+            if da_saltare:
+                for row in rows:
+                    righe += 1
+                    ultima = row
+                    if saltate: saltate(row)
+                    if righe == da_saltare:
+                        break
+                if righe < da_saltare or impronta_riga(ultima) != checkpoint.impronta:
+                    rows.close()
+                    self.log(f"{tabella}: il vecchio database è cambiato dopo il checkpoint, rilettura da capo", 'warning')
+                    da_saltare = 0
+                    continue
+                if self._locale.delta: self._locale.delta.riprese = da_saltare
+            yield from self.blocchi(rows, checkpoint, righe, ultima)
+            return
+
+    def blocchi(self, rows, checkpoint, righe=0, ultima=None):
+        """
+        Elabora le righe in transazioni di batch_size righe invece che in autocommit
+        (su SQLite ogni commit è un fsync). In modalità riga per riga ogni riga ha
+        il proprio savepoint: se la sezione la conta in stats['errori'] le sue
+        scritture vengono annullate senza perdere il resto del blocco.
+        Il checkpoint del blocco viene salvato nella stessa transazione.
+        """
+        finite = False
+        while not finite:
+            with transaction.atomic():
+                for _ in range(self.batch_size):
+                    row = next(rows, None)
+                    if row is None:
+                        finite = True
+                        break
+                    righe += 1
+                    ultima = row
+                    if self.bulk:
+                        # I blocchi di BulkBuffer hanno già il proprio savepoint
+                        yield row
+                        continue
+                    errori = self.stats['errori']
+                    with transaction.atomic():
+                        yield row
+                        if self.stats['errori'] > errori:
+                            transaction.set_rollback(True)
+                if checkpoint:
+                    self.consolida(checkpoint, righe, ultima, completato=finite)
+
+    def consolida(self, checkpoint, righe, ultima, completato=False):
+        """Svuota i buffer della sezione e registra il checkpoint dopo `righe` righe"""
+        for buf in self._locale.buffers:
+            buf.flush()
+        if self._locale.delta:
+            self._locale.delta.salva_impronte(self.batch_size)
+        checkpoint.righe = righe
+        checkpoint.impronta = impronta_riga(ultima) if ultima is not None else ''
+        checkpoint.completato = completato
+        checkpoint.save()
+
+    def leggi(self, sql):
+        """
+        Legge le righe dal vecchio database a blocchi di fetch_size invece di
+        caricare l'intera tabella con fetchall().
+        Su MySQL usa un cursore lato server (SSCursor), così anche il driver non
+        bufferizza il result set: la memoria resta costante al crescere della tabella.
+        Il generatore va consumato prima di eseguire un'altra query su old_database.
+        Con --sorgente la stessa query viene eseguita sul file (vedi sorgente_file).
+        """
+        if self.sorgente:
+            yield from self.leggi_file(sql)
+            return
+        conn = connections['old_database']
+        if conn.vendor == 'mysql':
+            import MySQLdb.cursors
+            conn.ensure_connection()
+            cursor = conn.connection.cursor(MySQLdb.cursors.SSCursor)
+        else:
+            cursor = conn.cursor()
+        metriche = getattr(self._locale, 'metriche', None)
+        try:
+            inizio = time.perf_counter()
+            cursor.execute(sql)
+            if metriche and conn.vendor == 'mysql':
+                # Il cursore nativo non passa dagli execute_wrapper di Django
+                metriche.registra('old_database', sql, time.perf_counter() - inizio)
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                if metriche: metriche.righe_lette += len(rows)
+                yield from rows
+        finally:
+            cursor.close()
+
+    def leggi_file(self, sql):
+        metriche = getattr(self._locale, 'metriche', None)
+        if metriche:
+            metriche.registra('sorgente', sql, 0.0)
+        for row in self.sorgente.esegui(sql):
+            if metriche: metriche.righe_lette += 1
+            yield row
+
+    def stream_delta(self, tabella, sql, chiave, saltate=None):
+        """
+        Come stream(), ma con --incrementale restituisce solo le righe nuove o
+        modificate di `tabella` (chiave(row) identifica la riga legacy).
+        """
+        if not self.incrementale:
+            yield from self.stream(sql, tabella, saltate)
+            return
+        delta = DeltaTabella(tabella, self.checksum_legacy(tabella.split('.')[0]))
+        self.delte[tabella] = delta
+        self._locale.delte.append(delta)
+        if delta.invariata:
+            return
+        self._locale.delta = delta
+        try:
+            yield from delta.filtra(self, self.stream(sql, tabella, saltate), chiave)
+        finally:
+            self._locale.delta = None
+
+    def checksum_legacy(self, tabella):
+        """CHECKSUM TABLE della tabella legacy (solo MySQL, altrimenti stringa vuota)"""
+        conn = connections['old_database']
+        if self.sorgente or conn.vendor != 'mysql':
+            return ''
+        with conn.cursor() as cursor:
+            cursor.execute(f"CHECKSUM TABLE `{tabella}`")
+            row = cursor.fetchone()
+        return str(row[1]) if row and row[1] is not None else ''
+
+    def salta_riga(self):
+        """La sezione non ha importato la riga corrente: con --incrementale non se ne registra l'impronta"""
+        delta = getattr(self._locale, 'delta', None)
+        if delta: delta.salta()
+
+    def scrivi(self, model, defaults=None, **lookup):
+        """get_or_create, oppure update_or_create con --incrementale (le righe modificate aggiornano il record)"""
+        if self.incrementale:
+            return model.objects.update_or_create(defaults=defaults, **lookup)
+        return model.objects.get_or_create(defaults=defaults, **lookup)
+
+    def aggiorna(self, update_fields, unique_fields=None):
+        """Parametri di aggiornamento per BulkBuffer, attivi solo con --incrementale"""
+        if not self.incrementale:
+            return {}
+        return {'update_fields': update_fields, 'unique_fields': unique_fields}
+
+    def preload_lookup(self):
+        """
+        Modalità --bulk: carica una sola volta le mappe di lookup usate dalle sezioni
+        al posto delle SELECT per riga. Le mappe vengono aggiornate man mano che le
+        sezioni inseriscono nuovi record.
+        """
+        self.lookup = {
+            'titoli': dict(TitoloStudio.objects.values_list('descrizione', 'id')),
+            'prof_att': dict(ProfessioneAttuale.objects.values_list('descrizione', 'id')),
+            'prof_pass': dict(ProfessionePassata.objects.values_list('descrizione', 'id')),
+            'iscritti': set(Iscritto.objects.values_list('matricola', flat=True)),
+            'docenti': set(Docente.objects.values_list('id', flat=True)),
+            'corsi': dict(Corso.objects.values_list('codice', 'id')),
+            'anni': {},
+            'edizioni': {},
+            'edizioni_per_corso': {},
+        }
+        self.refresh_lookup_anni()
+        self.refresh_lookup_edizioni()
+
+    def refresh_lookup_anni(self):
+        self.lookup['anni'] = {a.anno: a for a in AnnoAccademico.objects.only('id', 'anno', 'data_inizio')}
+
+    def refresh_lookup_edizioni(self):
+        """
+        Mappe id -> docente e (anno, codice corso) -> edizione.
+        L'ordinamento replica quello del .first() usato in modalità riga per riga.
+        """
+        self.lookup['edizioni'] = dict(EdizioneCorso.objects.values_list('id', 'docente_id'))
+        per_corso = {}
+        for anno_id, codice, ediz_id in EdizioneCorso.objects.order_by(
+            'anno_accademico_id', 'corso__codice', 'quadrimestre__numero', 'corso__nome', 'id'
+        ).values_list('anno_accademico_id', 'corso__codice', 'id'):
+            per_corso.setdefault((anno_id, codice), ediz_id)
+        self.lookup['edizioni_per_corso'] = per_corso
 
     def import_supporto(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT DISTINCT Paese FROM `TAnagrafe` WHERE Paese IS NOT NULL AND Paese != ''")
-        for row in cursor.fetchall():
-            if not self.dry_run: Comune.objects.get_or_create(id=row[0], defaults={'nome': f"Comune_{row[0]}"})
-            self.stats['comuni'] += 1
-
-        cursor.execute("SELECT TitoloStudio FROM `TTitoloStudio`")
-        for row in cursor.fetchall():
-            if row[0] and not self.dry_run: TitoloStudio.objects.get_or_create(descrizione=row[0])
-            self.stats['titoli'] += 1
-
-        for table, key, model in [('TProfAtt', 'prof_att', ProfessioneAttuale), ('TProfPass', 'prof_pass', ProfessionePassata)]:
-            cursor.execute(f"SELECT * FROM `{table}`")
-            for row in cursor.fetchall():
-                if row[0] and not self.dry_run: model.objects.get_or_create(descrizione=row[0])
-                self.stats[key] += 1
+        bulk = self.bulk and not self.dry_run
+
+        buf = BulkBuffer(self, Comune, 'comuni') if bulk else None
+        for row in self.stream_delta('TAnagrafe.Paese', "SELECT DISTINCT Paese FROM `TAnagrafe` WHERE Paese IS NOT NULL AND Paese != ''", lambda r: r[0]):
+            if bulk: buf.add(Comune(id=row[0], nome=f"Comune_{row[0]}"))
+            else:
+                if not self.dry_run: Comune.objects.get_or_create(id=row[0], defaults={'nome': f"Comune_{row[0]}"})
+                self.stats['comuni'] += 1
+        if bulk: buf.flush()
+
+        for table, key, model in [('TTitoloStudio', 'titoli', TitoloStudio), ('TProfAtt', 'prof_att', ProfessioneAttuale), ('TProfPass', 'prof_pass', ProfessionePassata)]:
+            buf = BulkBuffer(self, model, key) if bulk else None
+            for row in self.stream_delta(table, "SELECT TitoloStudio FROM `TTitoloStudio`" if key == 'titoli' else f"SELECT * FROM `{table}`", lambda r: r[0]):
+                if bulk and row[0]: buf.add(model(descrizione=row[0]))
+                else:
+                    if row[0] and not self.dry_run: model.objects.get_or_create(descrizione=row[0])
+                    self.stats[key] += 1
+            if bulk:
+                buf.flush()
+                self.lookup[key] = dict(model.objects.values_list('descrizione', 'id'))
 
     def import_staff(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TDocenti`")
-        for row in cursor.fetchall():
+        bulk = self.bulk and not self.dry_run
+
+        # L'upsert non passa da save(): data_modifica, che entra nell'impronta dei PDF
+        # archiviati (core/archivio_report.py), va aggiornata esplicitamente
+        campi = ['titolo', 'nome', 'telefono', 'cellulare', 'indirizzo', 'comune', 'email', 'attivo', 'data_modifica']
+        buf = BulkBuffer(self, Docente, 'docenti', **self.aggiorna(campi, ['id'])) if bulk else None
+        for row in self.stream_delta('TDocenti', "SELECT * FROM `TDocenti`", lambda r: r[0]):
             try:
+                defaults = {
+                    'titolo': row[1] or '', 'nome': row[2] or 'Sconosciuto',
+                    'telefono': row[3] or '', 'cellulare': row[4] or '',
+                    'indirizzo': row[5] or '', 'comune_id': row[6] if row[6] != 0 else None,
+                    'email': row[8] or '', 'attivo': True
+                }
+                if bulk and row[0] != 0:
+                    buf.add(Docente(id=row[0], data_modifica=timezone.now(), **defaults))
+                    continue
                 if not self.dry_run and row[0] != 0:
-                    Docente.objects.get_or_create(id=row[0], defaults={
-                        'titolo': row[1] or '', 'nome': row[2] or 'Sconosciuto',
-                        'telefono': row[3] or '', 'cellulare': row[4] or '',
-                        'indirizzo': row[5] or '', 'comune_id': row[6] if row[6] != 0 else None,
-                        'email': row[8] or '', 'attivo': True
-                    })
+                    self.scrivi(Docente, id=row[0], defaults=defaults)
                 self.stats['docenti'] += 1
             except: self.stats['errori'] += 1
+        if bulk:
+            buf.flush()
+            self.lookup['docenti'] = set(Docente.objects.values_list('id', flat=True))
 
-        cursor.execute("SELECT * FROM `TAutorita`")
-        for row in cursor.fetchall():
+        campi = ['titolo', 'nome', 'carica', 'email', 'attivo']
+        buf = BulkBuffer(self, Autorita, 'autorita', **self.aggiorna(campi, ['id'])) if bulk else None
+        for row in self.stream_delta('TAutorita', "SELECT * FROM `TAutorita`", lambda r: r[0]):
             try:
+                defaults = {
+                    'titolo': row[1] or '', 'nome': row[2] or 'Sconosciuto',
+                    'carica': row[3] or '', 'email': row[8] or '', 'attivo': True
+                }
+                if bulk:
+                    buf.add(Autorita(id=row[0], **defaults))
+                    continue
                 if not self.dry_run:
-                    Autorita.objects.get_or_create(id=row[0], defaults={
-                        'titolo': row[1] or '', 'nome': row[2] or 'Sconosciuto',
-                        'carica': row[3] or '', 'email': row[8] or '', 'attivo': True
-                    })
+                    self.scrivi(Autorita, id=row[0], defaults=defaults)
                 self.stats['autorita'] += 1
             except: self.stats['errori'] += 1
+        if bulk: buf.flush()
 
     def import_iscritti(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TAnagrafe`")
-        rows = cursor.fetchall()
-        for row in rows:
+        bulk = self.bulk and not self.dry_run
+        # Delle righe lette si tengono solo le coppie (matricola, coniuge) per il
+        # collegamento finale: il resto della tabella non resta in memoria
+        coppie_coniugi = []
+
+        def coppia(row):
+            if row[4] and row[4] != 0: coppie_coniugi.append((row[0], row[4]))
+
+        # In bulk le matricole già presenti vengono scartate prima dell'insert, così
+        # ignore_conflicts=False fa emergere come errori i CF duplicati (come get_or_create)
+        buf = BulkBuffer(self, Iscritto, 'iscritti', ignore_conflicts=False) if bulk else None
+        # Con --incrementale le matricole esistenti modificate si aggiornano per chiave primaria
+        campi = ['sesso', 'titolo', 'nominativo', 'indirizzo', 'comune', 'telefono', 'cellulare',
+                 'luogo_nascita', 'data_nascita', 'codice_fiscale', 'email', 'ha_whatsapp', 'riceve_posta',
+                 'e_pensionato', 'titolo_studio', 'professione_attuale', 'professione_passata', 'data_modifica']
+        buf_agg = BulkBuffer(self, Iscritto, 'iscritti', **self.aggiorna(campi)) if bulk and self.incrementale else None
+        # Anche le righe saltate con --resume forniscono le coppie per il collegamento finale
+        for row in self.stream_delta('TAnagrafe', "SELECT * FROM `TAnagrafe`", lambda r: r[0], saltate=coppia):
+            coppia(row)
             try:
                 if not self.dry_run:
                     cf = str(row[18]) if len(row) > 18 and row[18] else None
                     if cf and len(cf) < 10: cf = None
-                    ts = TitoloStudio.objects.filter(descrizione=row[11]).first() if row[11] else None
-                    pa = ProfessioneAttuale.objects.filter(descrizione=row[12]).first() if row[12] else None
-                    pp = ProfessionePassata.objects.filter(descrizione=row[13]).first() if row[13] else None
+                    if bulk:
+                        ts = self.lookup['titoli'].get(row[11]) if row[11] else None
+                        pa = self.lookup['prof_att'].get(row[12]) if row[12] else None
+                        pp = self.lookup['prof_pass'].get(row[13]) if row[13] else None
+                    else:
+                        ts = TitoloStudio.objects.filter(descrizione=row[11]).first() if row[11] else None
+                        pa = ProfessioneAttuale.objects.filter(descrizione=row[12]).first() if row[12] else None
+                        pp = ProfessionePassata.objects.filter(descrizione=row[13]).first() if row[13] else None
 
-                    Iscritto.objects.get_or_create(matricola=row[0], defaults={
+                    defaults = {
                         'sesso': 'M' if row[1] == 'M' else 'F', 'titolo': row[2] or '',
                         'nominativo': row[3] or 'Sconosciuto', 'indirizzo': row[5] or '',
                         'comune_id': row[6] if row[6] != 0 else None, 'telefono': row[7] or '',
@@ -162,51 +797,76 @@ class Command(BaseCommand):
                         'data_nascita': row[10] if isinstance(row[10], datetime) else None,
                         'codice_fiscale': cf, 'email': row[16] or '',
                         'ha_whatsapp': bool(row[17]), 'riceve_posta': bool(row[15]),
-                        'titolo_studio': ts, 'professione_attuale': pa, 'professione_passata': pp,
                         'e_pensionato': str(row[14]).lower() in ['si', 'sì', '1', 'true', 'attivo']
-                    })
+                    }
+                    if bulk:
+                        iscritto = Iscritto(matricola=row[0], titolo_studio_id=ts, professione_attuale_id=pa,
+                                            professione_passata_id=pp, **defaults)
+                        if row[0] not in self.lookup['iscritti']:
+                            self.lookup['iscritti'].add(row[0])
+                            buf.add(iscritto)
+                            continue
+                        if buf_agg:
+                            iscritto.data_modifica = timezone.now()
+                            buf_agg.add(iscritto)
+                            continue
+                    else:
+                        defaults.update({'titolo_studio': ts, 'professione_attuale': pa, 'professione_passata': pp})
+                        self.scrivi(Iscritto, matricola=row[0], defaults=defaults)
                 self.stats['iscritti'] += 1
             except Exception as e:
                 self.stats['errori'] += 1
                 if self.verbose: self.log(f"Errore iscritto {row[0]}: {e}", 'error')
 
+        if bulk:
+            buf.flush()
+            if buf_agg: buf_agg.flush()
+            self.lookup['iscritti'] = set(Iscritto.objects.values_list('matricola', flat=True))
         if not self.dry_run:
-            for row in rows:
-                if row[4] and row[4] != 0:
-                    try:
-                        m1 = Iscritto.objects.get(matricola=row[0])
-                        m2 = Iscritto.objects.get(matricola=row[4])
-                        m1.coniuge = m2
-                        m1.save()
-                    except: pass
+            # Fase di collegamento unica: mappa delle matricole in memoria e bulk_update(['coniuge'])
+            esito = collega_coppie(coppie_coniugi, batch_size=self.batch_size)
+            self.log(f"Coniugi collegati: {esito['collegati']} (già collegati {esito['gia_collegati']}, non trovati {esito['non_trovati']})")
 
     def import_catalogo(self):
-        cursor = connections['old_database'].cursor()
+        bulk = self.bulk and not self.dry_run
         for table, model, key in [('TCategorie', CategoriaCorso, 'categorie'), ('TGruppi', GruppoCorso, 'gruppi')]:
-            cursor.execute(f"SELECT * FROM `{table}`")
-            for row in cursor.fetchall():
+            campi = ['nome', 'ordine'] if key == 'categorie' else ['nome']
+            buf = BulkBuffer(self, model, key, **self.aggiorna(campi, ['id'])) if bulk else None
+            for row in self.stream_delta(table, f"SELECT * FROM `{table}`", lambda r: r[0]):
                 try:
-                    if not self.dry_run:
-                        if key == 'categorie': model.objects.get_or_create(id=row[0], defaults={'nome': row[1], 'ordine': row[0]})
-                        else: model.objects.get_or_create(id=row[0], defaults={'nome': row[1]})
+                    defaults = {'nome': row[1], 'ordine': row[0]} if key == 'categorie' else {'nome': row[1]}
+                    if bulk:
+                        buf.add(model(id=row[0], **defaults))
+                        continue
+                    if not self.dry_run: self.scrivi(model, id=row[0], defaults=defaults)
                     self.stats[key] += 1
                 except: self.stats['errori'] += 1
+            if bulk: buf.flush()
 
-        cursor.execute("SELECT * FROM `TCorsi`")
-        for row in cursor.fetchall():
+        campi = ['nome', 'descrizione', 'categoria', 'gruppo']
+        buf = BulkBuffer(self, Corso, 'corsi', **self.aggiorna(campi, ['codice'])) if bulk else None
+        for row in self.stream_delta('TCorsi', "SELECT * FROM `TCorsi`", lambda r: r[0]):
             try:
+                defaults = {
+                    'nome': row[1] or f"Corso {row[0]}", 'descrizione': row[2] or '',
+                    'categoria_id': row[3] if row[3] != 0 else None, 'gruppo_id': row[4] if row[4] != 0 else None
+                }
+                if bulk:
+                    buf.add(Corso(codice=row[0], **defaults))
+                    continue
                 if not self.dry_run:
-                    Corso.objects.get_or_create(codice=row[0], defaults={
-                        'nome': row[1] or f"Corso {row[0]}", 'descrizione': row[2] or '',
-                        'categoria_id': row[3] if row[3] != 0 else None, 'gruppo_id': row[4] if row[4] != 0 else None
-                    })
+                    self.scrivi(Corso, codice=row[0], defaults=defaults)
                 self.stats['corsi'] += 1
             except: self.stats['errori'] += 1
+        if bulk:
+            buf.flush()
+            self.lookup['corsi'] = dict(Corso.objects.values_list('codice', 'id'))
 
     def import_periodi(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TAnnoAccademico` ORDER BY progr DESC")
-        for i, row in enumerate(cursor.fetchall()):
+        # Poche righe: resta get_or_create anche in --bulk, così AnnoAccademico.save()
+        # continua a gestire il flag dell'anno attivo. Con --incrementale la tabella
+        # viene comunque riletta per intero, dato che l'anno attivo dipende dall'ordine
+        for i, row in enumerate(self.stream("SELECT * FROM `TAnnoAccademico` ORDER BY progr DESC")):
             if not row[0]: continue
             anno_fix = str(row[0]).replace('/', '-')
             try:
@@ -219,14 +879,25 @@ class Command(BaseCommand):
                     })
                 self.stats['anni'] += 1
             except: self.stats['errori'] += 1
+        if self.bulk and not self.dry_run:
+            self.refresh_lookup_anni()
 
     def import_edizioni(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TCorsiAnnualiDocenti`")
-        for row in cursor.fetchall():
+        bulk = self.bulk and not self.dry_run
+
+        # Gli id già presenti vengono scartati prima dell'insert: i duplicati sulla
+        # unique_together emergono così come errori, come con get_or_create
+        buf = BulkBuffer(self, EdizioneCorso, 'edizioni', ignore_conflicts=False) if bulk else None
+        campi = ['anno_accademico', 'corso', 'quadrimestre', 'docente', 'descrizione_custom',
+                 'giorni_settimana', 'ora_inizio', 'ora_fine']
+        buf_agg = BulkBuffer(self, EdizioneCorso, 'edizioni', **self.aggiorna(campi)) if bulk and self.incrementale else None
+        for row in self.stream_delta('TCorsiAnnualiDocenti', "SELECT * FROM `TCorsiAnnualiDocenti`", lambda r: r[0]):
             try:
                 anno_val = str(row[1]).replace('/', '-')
-                anno = AnnoAccademico.objects.filter(anno=anno_val).first()
+                if bulk:
+                    anno = self.lookup['anni'].get(anno_val)
+                else:
+                    anno = AnnoAccademico.objects.filter(anno=anno_val).first()
 
                 # Se siamo in dry-run, anno potrebbe essere None se non è ancora nel DB
                 if self.dry_run and not anno:
@@ -237,72 +908,123 @@ class Command(BaseCommand):
                     self.stats['errori'] += 1
                     continue
 
-                if not self.dry_run:
-                    corso = Corso.objects.filter(codice=row[2]).first() or self.cache['corso_generico']
-                    docente = Docente.objects.filter(id=row[5]).first() or self.cache['docente_generico']
+                q_num = row[4] if row[4] in [0, 1, 2, 3] else 0
+                quadrimestre = self.cache['quadrimestri'].get(q_num)
+
+                defaults = {
+                    'descrizione_custom': row[3] or '',
+                    'giorni_settimana': row[8] or '',
+                    'ora_inizio': row[9] or '09:00',
+                    'ora_fine': row[10] or '11:00'
+                }
+
+                if bulk:
+                    edizione = EdizioneCorso(
+                        id=row[0], anno_accademico=anno, quadrimestre=quadrimestre,
+                        corso_id=self.lookup['corsi'].get(row[2]) or self.cache['corso_generico'].id,
+                        docente_id=row[5] if row[5] in self.lookup['docenti'] else self.cache['docente_generico'].id,
+                        **defaults
+                    )
+                    if row[0] not in self.lookup['edizioni']:
+                        self.lookup['edizioni'][row[0]] = None
+                        buf.add(edizione)
+                        continue
+                    if buf_agg:
+                        buf_agg.add(edizione)
+                        continue
                 else:
                     corso = Corso.objects.filter(codice=row[2]).first() or self.cache['corso_generico']
                     docente = Docente.objects.filter(id=row[5]).first() or self.cache['docente_generico']
 
-                q_num = row[4] if row[4] in [0, 1, 2, 3] else 0
-                quadrimestre = self.cache['quadrimestri'].get(q_num)
-
-                if not self.dry_run:
-                    EdizioneCorso.objects.get_or_create(id=row[0], defaults={
-                        'anno_accademico': anno,
-                        'corso': corso,
-                        'quadrimestre': quadrimestre,
-                        'docente': docente,
-                        'descrizione_custom': row[3] or '',
-                        'giorni_settimana': row[8] or '',
-                        'ora_inizio': row[9] or '09:00',
-                        'ora_fine': row[10] or '11:00'
-                    })
+                    if not self.dry_run:
+                        self.scrivi(EdizioneCorso, id=row[0], defaults={
+                            'anno_accademico': anno,
+                            'corso': corso,
+                            'quadrimestre': quadrimestre,
+                            'docente': docente,
+                            **defaults
+                        })
 
                 self.stats['edizioni'] += 1
             except Exception as e:
                 self.stats['errori'] += 1
                 if self.verbose: self.log(f"Errore edizione {row[0]}: {e}", 'error')
+        if bulk:
+            buf.flush()
+            if buf_agg: buf_agg.flush()
+            self.refresh_lookup_edizioni()
 
-    def import_iscrizioni(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TIscrizioneAnnoAccademico`")
-        for row in cursor.fetchall():
+    def import_iscrizioni_anno(self):
+        bulk = self.bulk and not self.dry_run
+
+        campi = ['numero_ricevuta', 'data_iscrizione']
+        buf = BulkBuffer(self, IscrizioneAnnoAccademico, 'isc_anno', **self.aggiorna(campi, ['anno_accademico', 'iscritto'])) if bulk else None
+        for row in self.stream_delta('TIscrizioneAnnoAccademico', "SELECT * FROM `TIscrizioneAnnoAccademico`", lambda r: (r[0], r[1])):
             try:
-                if not self.dry_run:
+                if bulk:
+                    anno = self.lookup['anni'].get(str(row[0]).replace('/', '-'))
+                    if anno and row[1] in self.lookup['iscritti']:
+                        buf.add(IscrizioneAnnoAccademico(anno_accademico=anno, iscritto_id=row[1], numero_ricevuta=row[2] or 0, data_iscrizione=row[3] if isinstance(row[3], datetime) else anno.data_inizio))
+                        continue
+                    self.salta_riga()
+                elif not self.dry_run:
                     anno = AnnoAccademico.objects.filter(anno=str(row[0]).replace('/', '-')).first()
                     isc = Iscritto.objects.filter(matricola=row[1]).first()
-                    if anno and isc: IscrizioneAnnoAccademico.objects.get_or_create(anno_accademico=anno, iscritto=isc, defaults={'numero_ricevuta': row[2] or 0, 'data_iscrizione': row[3] if isinstance(row[3], datetime) else anno.data_inizio})
+                    if anno and isc: self.scrivi(IscrizioneAnnoAccademico, anno_accademico=anno, iscritto=isc, defaults={'numero_ricevuta': row[2] or 0, 'data_iscrizione': row[3] if isinstance(row[3], datetime) else anno.data_inizio})
+                    else: self.salta_riga()
                 self.stats['isc_anno'] += 1
             except: self.stats['errori'] += 1
+        if bulk: buf.flush()
 
-        cursor.execute("SELECT * FROM `TFrequenzaCorsi`")
-        for row in cursor.fetchall():
+    def import_iscrizioni_corso(self):
+        bulk = self.bulk and not self.dry_run
+        campi = ['numero_ricevuta', 'data_iscrizione']
+        buf = BulkBuffer(self, IscrizioneCorso, 'isc_corso', **self.aggiorna(campi, ['anno_accademico', 'edizione_corso', 'iscritto'])) if bulk else None
+        for row in self.stream_delta('TFrequenzaCorsi', "SELECT * FROM `TFrequenzaCorsi`", lambda r: (r[0], r[1], r[2])):
             try:
-                if not self.dry_run:
+                if bulk:
+                    anno = self.lookup['anni'].get(str(row[0]).replace('/', '-'))
+                    ediz_id = self.lookup['edizioni_per_corso'].get((anno.id, row[1])) if anno else None
+                    if anno and ediz_id and row[2] in self.lookup['iscritti']:
+                        buf.add(IscrizioneCorso(anno_accademico=anno, iscritto_id=row[2], edizione_corso_id=ediz_id, numero_ricevuta=row[3] or 0, data_iscrizione=row[4] if isinstance(row[4], datetime) else anno.data_inizio))
+                        continue
+                    self.salta_riga()
+                elif not self.dry_run:
                     anno = AnnoAccademico.objects.filter(anno=str(row[0]).replace('/', '-')).first()
                     isc = Iscritto.objects.filter(matricola=row[2]).first()
                     ediz = EdizioneCorso.objects.filter(anno_accademico=anno, corso__codice=row[1]).first()
-                    if anno and isc and ediz: IscrizioneCorso.objects.get_or_create(anno_accademico=anno, iscritto=isc, edizione_corso=ediz, defaults={'numero_ricevuta': row[3] or 0, 'data_iscrizione': row[4] if isinstance(row[4], datetime) else anno.data_inizio})
+                    if anno and isc and ediz: self.scrivi(IscrizioneCorso, anno_accademico=anno, iscritto=isc, edizione_corso=ediz, defaults={'numero_ricevuta': row[3] or 0, 'data_iscrizione': row[4] if isinstance(row[4], datetime) else anno.data_inizio})
+                    else: self.salta_riga()
                 self.stats['isc_corso'] += 1
             except: self.stats['errori'] += 1
+        if bulk: buf.flush()
 
     def import_lezioni(self):
-        cursor = connections['old_database'].cursor()
-        cursor.execute("SELECT * FROM `TPresenzeCorsisti`")
-        for row in cursor.fetchall():
+        bulk = self.bulk and not self.dry_run
+
+        campi = ['descrizione', 'docente', 'numero_presenti', 'ore_lezione', 'data_modifica']
+        buf = BulkBuffer(self, Lezione, 'lezioni', **self.aggiorna(campi, ['edizione_corso', 'data_lezione'])) if bulk else None
+        for row in self.stream_delta('TPresenzeCorsisti', "SELECT * FROM `TPresenzeCorsisti`", lambda r: (r[0], r[1])):
             try:
-                if not self.dry_run:
+                if bulk:
+                    if row[0] in self.lookup['edizioni'] and row[1]:
+                        doc_id = row[4] if row[4] in self.lookup['docenti'] else self.lookup['edizioni'][row[0]]
+                        buf.add(Lezione(edizione_corso_id=row[0], data_lezione=row[1], descrizione=row[3] or '', docente_id=doc_id, numero_presenti=row[5] or 0, ore_lezione=float(row[6]) if row[6] else 2.0, data_modifica=timezone.now()))
+                        continue
+                    self.salta_riga()
+                elif not self.dry_run:
                     ediz = EdizioneCorso.objects.filter(id=row[0]).first()
                     if ediz and row[1]:
                         doc_id = row[4] if Docente.objects.filter(id=row[4]).exists() else ediz.docente_id
-                        Lezione.objects.get_or_create(edizione_corso=ediz, data_lezione=row[1], defaults={'descrizione': row[3] or '', 'docente_id': doc_id, 'numero_presenti': row[5] or 0, 'ore_lezione': float(row[6]) if row[6] else 2.0})
+                        self.scrivi(Lezione, edizione_corso=ediz, data_lezione=row[1], defaults={'descrizione': row[3] or '', 'docente_id': doc_id, 'numero_presenti': row[5] or 0, 'ore_lezione': float(row[6]) if row[6] else 2.0})
+                    else: self.salta_riga()
                 self.stats['lezioni'] += 1
             except: self.stats['errori'] += 1
+        if bulk: buf.flush()
 
     def print_summary(self):
         self.stdout.write('\n' + '='*70)
-        self.stdout.write(self.style.SUCCESS(f"  RIEPILOGO IMPORTAZIONE (v2.6{' - DRY RUN' if self.dry_run else ''})"))
+        self.stdout.write(self.style.SUCCESS(f"  RIEPILOGO IMPORTAZIONE (v2.7{' - BULK' if self.bulk else ''}{' - INCREMENTALE' if self.incrementale else ''}{' - DRY RUN' if self.dry_run else ''})"))
         self.stdout.write('='*70)
         self.stdout.write(f"  • Comuni/Titoli: {self.stats['comuni']} / {self.stats['titoli']}")
         self.stdout.write(f"  • Staff: {self.stats['docenti']} docenti, {self.stats['autorita']} autorità")
@@ -312,4 +1034,47 @@ class Command(BaseCommand):
         self.stdout.write(f"  • Didattica: {self.stats['edizioni']} edizioni, {self.stats['lezioni']} lezioni")
         self.stdout.write(f"  • Iscrizioni: {self.stats['isc_anno']} annuali, {self.stats['isc_corso']} ai corsi")
         if self.stats['errori'] > 0: self.stdout.write(self.style.WARNING(f"\n  ⚠️ Record saltati o con errori: {self.stats['errori']}"))
+        if self.delte:
+            self.stdout.write("\n  Tabelle legacy (incrementale):")
+            for tabella, delta in sorted(self.delte.items()):
+                if delta.invariata:
+                    self.stdout.write(f"    - {tabella}: invariata (checksum), non riletta")
+                else:
+                    invariate = delta.righe - delta.nuove - delta.modificate - delta.scartate
+                    self.stdout.write(f"    - {tabella}: {delta.nuove} nuove, {delta.modificate} modificate, {invariate} invariate" + (f", {delta.scartate} scartate" if delta.scartate else '') + (f", {delta.riprese} riprese dal checkpoint" if delta.riprese else ''))
+        if self.metriche:
+            self.stdout.write("\n  Prestazioni per sezione (tempo / righe lette, scritte / lette al secondo / query):")
+            for section_name, m in self.metriche.items():
+                if m.saltata:
+                    self.stdout.write(f"    - {section_name}: saltata (--resume)")
+                    continue
+                query = ', '.join(f"{alias} {numero}" for alias, (numero, _) in m.query.items()) or '0'
+                self.stdout.write(f"    - {section_name}: {m.tempo:.2f}s / {m.righe_lette}, {m.righe_scritte} / {m.righe_al_secondo:.0f} r/s / {query}")
+        if self.memoria:
+            self.stdout.write("\n  Memoria (picco RSS a fine sezione / crescita nella sezione):")
+            for section_name, (picco, crescita) in self.memoria.items():
+                self.stdout.write(f"    - {section_name}: {picco / 1024:.1f} MB / +{crescita / 1024:.1f} MB")
         self.stdout.write('\n' + '='*70 + '\n')
+
+    def write_report(self, inizio, options):
+        """Salva in JSON le metriche per sezione, per confrontare nel tempo diverse importazioni"""
+        fine = timezone.now()
+        report = {
+            'versione': '2.7',
+            'inizio': inizio.isoformat(),
+            'fine': fine.isoformat(),
+            'durata_s': round((fine - inizio).total_seconds(), 3),
+            'opzioni': {key: options[key] for key in (
+                'dry_run', 'bulk', 'batch_size', 'fetch_size', 'jobs', 'incrementale', 'resume'
+            )},
+            'database': {alias: connections[alias].vendor for alias in ('default', 'old_database')},
+            'sorgente': options['sorgente'],
+            'sezioni': [m.to_dict(self.memoria.get(nome)) for nome, m in self.metriche.items()],
+            'totali': self.stats_totali,
+        }
+        try:
+            with open(self.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            raise CommandError(f"Impossibile scrivere il report {self.report}: {e}")
+        self.log(f"Report salvato in {self.report}", 'success')
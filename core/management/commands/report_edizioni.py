@@ -0,0 +1,47 @@
+"""
+UNIGEST - Report Edizioni Command
+File: core/management/commands/report_edizioni.py
+Descrizione: Genera in un unico ZIP foglio presenze, elenco iscritti e registro
+lezioni di tutte le edizioni di un anno accademico, o di un solo quadrimestre,
+usando un processo per core (core/pacchetti.py). Dall'interfaccia lo stesso
+pacchetto si richiede dal menu Report e viene generato da worker_report.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import pacchetti
+from core.models import AnnoAccademico
+
+
+class Command(BaseCommand):
+    help = "Genera lo ZIP con i report PDF di tutte le edizioni di un anno accademico"
+
+    def add_arguments(self, parser):
+        parser.add_argument('anno', help="Anno accademico (es. 2024-2025)")
+        parser.add_argument('--quadrimestre', type=int, choices=[0, 1, 2, 3], help="Solo le edizioni di un quadrimestre")
+        parser.add_argument('--processi', type=int, help="Processi in parallelo (default REPORT_PROCESSI, o uno per core)")
+        parser.add_argument('--output', help="File ZIP da scrivere (default report_edizioni_<anno>.zip)")
+
+    def handle(self, *args, **options):
+        anno = AnnoAccademico.objects.filter(anno=options['anno']).first()
+        if anno is None:
+            raise CommandError(f"Anno accademico {options['anno']} inesistente")
+        quadrimestre = options['quadrimestre']
+        output = options['output'] or (
+            f"report_edizioni_{anno.anno}{f'_Q{quadrimestre}' if quadrimestre is not None else ''}.zip"
+        )
+
+        numero = pacchetti.edizioni(anno.pk, quadrimestre).count()
+        self.stdout.write(self.style.MIGRATE_LABEL(f'\n--- Report delle edizioni {anno.anno} ---'))
+        self.stdout.write(f"  • {numero} edizioni, {numero * len(pacchetti.TIPI_EDIZIONE)} PDF")
+
+        inizio = time.perf_counter()
+        with open(output, 'wb') as file:
+            scritti, errori = pacchetti.scrivi_zip(file, anno.pk, quadrimestre, options['processi'])
+        durata = time.perf_counter() - inizio
+
+        for errore in errori:
+            self.stdout.write(self.style.ERROR(f"  ✗ {errore}"))
+        if errori:
+            self.stdout.write(self.style.WARNING(f"  ⚠️ {len(errori)} PDF non riusciti, elencati in ERRORI.txt"))
+        self.stdout.write(self.style.SUCCESS(f"  ✓ {scritti} PDF in {output} ({durata:.1f}s)"))
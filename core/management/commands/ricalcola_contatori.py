@@ -0,0 +1,52 @@
+"""
+UNIGEST - Ricalcola Contatori Command
+File: core/management/commands/ricalcola_contatori.py
+Descrizione: Confronta i contatori denormalizzati delle edizioni (numero_iscritti,
+numero_lezioni) con i conteggi reali e corregge quelli disallineati. Da eseguire
+dopo modifiche fatte senza passare dall'ORM (SQL diretto, bulk_create, fixture);
+import_old_data e seed_synthetic li ricalcolano da soli.
+"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import contatori, statistiche
+from core.models import AnnoAccademico, EdizioneCorso
+
+
+class Command(BaseCommand):
+    help = "Verifica e corregge i contatori di iscritti e lezioni delle edizioni dei corsi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anno', help="Solo le edizioni di un anno accademico (es. 2024-2025)")
+        parser.add_argument('--dry-run', action='store_true', help="Elenca i contatori disallineati senza correggerli")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_LABEL('\n--- Contatori delle edizioni ---'))
+        edizioni = EdizioneCorso.objects.all()
+        if options['anno']:
+            anno = AnnoAccademico.objects.filter(anno=options['anno']).first()
+            if anno is None:
+                raise CommandError(f"Anno accademico {options['anno']} inesistente")
+            edizioni = edizioni.filter(anno_accademico=anno)
+
+        inizio = time.perf_counter()
+        with transaction.atomic():
+            errate = contatori.ricalcola(edizioni, salva=not options['dry_run'])
+
+        for edizione in errate:
+            differenze = ', '.join(
+                f"{campo} {getattr(edizione, campo)} → {getattr(edizione, f'reale_{campo}')}"
+                for campo in contatori.CONTATORI.values()
+                if getattr(edizione, campo) != getattr(edizione, f'reale_{campo}')
+            )
+            self.stdout.write(f"  • {edizione.corso.nome} ({edizione.anno_accademico}): {differenze}")
+
+        durata = time.perf_counter() - inizio
+        if not errate:
+            self.stdout.write(self.style.SUCCESS(f"  ✓ Tutti i contatori sono allineati ({durata:.1f}s)"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"  ⚠️ {len(errate)} edizioni con contatori disallineati (dry-run, nessuna modifica)"))
+        else:
+            statistiche.invalida_tutto()
+            self.stdout.write(self.style.SUCCESS(f"  ✓ {len(errate)} edizioni corrette in {durata:.1f}s"))
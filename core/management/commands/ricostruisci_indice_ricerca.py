@@ -0,0 +1,29 @@
+"""
+UNIGEST - Ricostruisci Indice Ricerca Command
+File: core/management/commands/ricostruisci_indice_ricerca.py
+Descrizione: Rigenera da zero l'indice full-text della ricerca globale
+(IndiceRicerca e, su SQLite, la tabella FTS5 collegata). Da eseguire dopo
+modifiche fatte senza passare dall'ORM (SQL diretto, fixture) o in caso di
+indice danneggiato; import_old_data e seed_synthetic lo ricostruiscono da soli.
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.ricerca import ricostruisci
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice full-text della ricerca globale (iscritti, docenti, corsi)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Voci per blocco di bulk_create (default 1000)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_LABEL('\n--- Ricostruzione indice di ricerca ---'))
+        inizio = time.perf_counter()
+        with transaction.atomic():
+            conteggi = ricostruisci(batch_size=max(1, options['batch_size']))
+        for tipo, totale in conteggi.items():
+            self.stdout.write(f"  • {tipo}: {totale} voci")
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Indice ricostruito in {time.perf_counter() - inizio:.1f}s"))
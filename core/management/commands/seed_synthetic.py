@@ -0,0 +1,553 @@
+"""
+UNIGEST - Seed Synthetic Command
+File: core/management/commands/seed_synthetic.py
+Descrizione: Genera dati sintetici realistici e referenzialmente coerenti per
+misurare viste, report e importazioni su volumi grandi (es. 100.000 iscritti
+e milioni di presenze).
+Comuni, iscritti con coniugi, docenti, corsi, edizioni su più anni accademici,
+iscrizioni annuali e ai corsi, lezioni e presenze vengono generati con un seme
+fisso (stesso seme e stesse opzioni = stessi dati) e inseriti con bulk_create a
+blocchi, assegnando le chiavi primarie in anticipo per non doverle rileggere.
+"""
+
+import random
+import time
+from itertools import accumulate
+from datetime import date, time as ora, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from core.management.commands.collega_coniugi import collega_coppie, verifica_simmetria
+from core import contatori, statistiche
+from core.ricerca import ricostruisci as ricostruisci_indice_ricerca
+from core.models import (
+    Comune, TitoloStudio, ProfessioneAttuale, ProfessionePassata,
+    Iscritto, Docente,
+    CategoriaCorso, GruppoCorso, Corso, AnnoAccademico, Quadrimestre,
+    EdizioneCorso, IscrizioneAnnoAccademico, IscrizioneCorso,
+    Lezione, PresenzaLezione, ImportWatermark, ImportRigaLegacy, ImportCheckpoint
+)
+
+
+# ============================================================================
+# DIZIONARI PER LA GENERAZIONE
+# ============================================================================
+
+# (nome, provincia, CAP, codice catastale fittizio, peso nella distribuzione degli iscritti)
+COMUNI = [
+    ('Bologna', 'BO', '40121', 'A944', 40), ('Casalecchio di Reno', 'BO', '40033', 'B880', 8),
+    ('San Lazzaro di Savena', 'BO', '40068', 'H945', 8), ('Imola', 'BO', '40026', 'E289', 6),
+    ('Castel Maggiore', 'BO', '40013', 'C204', 5), ('Zola Predosa', 'BO', '40069', 'M185', 4),
+    ('Pianoro', 'BO', '40065', 'G570', 4), ('Budrio', 'BO', '40054', 'B249', 3),
+    ('Castenaso', 'BO', '40055', 'C292', 3), ('Granarolo dell\'Emilia', 'BO', '40057', 'E136', 2),
+    ('Sasso Marconi', 'BO', '40037', 'G972', 3), ('Valsamoggia', 'BO', '40053', 'M320', 3),
+    ('Anzola dell\'Emilia', 'BO', '40011', 'A324', 2), ('Calderara di Reno', 'BO', '40012', 'B399', 2),
+    ('Castel San Pietro Terme', 'BO', '40024', 'C265', 3), ('Medicina', 'BO', '40059', 'F083', 2),
+    ('Molinella', 'BO', '40062', 'F288', 2), ('San Giovanni in Persiceto', 'BO', '40017', 'G467', 3),
+    ('Crevalcore', 'BO', '40014', 'D166', 1), ('Ozzano dell\'Emilia', 'BO', '40064', 'G205', 2),
+    ('Minerbio', 'BO', '40061', 'F219', 1), ('Bentivoglio', 'BO', '40010', 'A785', 1),
+    ('Argelato', 'BO', '40050', 'A392', 1), ('Monte San Pietro', 'BO', '40050', 'F627', 1),
+    ('Modena', 'MO', '41121', 'F257', 2), ('Ferrara', 'FE', '44121', 'D548', 1),
+]
+
+NOMI_M = [
+    'Giuseppe', 'Giovanni', 'Antonio', 'Mario', 'Luigi', 'Francesco', 'Angelo', 'Vincenzo',
+    'Pietro', 'Salvatore', 'Carlo', 'Franco', 'Domenico', 'Bruno', 'Paolo', 'Michele',
+    'Giorgio', 'Aldo', 'Sergio', 'Luciano', 'Roberto', 'Renato', 'Alberto', 'Gianni',
+    'Enzo', 'Claudio', 'Fabio', 'Maurizio', 'Stefano', 'Marco', 'Sandro', 'Piero',
+    'Gianfranco', 'Romano', 'Dario', 'Walter', 'Giancarlo', 'Umberto', 'Ermanno', 'Ivo',
+]
+
+NOMI_F = [
+    'Maria', 'Anna', 'Giuseppina', 'Rosa', 'Angela', 'Giovanna', 'Teresa', 'Lucia',
+    'Carmela', 'Caterina', 'Francesca', 'Anna Maria', 'Antonietta', 'Carla', 'Elena', 'Concetta',
+    'Rita', 'Margherita', 'Franca', 'Paola', 'Laura', 'Luisa', 'Giuliana', 'Silvana',
+    'Gabriella', 'Patrizia', 'Marisa', 'Loredana', 'Daniela', 'Graziella', 'Nadia', 'Liliana',
+    'Bruna', 'Adriana', 'Mirella', 'Wanda', 'Lidia', 'Gianna', 'Rosanna', 'Marisa Grazia',
+]
+
+COGNOMI = [
+    'Rossi', 'Russo', 'Ferrari', 'Esposito', 'Bianchi', 'Romano', 'Colombo', 'Ricci',
+    'Marino', 'Greco', 'Bruno', 'Gallo', 'Conti', 'De Luca', 'Mancini', 'Costa',
+    'Giordano', 'Rizzo', 'Lombardi', 'Moretti', 'Barbieri', 'Fontana', 'Santoro', 'Mariani',
+    'Rinaldi', 'Caruso', 'Ferrara', 'Galli', 'Martini', 'Leone', 'Longo', 'Gentile',
+    'Martinelli', 'Vitale', 'Lombardo', 'Serra', 'Coppola', 'De Santis', 'D\'Angelo', 'Marchetti',
+    'Parisi', 'Villa', 'Conte', 'Ferraro', 'Ferri', 'Fabbri', 'Bianco', 'Marini',
+    'Grasso', 'Valentini', 'Messina', 'Sala', 'De Angelis', 'Gatti', 'Pellegrini', 'Palumbo',
+    'Sanna', 'Farina', 'Rizzi', 'Monti', 'Cattaneo', 'Morelli', 'Amato', 'Silvestri',
+    'Mazza', 'Testa', 'Grassi', 'Pellegrino', 'Carbone', 'Giuliani', 'Benedetti', 'Barone',
+    'Rossetti', 'Caputo', 'Montanari', 'Guerra', 'Palmieri', 'Bernardi', 'Martino', 'Fiore',
+]
+
+VIE = [
+    'Via Roma', 'Via Garibaldi', 'Via Mazzini', 'Via Matteotti', 'Via Dante', 'Via Marconi',
+    'Via Verdi', 'Via Emilia', 'Via San Donato', 'Via Saragozza', 'Via Castiglione', 'Via Toscana',
+    'Via Massarenti', 'Via Andrea Costa', 'Via dei Mille', 'Piazza della Pace', 'Viale Oriani',
+]
+
+TITOLI_STUDIO = ['Licenza elementare', 'Licenza media', 'Diploma', 'Laurea', 'Post-laurea']
+PROFESSIONI = [
+    'Impiegato/a', 'Insegnante', 'Operaio/a', 'Commerciante', 'Artigiano/a', 'Medico',
+    'Infermiere/a', 'Casalinga', 'Libero professionista', 'Dirigente', 'Agricoltore', 'Bancario/a',
+]
+
+CATEGORIE = [('Culturali', 1), ('Laboratori', 2), ('Lingue', 3), ('Altri', 4)]
+GRUPPI = ['Mattino', 'Pomeriggio', 'Sede distaccata']
+
+# Materie per categoria, combinate con un livello o un tema per ottenere nomi di corso distinti
+MATERIE = {
+    'Culturali': ['Storia dell\'arte', 'Letteratura italiana', 'Storia contemporanea', 'Filosofia',
+                  'Astronomia', 'Musica', 'Cinema', 'Psicologia', 'Economia', 'Archeologia'],
+    'Laboratori': ['Acquerello', 'Ceramica', 'Fotografia digitale', 'Informatica', 'Cucina',
+                   'Teatro', 'Canto corale', 'Ricamo', 'Scrittura creativa', 'Ginnastica dolce'],
+    'Lingue': ['Inglese', 'Francese', 'Spagnolo', 'Tedesco', 'Russo', 'Portoghese'],
+    'Altri': ['Educazione sanitaria', 'Giardinaggio', 'Bridge', 'Scacchi', 'Diritto per tutti',
+              'Smartphone e tablet', 'Yoga', 'Ballo liscio'],
+}
+LIVELLI = ['base', 'intermedio', 'avanzato', 'conversazione', 'I', 'II', 'III', 'monografico']
+
+GIORNI = ['Lunedì', 'Martedì', 'Mercoledì', 'Giovedì', 'Venerdì']
+# (ora inizio, ora fine) delle fasce orarie delle lezioni
+FASCE = [(ora(9, 0), ora(10, 30)), (ora(10, 45), ora(12, 15)), (ora(15, 0), ora(16, 30)),
+         (ora(16, 45), ora(18, 15)), (ora(15, 0), ora(17, 0))]
+
+# Pesi dei quadrimestri 0 (annuale), 1, 2, 3 (entrambi) per le edizioni
+PESI_QUADRIMESTRE = [5, 40, 40, 15]
+MESI_CF = 'ABCDEHLMPRST'
+
+
+def codice_fiscale(cognome, nome, sesso, nascita, catastale):
+    """
+    Codice fiscale formalmente plausibile (consonanti/vocali di cognome e nome,
+    anno, lettera del mese, giorno +40 per le donne, codice catastale); il
+    carattere di controllo è semplificato e il codice non va usato come valido
+    """
+    def lettere(testo, nome_proprio=False):
+        testo = ''.join(c for c in testo.upper() if c.isalpha())
+        consonanti = [c for c in testo if c not in 'AEIOU']
+        vocali = [c for c in testo if c in 'AEIOU']
+        if nome_proprio and len(consonanti) >= 4:
+            consonanti = [consonanti[0], consonanti[2], consonanti[3]]
+        return ''.join(consonanti + vocali + ['X', 'X', 'X'])[:3]
+
+    giorno = nascita.day + (40 if sesso == 'F' else 0)
+    base = f"{lettere(cognome)}{lettere(nome, True)}{nascita.year % 100:02d}{MESI_CF[nascita.month - 1]}{giorno:02d}{catastale}"
+    return base + chr(65 + sum(ord(c) for c in base) % 26)
+
+
+def giorni_lezione(inizio, fine, giorni_settimana, chiusure):
+    """Date dei giorni della settimana indicati (0 = lunedì) tra inizio e fine, escluse le chiusure"""
+    giorno = inizio
+    while giorno <= fine:
+        if giorno.weekday() in giorni_settimana and not any(a <= giorno <= b for a, b in chiusure):
+            yield giorno
+        giorno += timedelta(days=1)
+
+
+class Blocchi:
+    """
+    Accumula istanze di un modello e le inserisce con bulk_create a blocchi di
+    batch_size, così la memoria resta costante anche con milioni di righe.
+    Con dopo=<Blocchi> il blocco referenziato viene scritto per primo, perché
+    MySQL verifica le chiavi esterne a ogni INSERT e non al commit.
+    Con colonne=[...] si accodano tuple di valori già pronti, scritte con un
+    executemany: per le tabelle da milioni di righe senza campi auto_now evita
+    la compilazione dell'INSERT nell'ORM, che costa più dell'INSERT stesso.
+    """
+
+    def __init__(self, model, batch_size, dopo=None, colonne=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.dopo = dopo
+        self.sql = None
+        if colonne:
+            qn = connection.ops.quote_name
+            self.sql = (f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(c) for c in colonne)}) "
+                        f"VALUES ({', '.join(['%s'] * len(colonne))})")
+        self.oggetti = []
+        self.totale = 0
+
+    def aggiungi(self, oggetto):
+        self.oggetti.append(oggetto)
+        if len(self.oggetti) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.dopo:
+            self.dopo.flush()
+        if not self.oggetti:
+            return
+        if self.sql:
+            with connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.oggetti)
+        else:
+            self.model.objects.bulk_create(self.oggetti, batch_size=self.batch_size)
+        self.totale += len(self.oggetti)
+        self.oggetti = []
+
+
+class Command(BaseCommand):
+    help = 'Genera dati sintetici realistici (iscritti, corsi, iscrizioni, lezioni, presenze) per benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iscritti', type=int, default=1000, help='Numero di iscritti da generare (default 1000)')
+        parser.add_argument('--anni', type=int, default=3, help='Anni accademici da generare (default 3)')
+        parser.add_argument('--primo-anno', type=int, default=None,
+                            help="Anno di inizio del primo anno accademico (default: l'ultimo generato è quello in corso)")
+        parser.add_argument('--corsi', type=int, default=None,
+                            help='Corsi nel catalogo (default: calcolato per avere circa --media-corso iscritti per edizione)')
+        parser.add_argument('--media-corso', type=int, default=25, help='Iscritti medi per edizione (default 25)')
+        parser.add_argument('--seed', type=int, default=42, help='Seme del generatore casuale (default 42)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Righe per blocco di bulk_create (default 2000)')
+        parser.add_argument('--svuota', action='store_true',
+                            help='Cancella prima iscritti, docenti, corsi, anni, iscrizioni, lezioni e presenze esistenti')
+        parser.add_argument('--senza-presenze', action='store_true', help='Non genera il dettaglio PresenzaLezione')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = max(1, options['batch_size'])
+        self.n_iscritti = max(2, options['iscritti'])
+        self.n_anni = max(1, options['anni'])
+        self.media_corso = max(1, options['media_corso'])
+        self.presenze = not options['senza_presenze']
+        oggi = date.today()
+        anno_corrente = oggi.year if oggi.month >= 9 else oggi.year - 1
+        self.primo_anno = options['primo_anno'] or anno_corrente - self.n_anni + 1
+        # Circa il 60% degli iscritti si iscrive ogni anno, a 2 corsi in media; ogni corso attivo ha 1,1 edizioni
+        self.n_corsi = options['corsi'] or max(10, round(self.n_iscritti * 0.6 * 2 / self.media_corso / 0.95))
+        self.stats = {}
+        self.tempi = {}
+
+        self.stdout.write(self.style.SUCCESS('\n' + '='*70))
+        self.stdout.write(self.style.SUCCESS(f"  UNIGEST - DATI SINTETICI (seme {options['seed']})"))
+        self.stdout.write(self.style.SUCCESS('='*70))
+        self.stdout.write(f"  • {self.n_iscritti} iscritti, {self.n_corsi} corsi, {self.n_anni} anni dal {self.primo_anno}-{self.primo_anno + 1}")
+
+        esistenti = [m._meta.verbose_name_plural for m in (Iscritto, Docente, Corso, AnnoAccademico) if m.objects.exists()]
+        if esistenti and not options['svuota']:
+            raise CommandError(f"Il database contiene già {', '.join(esistenti)}: usa --svuota per sostituirli")
+
+        inizio = time.perf_counter()
+        if options['svuota']:
+            self.sezione('Svuotamento', self.svuota)
+        self.sezione('Tabelle di supporto', self.genera_supporto)
+        self.sezione('Iscritti e coniugi', self.genera_iscritti)
+        self.sezione('Docenti e corsi', self.genera_catalogo)
+        for indice in range(self.n_anni):
+            self.sezione(f'Anno {self.primo_anno + indice}-{self.primo_anno + indice + 1}', lambda: self.genera_anno(indice))
+        self.sezione('Verifica', self.verifica)
+        # bulk_create non emette segnali: statistiche in cache, contatori delle edizioni e indice di ricerca vanno aggiornati qui
+        statistiche.invalida_tutto()
+        self.sezione('Contatori edizioni', contatori.ricalcola)
+        self.sezione('Indice di ricerca', lambda: ricostruisci_indice_ricerca(batch_size=self.batch_size))
+        self.print_summary(time.perf_counter() - inizio)
+
+    def sezione(self, nome, task):
+        self.stdout.write(self.style.MIGRATE_LABEL(f'\n--- {nome} ---'))
+        inizio = time.perf_counter()
+        with transaction.atomic():
+            task()
+        self.tempi[nome] = time.perf_counter() - inizio
+        self.stdout.write(f"  ✓ {nome}: {self.tempi[nome]:.1f}s")
+
+    def conta(self, chiave, valore):
+        self.stats[chiave] = self.stats.get(chiave, 0) + valore
+
+    # ------------------------------------------------------------------------
+    # PREPARAZIONE
+    # ------------------------------------------------------------------------
+
+    def svuota(self):
+        """
+        Cancella i dati generati con un DELETE per tabella, dalle foglie alle radici,
+        senza passare dal collector dell'ORM che caricherebbe milioni di chiavi.
+        Lo stato delle importazioni viene azzerato perché non corrisponde più ai dati.
+        """
+        modelli = [
+            PresenzaLezione, Lezione, IscrizioneCorso, IscrizioneAnnoAccademico, EdizioneCorso,
+            AnnoAccademico, Corso, Iscritto, Docente, ImportWatermark, ImportRigaLegacy, ImportCheckpoint,
+        ]
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {qn(Iscritto._meta.db_table)} SET {qn('coniuge_id')} = NULL")
+            for model in modelli:
+                cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+                self.stdout.write(f"  • {model._meta.verbose_name_plural}: {cursor.rowcount} righe cancellate")
+            # Sui database con sequenze (es. PostgreSQL) i contatori ripartono da 1
+            for sql in connection.ops.sequence_reset_by_name_sql(no_style(), [
+                {'table': m._meta.db_table, 'column': m._meta.pk.column} for m in modelli
+            ]):
+                cursor.execute(sql)
+
+    def prossimo_id(self, model):
+        """Prima chiave primaria libera, per assegnare gli id prima del bulk_create"""
+        ultimo = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+        return (ultimo or 0) + 1
+
+    def lookup(self, model, campo, valori, **extra):
+        """Crea i valori mancanti di una tabella di lookup e restituisce la lista degli id nell'ordine dato"""
+        presenti = dict(model.objects.filter(**{f'{campo}__in': valori}).values_list(campo, 'pk'))
+        mancanti = [v for v in valori if v not in presenti]
+        model.objects.bulk_create([model(**{campo: v}, **extra.get(v, {})) for v in mancanti])
+        presenti.update(model.objects.filter(**{f'{campo}__in': mancanti}).values_list(campo, 'pk'))
+        self.conta('lookup', len(mancanti))
+        return [presenti[v] for v in valori]
+
+    def genera_supporto(self):
+        comuni_mancanti = [c for c in COMUNI if not Comune.objects.filter(nome=c[0]).exists()]
+        Comune.objects.bulk_create([Comune(nome=n, provincia=p, cap=cap) for n, p, cap, _, _ in comuni_mancanti])
+        mappa = dict(Comune.objects.filter(nome__in=[c[0] for c in COMUNI]).values_list('nome', 'pk'))
+        self.comuni = [(mappa[n], n, catastale) for n, _, _, catastale, _ in COMUNI]
+        self.pesi_comuni = [peso for *_, peso in COMUNI]
+        self.conta('comuni', len(comuni_mancanti))
+
+        self.titoli_studio = self.lookup(TitoloStudio, 'descrizione', TITOLI_STUDIO)
+        self.professioni_attuali = self.lookup(ProfessioneAttuale, 'descrizione', PROFESSIONI)
+        self.professioni_passate = self.lookup(ProfessionePassata, 'descrizione', PROFESSIONI)
+        self.categorie = self.lookup(CategoriaCorso, 'nome', [n for n, _ in CATEGORIE],
+                                     **{n: {'ordine': o} for n, o in CATEGORIE})
+        self.gruppi = self.lookup(GruppoCorso, 'nome', GRUPPI)
+        for numero in [0, 1, 2, 3]:
+            Quadrimestre.objects.get_or_create(numero=numero)
+        self.quadrimestri = dict(Quadrimestre.objects.values_list('numero', 'pk'))
+        self.stdout.write(f"  • {len(COMUNI)} comuni, {len(TITOLI_STUDIO)} titoli, {len(PROFESSIONI)} professioni, {len(CATEGORIE)} categorie")
+
+    # ------------------------------------------------------------------------
+    # ANAGRAFICHE E CATALOGO
+    # ------------------------------------------------------------------------
+
+    def nuovo_iscritto(self, matricola, sesso, cognome, nascita, comune, indirizzo, telefono, coniugato):
+        rnd = self.rnd
+        nome = rnd.choice(NOMI_M if sesso == 'M' else NOMI_F)
+        comune_id, nome_comune, catastale = comune
+        cf = codice_fiscale(cognome, nome, sesso, nascita, catastale)
+        if cf in self.codici_fiscali or rnd.random() < 0.04:
+            # Omonimia perfetta o codice fiscale non comunicato, come nei dati reali
+            cf = None
+        else:
+            self.codici_fiscali.add(cf)
+        eta = self.primo_anno - nascita.year
+        pensionato = eta >= 62 or rnd.random() < 0.1
+        professione = rnd.choice(self.professioni_attuali) if not pensionato else None
+        assiduita = rnd.betavariate(6, 2)
+        self.assiduita[matricola] = assiduita
+        return Iscritto(
+            matricola=matricola, sesso=sesso, titolo='Sig.' if sesso == 'M' else 'Sig.ra',
+            nominativo=f"{cognome} {nome}", codice_fiscale=cf,
+            luogo_nascita=nome_comune if rnd.random() < 0.6 else rnd.choice(COMUNI)[0], data_nascita=nascita,
+            indirizzo=indirizzo, comune_id=comune_id,
+            telefono=telefono, cellulare=f"3{rnd.randint(20, 49)}{rnd.randint(1000000, 9999999)}" if rnd.random() < 0.8 else '',
+            email=f"{nome.split()[0].lower()}.{cognome.replace(' ', '').replace(chr(39), '').lower()}{matricola}@example.it" if rnd.random() < 0.5 else '',
+            ha_whatsapp=rnd.random() < 0.6,
+            titolo_studio_id=rnd.choices(self.titoli_studio, weights=[10, 25, 40, 20, 5])[0],
+            professione_attuale_id=professione,
+            professione_passata_id=rnd.choice(self.professioni_passate) if pensionato else None,
+            situazione='Coniugato/a' if coniugato else rnd.choice(['Celibe/Nubile', 'Vedovo/a', 'Vedovo/a', 'Divorziato/a', '']),
+            e_pensionato=pensionato,
+            riceve_posta=rnd.random() < 0.7,
+            e_collaboratore=rnd.random() < 0.02,
+            e_assistente=rnd.random() < 0.04,
+        )
+
+    def genera_iscritti(self):
+        """
+        Iscritti nati tra il 1935 e il 1970; circa il 30% entra in coppia con il
+        coniuge (stesso indirizzo e telefono, età vicine). I coniugi sono collegati
+        dopo l'inserimento con collega_coppie, in entrambe le direzioni.
+        """
+        rnd = self.rnd
+        blocchi = Blocchi(Iscritto, self.batch_size)
+        self.codici_fiscali = set()
+        self.assiduita = {}
+        coppie = []
+        primo = matricola = self.prossimo_id(Iscritto)
+        ultimo = primo + self.n_iscritti - 1
+        while matricola <= ultimo:
+            comune = rnd.choices(self.comuni, weights=self.pesi_comuni)[0]
+            indirizzo = f"{rnd.choice(VIE)} {rnd.randint(1, 180)}"
+            telefono = f"051{rnd.randint(300000, 699999)}" if rnd.random() < 0.5 else ''
+            nascita = date(rnd.randint(1935, 1970), rnd.randint(1, 12), rnd.randint(1, 28))
+            in_coppia = matricola < ultimo and rnd.random() < 0.3
+            sesso = 'M' if in_coppia else rnd.choices('MF', weights=[35, 65])[0]
+            blocchi.aggiungi(self.nuovo_iscritto(matricola, sesso, rnd.choice(COGNOMI), nascita, comune, indirizzo, telefono, in_coppia))
+            if in_coppia:
+                nascita_coniuge = nascita + timedelta(days=rnd.randint(-3 * 365, 6 * 365))
+                blocchi.aggiungi(self.nuovo_iscritto(matricola + 1, 'F', rnd.choice(COGNOMI), nascita_coniuge, comune, indirizzo, telefono, True))
+                coppie += [(matricola, matricola + 1), (matricola + 1, matricola)]
+                matricola += 1
+            matricola += 1
+        blocchi.flush()
+        self.matricole = list(range(primo, ultimo + 1))
+        self.assistenti = list(Iscritto.objects.filter(matricola__gte=primo, e_assistente=True).values_list('matricola', flat=True))
+        esito = collega_coppie(coppie, batch_size=self.batch_size)
+        self.conta('iscritti', blocchi.totale)
+        self.conta('coniugi', esito['collegati'] // 2)
+        self.stdout.write(f"  • {blocchi.totale} iscritti, {esito['collegati'] // 2} coppie di coniugi, {len(self.assistenti)} assistenti")
+
+    def genera_catalogo(self):
+        rnd = self.rnd
+        n_docenti = max(5, self.n_corsi // 3)
+        primo_docente = self.prossimo_id(Docente)
+        docenti = Blocchi(Docente, self.batch_size)
+        for i in range(n_docenti):
+            cognome, nome = rnd.choice(COGNOMI), rnd.choice(NOMI_M + NOMI_F)
+            docenti.aggiungi(Docente(
+                id=primo_docente + i, nome=f"{cognome} {nome}", titolo=rnd.choice(['Prof.', 'Prof.', 'Dott.', 'Dott.ssa', '']),
+                cellulare=f"3{rnd.randint(20, 49)}{rnd.randint(1000000, 9999999)}",
+                email=f"docente{primo_docente + i}@example.it",
+                comune_id=rnd.choices(self.comuni, weights=self.pesi_comuni)[0][0],
+                attivo=rnd.random() < 0.9,
+            ))
+        docenti.flush()
+        self.docenti = list(range(primo_docente, primo_docente + n_docenti))
+
+        primo_corso = self.prossimo_id(Corso)
+        codice = (Corso.objects.order_by('-codice').values_list('codice', flat=True).first() or 0) + 1
+        corsi = Blocchi(Corso, self.batch_size)
+        # Ogni corso ha un docente titolare e una popolarità che pesa le iscrizioni
+        self.corsi = []
+        for i in range(self.n_corsi):
+            categoria = rnd.choices(range(len(CATEGORIE)), weights=[35, 30, 25, 10])[0]
+            materia = rnd.choice(MATERIE[CATEGORIE[categoria][0]])
+            massimo = rnd.choice([None, 25, 30, 40, 60])
+            corsi.aggiungi(Corso(
+                id=primo_corso + i, codice=codice + i,
+                nome=f"{materia} {rnd.choice(LIVELLI)}",
+                descrizione=f"Corso di {materia.lower()}", categoria_id=self.categorie[categoria],
+                gruppo_id=rnd.choice(self.gruppi) if rnd.random() < 0.3 else None,
+                visibile=rnd.random() < 0.95, numero_min_partecipanti=rnd.choice([None, 8, 10]),
+                numero_max_partecipanti=massimo,
+            ))
+            self.corsi.append((primo_corso + i, rnd.choice(self.docenti), rnd.paretovariate(1.5)))
+        corsi.flush()
+        self.conta('docenti', docenti.totale)
+        self.conta('corsi', corsi.totale)
+        self.stdout.write(f"  • {docenti.totale} docenti, {corsi.totale} corsi")
+
+    # ------------------------------------------------------------------------
+    # ANNO ACCADEMICO: EDIZIONI, ISCRIZIONI, LEZIONI, PRESENZE
+    # ------------------------------------------------------------------------
+
+    def genera_anno(self, indice):
+        rnd = self.rnd
+        inizio_anno = self.primo_anno + indice
+        anno = AnnoAccademico.objects.create(
+            anno=f"{inizio_anno}-{inizio_anno + 1}", data_inizio=date(inizio_anno, 10, 1),
+            data_fine=date(inizio_anno + 1, 5, 31), attivo=indice == self.n_anni - 1,
+        )
+        chiusure = [(date(inizio_anno, 12, 22), date(inizio_anno + 1, 1, 6))]
+        periodi = {
+            0: (date(inizio_anno, 10, 1), date(inizio_anno + 1, 5, 15)),
+            1: (date(inizio_anno, 10, 1), date(inizio_anno + 1, 1, 31)),
+            2: (date(inizio_anno + 1, 2, 1), date(inizio_anno + 1, 5, 15)),
+            3: (date(inizio_anno, 10, 1), date(inizio_anno + 1, 5, 15)),
+        }
+
+        # Edizioni: l'85% dei corsi è attivo, il 10% dei corsi attivi ha una seconda edizione
+        edizioni = Blocchi(EdizioneCorso, self.batch_size)
+        id_edizione = self.prossimo_id(EdizioneCorso)
+        dettagli = []
+        for corso_id, docente_id, popolarita in self.corsi:
+            if rnd.random() >= 0.85:
+                continue
+            quadrimestri = [rnd.choices([0, 1, 2, 3], weights=PESI_QUADRIMESTRE)[0]]
+            if rnd.random() < 0.1:
+                quadrimestri.append(rnd.choice([q for q in (0, 1, 2, 3) if q != quadrimestri[0]]))
+            for q in quadrimestri:
+                giorni = sorted(rnd.sample(range(5), 1 if q in (0, 3) or rnd.random() < 0.6 else 2))
+                ora_inizio, ora_fine = rnd.choice(FASCE)
+                assistente = rnd.choice(self.assistenti) if self.assistenti and rnd.random() < 0.6 else None
+                vice = rnd.choice(self.assistenti) if assistente and rnd.random() < 0.3 else None
+                # Di norma insegna il titolare del corso, a volte un altro docente
+                docente_edizione = docente_id if rnd.random() < 0.9 else rnd.choice(self.docenti)
+                edizioni.aggiungi(EdizioneCorso(
+                    id=id_edizione, anno_accademico=anno, corso_id=corso_id, quadrimestre_id=self.quadrimestri[q],
+                    docente_id=docente_edizione,
+                    assistente_id=assistente, vice_assistente_id=vice if vice != assistente else None,
+                    giorni_settimana=', '.join(GIORNI[g] for g in giorni), ora_inizio=ora_inizio, ora_fine=ora_fine,
+                ))
+                dettagli.append((id_edizione, q, giorni, docente_edizione, popolarita))
+                id_edizione += 1
+        edizioni.flush()
+
+        # Iscrizioni annuali: ogni iscritto rinnova con probabilità legata alla sua assiduità
+        annuali = Blocchi(IscrizioneAnnoAccademico, self.batch_size)
+        ai_corsi = Blocchi(IscrizioneCorso, self.batch_size)
+        id_annuale = self.prossimo_id(IscrizioneAnnoAccademico)
+        id_ai_corsi = self.prossimo_id(IscrizioneCorso)
+        iscritti_edizione = {id_ed: [] for id_ed, *_ in dettagli}
+        pesi = list(accumulate(pop for *_, pop in dettagli))
+        id_edizioni = [id_ed for id_ed, *_ in dettagli]
+        attivi = [m for m in self.matricole if rnd.random() < 0.45 + 0.3 * self.assiduita[m]]
+        attivi.sort(key=lambda m: rnd.random())
+        apertura = date(inizio_anno, 9, 1)
+        for ricevuta, matricola in enumerate(attivi, start=1):
+            data_iscrizione = apertura + timedelta(days=(ricevuta * 75) // len(attivi))
+            annuali.aggiungi(IscrizioneAnnoAccademico(
+                id=id_annuale + ricevuta - 1, anno_accademico=anno, iscritto_id=matricola, numero_ricevuta=ricevuta, data_iscrizione=data_iscrizione,
+            ))
+            scelti = set()
+            for _ in range(min(len(id_edizioni), 1 + int(rnd.expovariate(1.0)))):
+                scelti.add(rnd.choices(id_edizioni, cum_weights=pesi)[0])
+            for id_ed in sorted(scelti):
+                iscritti_edizione[id_ed].append(matricola)
+                ai_corsi.aggiungi(IscrizioneCorso(
+                    id=id_ai_corsi, anno_accademico=anno, edizione_corso_id=id_ed, iscritto_id=matricola,
+                    numero_ricevuta=ricevuta, data_iscrizione=data_iscrizione,
+                ))
+                id_ai_corsi += 1
+        annuali.flush()
+        ai_corsi.flush()
+
+        # Lezioni settimanali nei giorni dell'edizione e presenze per ogni iscritto al corso
+        lezioni = Blocchi(Lezione, self.batch_size)
+        presenze = Blocchi(PresenzaLezione, self.batch_size, dopo=lezioni,
+                           colonne=['id', 'lezione_id', 'iscritto_id', 'presente'])
+        id_lezione = self.prossimo_id(Lezione)
+        id_presenza = self.prossimo_id(PresenzaLezione)
+        for id_ed, q, giorni, docente_id, _ in dettagli:
+            iscritti = iscritti_edizione[id_ed]
+            for numero, giorno in enumerate(giorni_lezione(*periodi[q], giorni, chiusure), start=1):
+                if rnd.random() < 0.05:
+                    continue  # lezione annullata
+                presenti = [m for m in iscritti if rnd.random() < self.assiduita[m]]
+                lezioni.aggiungi(Lezione(
+                    id=id_lezione, edizione_corso_id=id_ed, data_lezione=giorno, descrizione=f"Lezione {numero}",
+                    docente_id=docente_id if rnd.random() < 0.95 else rnd.choice(self.docenti),
+                    ore_lezione=Decimal('1.5'), numero_presenti=len(presenti),
+                ))
+                if self.presenze:
+                    presenti = set(presenti)
+                    for matricola in iscritti:
+                        presenze.aggiungi((id_presenza, id_lezione, matricola, matricola in presenti))
+                        id_presenza += 1
+                id_lezione += 1
+        presenze.flush()
+
+        for chiave, blocchi in [('edizioni', edizioni), ('isc_anno', annuali), ('isc_corso', ai_corsi),
+                                ('lezioni', lezioni), ('presenze', presenze)]:
+            self.conta(chiave, blocchi.totale)
+        self.stdout.write(f"  • {edizioni.totale} edizioni, {annuali.totale} iscrizioni annuali, {ai_corsi.totale} ai corsi")
+        self.stdout.write(f"  • {lezioni.totale} lezioni, {presenze.totale} presenze")
+
+    def verifica(self):
+        incoerenti, unidirezionali, autoriferiti = verifica_simmetria()
+        if incoerenti or unidirezionali or autoriferiti:
+            self.stdout.write(self.style.ERROR(f"  ✗ Coniugi non reciproci: {len(incoerenti) + len(unidirezionali) + len(autoriferiti)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("  ✓ Coniugi reciproci"))
+
+    def print_summary(self, durata):
+        self.stdout.write('\n' + '='*70)
+        self.stdout.write(self.style.SUCCESS("  RIEPILOGO DATI SINTETICI"))
+        self.stdout.write('='*70)
+        s = self.stats.get
+        self.stdout.write(f"  • Iscritti: {s('iscritti', 0)} ({s('coniugi', 0)} coppie di coniugi)")
+        self.stdout.write(f"  • Catalogo: {s('docenti', 0)} docenti, {s('corsi', 0)} corsi")
+        self.stdout.write(f"  • Didattica: {s('edizioni', 0)} edizioni, {s('lezioni', 0)} lezioni in {self.n_anni} anni")
+        self.stdout.write(f"  • Iscrizioni: {s('isc_anno', 0)} annuali, {s('isc_corso', 0)} ai corsi")
+        self.stdout.write(f"  • Presenze: {s('presenze', 0)}")
+        righe = sum(v for k, v in self.stats.items() if k not in ('coniugi', 'lookup'))
+        self.stdout.write(f"\n  Tempo totale: {durata:.1f}s ({righe / durata:.0f} righe/s)")
+        self.stdout.write('='*70 + '\n')
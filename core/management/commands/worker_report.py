@@ -0,0 +1,73 @@
+"""
+UNIGEST - Worker Report Command
+File: core/management/commands/worker_report.py
+Descrizione: Esegue i report e gli export accodati dalle viste (LavoroReport,
+core/lavori.py). Resta in ascolto e controlla la coda ogni --intervallo
+secondi; con --una-volta svuota la coda ed esce (per cron o per i test).
+Si possono avviare più worker insieme. SIGTERM e SIGINT fermano il worker
+alla fine del lavoro in corso.
+"""
+
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import lavori
+
+# Ogni quanti secondi rimettere in coda i lavori bloccati e cancellare i file scaduti
+MANUTENZIONE_OGNI = 300
+
+
+class Command(BaseCommand):
+    help = "Genera in background i report e gli export richiesti dall'interfaccia"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervallo', type=float, default=2, help='Secondi di attesa a coda vuota (default 2)')
+        parser.add_argument('--una-volta', action='store_true', help='Esegue i lavori in coda ed esce')
+
+    def handle(self, *args, **options):
+        self.fermo = False
+        if not options['una_volta']:
+            signal.signal(signal.SIGTERM, self.ferma)
+            signal.signal(signal.SIGINT, self.ferma)
+
+        worker = lavori.nome_worker()
+        self.stdout.write(self.style.MIGRATE_LABEL(f'\n--- Worker report {worker} ---'))
+        ultima_manutenzione = 0
+        eseguiti = 0
+
+        while not self.fermo:
+            close_old_connections()
+            if time.monotonic() - ultima_manutenzione > MANUTENZIONE_OGNI:
+                self.manutenzione()
+                ultima_manutenzione = time.monotonic()
+
+            lavoro = lavori.prendi_prossimo(worker)
+            if lavoro is None:
+                if options['una_volta']:
+                    break
+                time.sleep(options['intervallo'])
+                continue
+
+            inizio = time.perf_counter()
+            lavori.esegui(lavoro)
+            eseguiti += 1
+            durata = time.perf_counter() - inizio
+            if lavoro.stato == lavoro.STATO_COMPLETATO:
+                self.stdout.write(f"  ✓ {lavoro.descrizione} ({durata:.1f}s)")
+            else:
+                self.stdout.write(self.style.ERROR(f"  ✗ {lavoro.descrizione}: {lavoro.errore.strip().splitlines()[-1]}"))
+
+        self.stdout.write(self.style.SUCCESS(f"  ✓ Worker fermato, {eseguiti} lavori eseguiti"))
+
+    def manutenzione(self):
+        recuperati = lavori.recupera_bloccati()
+        if recuperati:
+            self.stdout.write(self.style.WARNING(f"  ⚠️ {recuperati} lavori interrotti rimessi in coda o chiusi"))
+        scaduti = lavori.pulisci_scaduti()
+        if scaduti:
+            self.stdout.write(f"  • {scaduti} report scaduti cancellati")
+
+    def ferma(self, signum, frame):
+        self.stdout.write("  • Arresto richiesto, termino il lavoro in corso")
+        self.fermo = True
@@ -0,0 +1,312 @@
+"""
+UNIGEST - Sorgenti legacy su file
+File: core/management/sorgente_file.py
+Descrizione: Lettura dei dati del vecchio database da un file mysqldump
+(.sql o .sql.gz) o da una cartella di CSV (uno per tabella, es. TAnagrafe.csv),
+senza un server MySQL. Usato da import_old_data --sorgente.
+
+Le sorgenti rispondono al sottoinsieme di SELECT usato dall'importazione:
+    SELECT [DISTINCT] * | col, ... FROM `Tabella`
+        [WHERE col IS NOT NULL AND col != valore ...] [ORDER BY col [ASC|DESC]]
+Le righe vengono lette in streaming: la memoria resta costante (tranne che
+per DISTINCT e ORDER BY, usati solo su colonne o tabelle piccole).
+"""
+
+import csv
+import gzip
+import os
+import re
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.core.management.base import CommandError
+
+
+QUERY = re.compile(
+    r"^\s*SELECT\s+(?P<distinct>DISTINCT\s+)?(?P<colonne>.+?)\s+FROM\s+[`\"]?(?P<tabella>\w+)[`\"]?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+[`\"]?(?P<ordine>\w+)[`\"]?(?:\s+(?P<verso>ASC|DESC))?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+CONDIZIONE = re.compile(
+    r"^[`\"]?(?P<colonna>\w+)[`\"]?\s+(?:IS\s+(?P<not>NOT\s+)?NULL|(?P<op>!=|<>|=)\s*(?P<valore>'(?:[^']|'')*'|-?\d+(?:\.\d+)?))$",
+    re.IGNORECASE
+)
+
+# mysqldump: nome tabella di CREATE TABLE / INSERT INTO e definizioni di colonna
+CREATE_TABLE = re.compile(rb"^CREATE TABLE\s+[`\"]?(\w+)[`\"]?")
+INSERT_INTO = re.compile(rb"^INSERT INTO\s+[`\"]?(\w+)[`\"]?\s*(?:\(([^)]*)\))?\s*VALUES\s*", re.IGNORECASE)
+COLONNA = re.compile(r"^\s*[`\"](\w+)[`\"]\s+(\w+)")
+# Un valore di una tupla VALUES (stringa con escape, NULL, numero) oppure la fine della tupla
+VALORE = re.compile(r"'((?:[^'\\]|\\.|'')*)'|(NULL)|([^,()'\s;]+)|(\))", re.DOTALL)
+ESCAPE = re.compile(r"\\(.)|''", re.DOTALL)
+ESCAPE_MYSQL = {'0': '\0', 'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'Z': '\x1a'}
+
+INTERO = re.compile(r"^-?(?:0|[1-9]\d*)$")
+DECIMALE = re.compile(r"^-?\d+\.\d+$")
+DATA_ORA = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$")
+
+
+def apri_sorgente(percorso, encoding='utf-8'):
+    """SorgenteCsv per una cartella, SorgenteDump per un file .sql / .sql.gz"""
+    if os.path.isdir(percorso):
+        return SorgenteCsv(percorso, encoding)
+    if os.path.isfile(percorso):
+        return SorgenteDump(percorso, encoding)
+    raise CommandError(f"Sorgente non trovata: {percorso}")
+
+
+def converti_data(testo, solo_data=False):
+    """Stringa di data/ora MySQL -> date o datetime, None per le date zero"""
+    if not testo or testo.startswith('0000-00-00'):
+        return None
+    valore = datetime.fromisoformat(testo)
+    return valore.date() if solo_data else valore
+
+
+class SorgenteLegacy:
+    """
+    Base comune: esegue il sottoinsieme di SELECT sopra le righe di una tabella,
+    fornite in streaming da righe_tabella() insieme ai nomi delle colonne.
+    """
+
+    descrizione = 'file'
+
+    def colonne(self, tabella):
+        raise NotImplementedError
+
+    def righe_tabella(self, tabella):
+        raise NotImplementedError
+
+    def esegui(self, sql):
+        match = QUERY.match(sql)
+        if not match:
+            raise CommandError(f"Query non supportata dalla sorgente su file: {sql}")
+        tabella = match.group('tabella')
+        nomi = [nome.lower() for nome in self.colonne(tabella)]
+
+        def indice(colonna):
+            try:
+                return nomi.index(colonna.strip('`" ').lower())
+            except ValueError:
+                raise CommandError(f"Colonna {colonna} assente in {tabella}")
+
+        proiezione = None
+        if match.group('colonne').strip() != '*':
+            proiezione = [indice(c) for c in match.group('colonne').split(',')]
+        condizioni = [self.condizione(c, indice) for c in re.split(r"\s+AND\s+", match.group('where') or '', flags=re.I) if c]
+
+        righe = (row for row in self.righe_tabella(tabella) if all(verifica(row) for verifica in condizioni))
+        if match.group('ordine'):
+            # Sulle righe intere, prima della proiezione: la colonna di ordinamento
+            # può non essere tra quelle selezionate. Come MySQL: i NULL vengono prima in ordine crescente
+            i = indice(match.group('ordine'))
+            righe = sorted(righe, key=lambda row: (row[i] is not None, row[i]),
+                           reverse=(match.group('verso') or '').upper() == 'DESC')
+        if proiezione is not None:
+            righe = (tuple(row[i] for i in proiezione) for row in righe)
+        if match.group('distinct'):
+            righe = iter(dict.fromkeys(righe))
+        yield from righe
+
+    @staticmethod
+    def condizione(testo, indice):
+        match = CONDIZIONE.match(testo.strip())
+        if not match:
+            raise CommandError(f"Condizione WHERE non supportata dalla sorgente su file: {testo}")
+        i = indice(match.group('colonna'))
+        if not match.group('op'):
+            if match.group('not'):
+                return lambda row: row[i] is not None
+            return lambda row: row[i] is None
+        letterale = match.group('valore')
+        valore = letterale[1:-1].replace("''", "'") if letterale.startswith("'") else Decimal(letterale)
+        uguale = match.group('op') == '='
+
+        def verifica(row):
+            campo = row[i]
+            if campo is None:
+                return False
+            # Confronto numero/stringa come MySQL: la stringa viene convertita in numero
+            if isinstance(campo, (int, float, Decimal)) and isinstance(valore, str):
+                numero = re.match(r"^\s*-?\d+(?:\.\d+)?", valore)
+                confronto = Decimal(numero.group()) if numero else Decimal(0)
+            elif isinstance(campo, str) and not isinstance(valore, str):
+                confronto = str(valore)
+            else:
+                confronto = valore
+            return (campo == confronto) == uguale
+        return verifica
+
+
+class SorgenteDump(SorgenteLegacy):
+    """
+    File mysqldump (anche compresso .gz). Una prima passata legge solo le righe
+    CREATE TABLE e la posizione delle INSERT di ogni tabella; le letture
+    successive partono direttamente dalla prima INSERT della tabella.
+    Ogni INSERT (una riga del file, al più --net-buffer-length di mysqldump)
+    viene analizzata tupla per tupla.
+    I valori vengono convertiti come farebbe il driver MySQL in base al tipo
+    della colonna (DATETIME/TIMESTAMP -> datetime, DATE -> date, DECIMAL -> Decimal).
+    """
+
+    def __init__(self, percorso, encoding='utf-8'):
+        self.percorso = percorso
+        self.encoding = encoding
+        self.descrizione = os.path.basename(percorso)
+        self.indice = None
+
+    def apri(self):
+        if self.percorso.endswith('.gz'):
+            return gzip.open(self.percorso, 'rb')
+        return open(self.percorso, 'rb')
+
+    def indicizza(self):
+        """Tabelle del dump: colonne (nome, tipo) e intervallo di byte delle INSERT"""
+        self.indice = {}
+        tabella_corrente = None
+        posizione = 0
+        with self.apri() as f:
+            for riga in f:
+                inizio, posizione = posizione, posizione + len(riga)
+                if tabella_corrente:
+                    colonna = COLONNA.match(riga.decode(self.encoding, 'replace'))
+                    if colonna:
+                        self.indice[tabella_corrente]['colonne'].append((colonna.group(1), colonna.group(2).lower()))
+                        continue
+                    tabella_corrente = None
+                if riga.startswith(b'CREATE TABLE'):
+                    nome = CREATE_TABLE.match(riga).group(1).decode()
+                    self.indice.setdefault(nome, {'colonne': [], 'inizio': None, 'fine': None})
+                    tabella_corrente = nome
+                elif riga.startswith(b'INSERT INTO'):
+                    match = INSERT_INTO.match(riga)
+                    nome = match.group(1).decode()
+                    voce = self.indice.setdefault(nome, {'colonne': [], 'inizio': None, 'fine': None})
+                    if not voce['colonne'] and match.group(2):
+                        voce['colonne'] = [(c.strip(' `"'), '') for c in match.group(2).decode().split(',')]
+                    if voce['inizio'] is None:
+                        voce['inizio'] = inizio
+                    voce['fine'] = posizione
+
+    def tabella(self, tabella):
+        if self.indice is None:
+            self.indicizza()
+        for nome, voce in self.indice.items():
+            if nome.lower() == tabella.lower():
+                return voce
+        raise CommandError(f"Tabella {tabella} assente nel dump {self.percorso}")
+
+    def colonne(self, tabella):
+        return [nome for nome, _ in self.tabella(tabella)['colonne']]
+
+    def righe_tabella(self, tabella):
+        voce = self.tabella(tabella)
+        if voce['inizio'] is None:
+            return
+        colonne = len(voce['colonne'])
+        # Solo le colonne che richiedono una conversione (date, decimali, testo)
+        conversioni = [(i, self.convertitore(tipo)) for i, (_, tipo) in enumerate(voce['colonne']) if self.convertitore(tipo)]
+        with self.apri() as f:
+            f.seek(voce['inizio'])
+            posizione = voce['inizio']
+            for riga in f:
+                posizione += len(riga)
+                match = INSERT_INTO.match(riga)
+                if match and match.group(1).decode().lower() == tabella.lower():
+                    for valori in self.tuple(riga[match.end():].decode(self.encoding, 'replace')):
+                        if conversioni and len(valori) == colonne:
+                            for i, converti in conversioni:
+                                if valori[i] is not None:
+                                    valori[i] = converti(valori[i])
+                        yield tuple(valori)
+                if posizione >= voce['fine']:
+                    break
+
+    @staticmethod
+    def tuple(testo):
+        """Tuple (come liste) di una clausola VALUES (...),(...);"""
+        valori = []
+        for stringa, null, letterale, chiusa in VALORE.findall(testo):
+            if chiusa:
+                yield valori
+                valori = []
+            elif null:
+                valori.append(None)
+            elif letterale:
+                valori.append(int(letterale) if INTERO.match(letterale) else Decimal(letterale))
+            else:
+                if '\\' in stringa or "''" in stringa:
+                    stringa = ESCAPE.sub(lambda m: ESCAPE_MYSQL.get(m.group(1), m.group(1)) if m.group(1) is not None else "'", stringa)
+                valori.append(stringa)
+
+    @staticmethod
+    def convertitore(tipo):
+        """Conversione del valore letto dal dump secondo il tipo di colonna, None se non serve"""
+        if tipo in ('datetime', 'timestamp'):
+            return converti_data
+        if tipo == 'date':
+            return lambda valore: converti_data(valore, solo_data=True)
+        if tipo == 'time':
+            return lambda valore: time.fromisoformat(valore) if valore else None
+        if tipo in ('float', 'double', 'real'):
+            return float
+        if tipo in ('char', 'varchar', 'text', 'tinytext', 'mediumtext', 'longtext'):
+            return str
+        return None
+
+
+class SorgenteCsv(SorgenteLegacy):
+    """
+    Cartella con un CSV per tabella (TAnagrafe.csv, TFrequenzaCorsi.csv, ...),
+    con i nomi delle colonne nella prima riga. Separatore (virgola o punto e
+    virgola) riconosciuto dall'intestazione. Non avendo tipi, i valori vengono
+    interpretati: vuoto -> NULL, interi senza zeri iniziali -> int (i telefoni
+    come 0571... restano testo), decimali -> float, date ISO -> datetime.
+    """
+
+    def __init__(self, cartella, encoding='utf-8'):
+        self.cartella = cartella
+        self.encoding = 'utf-8-sig' if encoding.lower().replace('_', '-') == 'utf-8' else encoding
+        self.descrizione = os.path.basename(os.path.normpath(cartella))
+        self.file = {
+            os.path.splitext(nome)[0].lower(): os.path.join(cartella, nome)
+            for nome in os.listdir(cartella) if nome.lower().endswith('.csv')
+        }
+
+    def percorso(self, tabella):
+        try:
+            return self.file[tabella.lower()]
+        except KeyError:
+            raise CommandError(f"File {tabella}.csv assente in {self.cartella}")
+
+    def apri(self, tabella):
+        f = open(self.percorso(tabella), newline='', encoding=self.encoding)
+        intestazione = f.readline()
+        f.seek(0)
+        separatore = ';' if intestazione.count(';') > intestazione.count(',') else ','
+        return f, csv.reader(f, delimiter=separatore)
+
+    def colonne(self, tabella):
+        f, reader = self.apri(tabella)
+        with f:
+            return next(reader, [])
+
+    def righe_tabella(self, tabella):
+        f, reader = self.apri(tabella)
+        with f:
+            next(reader, None)
+            for riga in reader:
+                yield tuple(self.valore(v) for v in riga)
+
+    @staticmethod
+    def valore(testo):
+        if testo == '':
+            return None
+        if INTERO.match(testo):
+            return int(testo)
+        if DECIMALE.match(testo):
+            return float(testo)
+        if DATA_ORA.match(testo):
+            return converti_data(testo)
+        return testo
@@ -0,0 +1,99 @@
+"""
+UNIGEST - Middleware
+File: core/middleware.py
+Descrizione: Risoluzione dell'anno accademico selezionato una sola volta per
+richiesta (request.anno_accademico), a partire da una cache di processo della
+tabella AnnoAccademico.
+
+La tabella è minuscola e cambia di rado: viene letta una volta per processo e
+riletta solo quando cambia la versione salvata nella cache di Django, che i
+segnali su AnnoAccademico rinnovano a ogni save/delete (così anche gli altri
+worker gunicorn se ne accorgono). La sessione viene scritta solo quando l'anno
+cambia e, per mantenere la scadenza scorrevole, al più una volta ogni
+SESSION_RINNOVO secondi invece che a ogni richiesta.
+"""
+
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from core.context_processors import calcola_anno_corrente
+from core.models import AnnoAccademico
+
+CHIAVE_SESSIONE = 'anno_accademico_id'
+CHIAVE_RINNOVO = 'rinnovata'
+CHIAVE_VERSIONE = 'anni_accademici:versione'
+
+_anni = {'versione': None, 'elenco': []}
+_lock = threading.Lock()
+
+
+def anni_accademici():
+    """Tutti gli anni accademici (dal più recente), dalla cache di processo"""
+    versione = cache.get(CHIAVE_VERSIONE)
+    if versione is None:
+        cache.add(CHIAVE_VERSIONE, uuid.uuid4().hex, None)
+        versione = cache.get(CHIAVE_VERSIONE)
+    if _anni['versione'] != versione:
+        with _lock:
+            if _anni['versione'] != versione:
+                # La versione è letta prima della query: una modifica concorrente forza una nuova lettura
+                _anni['elenco'] = list(AnnoAccademico.objects.order_by('-anno'))
+                _anni['versione'] = versione
+    return _anni['elenco']
+
+
+def invalida_anni_accademici():
+    """Forza la rilettura degli anni accademici in tutti i processi"""
+    cache.set(CHIAVE_VERSIONE, uuid.uuid4().hex, None)
+    _anni['versione'] = None
+
+
+def anno_per_id(anno_id):
+    """AnnoAccademico con l'id indicato dalla cache di processo, None se non esiste"""
+    return next((anno for anno in anni_accademici() if str(anno.id) == str(anno_id)), None)
+
+
+def risolvi_anno(request):
+    """
+    Anno selezionato in sessione; se manca o non esiste più: l'anno corrente per
+    data, poi quello marcato come attivo, poi il più recente.
+    La sessione viene aggiornata solo se il valore cambia.
+    """
+    anni = anni_accademici()
+    anno_id = request.session.get(CHIAVE_SESSIONE)
+    anno = anno_per_id(anno_id) if anno_id else None
+    if anno is None and anni:
+        corrente = calcola_anno_corrente()
+        anno = (next((a for a in anni if a.anno == corrente), None)
+                or next((a for a in anni if a.attivo), None)
+                or anni[0])
+    if anno and anno.id != anno_id:
+        request.session[CHIAVE_SESSIONE] = anno.id
+    return anno
+
+
+class AnnoAccademicoMiddleware:
+    """
+    Espone request.anno_accademico, risolto in modo pigro alla prima lettura.
+    Va inserito dopo SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rinnovo = getattr(settings, 'SESSION_RINNOVO', 3600)
+
+    def __call__(self, request):
+        request.anno_accademico = SimpleLazyObject(lambda: risolvi_anno(request))
+        response = self.get_response(request)
+
+        # Scadenza scorrevole della sessione senza SESSION_SAVE_EVERY_REQUEST:
+        # la sessione usata viene riscritta solo se l'ultimo rinnovo è più vecchio di SESSION_RINNOVO
+        sessione = getattr(request, 'session', None)
+        if sessione is not None and sessione.accessed and not sessione.is_empty():
+            adesso = int(time.time())
+            if sessione.modified or adesso - sessione.get(CHIAVE_RINNOVO, 0) > self.rinnovo:
+                sessione[CHIAVE_RINNOVO] = adesso
+        return response
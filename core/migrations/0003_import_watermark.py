@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_quadrimestre_numero'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabella', models.CharField(max_length=50, unique=True, verbose_name='Tabella Legacy')),
+                ('checksum', models.CharField(blank=True, help_text='CHECKSUM TABLE di MySQL: se invariato la tabella non viene riletta', max_length=40, verbose_name='Checksum Tabella')),
+                ('chiave_max', models.CharField(blank=True, max_length=100, verbose_name='Chiave Massima')),
+                ('righe', models.IntegerField(default=0, verbose_name='Righe Lette')),
+                ('nuove', models.IntegerField(default=0, verbose_name='Righe Nuove')),
+                ('modificate', models.IntegerField(default=0, verbose_name='Righe Modificate')),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True, verbose_name='Ultima Importazione')),
+            ],
+            options={
+                'verbose_name': 'Watermark Importazione',
+                'verbose_name_plural': 'Watermark Importazione',
+                'ordering': ['tabella'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportRigaLegacy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabella', models.CharField(max_length=50, verbose_name='Tabella Legacy')),
+                ('chiave', models.CharField(max_length=100, verbose_name='Chiave Riga')),
+                ('impronta', models.CharField(max_length=16, verbose_name='Impronta Contenuto')),
+            ],
+            options={
+                'verbose_name': 'Riga Legacy Importata',
+                'verbose_name_plural': 'Righe Legacy Importate',
+                'unique_together': {('tabella', 'chiave')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_import_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sezione', models.CharField(max_length=50, verbose_name='Sezione')),
+                ('tabella', models.CharField(blank=True, help_text="Vuoto per il checkpoint dell'intera sezione", max_length=50, verbose_name='Tabella Legacy')),
+                ('righe', models.IntegerField(default=0, verbose_name='Righe Consolidate')),
+                ('impronta', models.CharField(blank=True, help_text='Verifica alla ripresa che il vecchio DB non sia cambiato', max_length=16, verbose_name='Impronta Ultima Riga')),
+                ('completato', models.BooleanField(default=False, verbose_name='Completato')),
+                ('data_aggiornamento', models.DateTimeField(auto_now=True, verbose_name='Ultimo Aggiornamento')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint Importazione',
+                'verbose_name_plural': 'Checkpoint Importazione',
+                'ordering': ['sezione', 'tabella'],
+                'unique_together': {('sezione', 'tabella')},
+            },
+        ),
+    ]
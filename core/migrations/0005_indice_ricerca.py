@@ -0,0 +1,97 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:31
+
+import unicodedata
+from django.db import migrations, models
+
+# Su SQLite una tabella FTS5 a contenuto esterno, allineata a core_indicericerca da
+# trigger; su MySQL un indice FULLTEXT. Attenzione: se una migrazione futura ricrea
+# core_indicericerca su SQLite, i trigger vanno ricreati.
+SQLITE_CREA = [
+    "CREATE VIRTUAL TABLE core_indicericerca_fts USING fts5(testo, content='core_indicericerca', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER core_indicericerca_ai AFTER INSERT ON core_indicericerca BEGIN "
+    "INSERT INTO core_indicericerca_fts(rowid, testo) VALUES (new.id, new.testo); END",
+    "CREATE TRIGGER core_indicericerca_ad AFTER DELETE ON core_indicericerca BEGIN "
+    "INSERT INTO core_indicericerca_fts(core_indicericerca_fts, rowid, testo) VALUES ('delete', old.id, old.testo); END",
+    "CREATE TRIGGER core_indicericerca_au AFTER UPDATE ON core_indicericerca BEGIN "
+    "INSERT INTO core_indicericerca_fts(core_indicericerca_fts, rowid, testo) VALUES ('delete', old.id, old.testo); "
+    "INSERT INTO core_indicericerca_fts(rowid, testo) VALUES (new.id, new.testo); END",
+]
+SQLITE_ELIMINA = [
+    "DROP TRIGGER IF EXISTS core_indicericerca_ai",
+    "DROP TRIGGER IF EXISTS core_indicericerca_ad",
+    "DROP TRIGGER IF EXISTS core_indicericerca_au",
+    "DROP TABLE IF EXISTS core_indicericerca_fts",
+]
+MYSQL_CREA = ["ALTER TABLE core_indicericerca ADD FULLTEXT INDEX core_indicericerca_testo_ft (testo)"]
+MYSQL_ELIMINA = ["ALTER TABLE core_indicericerca DROP INDEX core_indicericerca_testo_ft"]
+
+
+def esegui(istruzioni):
+    def operazione(apps, schema_editor):
+        for sql in istruzioni.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operazione
+
+
+# Campi indicizzati per tipo in questa versione dello schema (vedi core.ricerca.TIPI)
+TIPI = {
+    'iscritto': ('Iscritto', ['nominativo', 'codice_fiscale']),
+    'docente': ('Docente', ['nome']),
+    'corso': ('Corso', ['nome', 'descrizione']),
+}
+BATCH_SIZE = 1000
+
+
+def normalizza(testo):
+    """Come core.ricerca.normalizza, copiata qui perché la migrazione non cambi con il modulo"""
+    scomposto = unicodedata.normalize('NFKD', testo or '')
+    return ''.join(c for c in scomposto if not unicodedata.combining(c)).lower()
+
+
+def popola_indice(apps, schema_editor):
+    """Voci dell'indice per i dati esistenti, con i modelli storici e la connessione della migrazione"""
+    alias = schema_editor.connection.alias
+    indice = apps.get_model('core', 'IndiceRicerca')
+    indice.objects.using(alias).all().delete()
+    for tipo, (modello, campi) in TIPI.items():
+        righe = apps.get_model('core', modello).objects.using(alias).order_by().values_list('pk', *campi)
+        blocco = []
+        for pk, *valori in righe.iterator(chunk_size=BATCH_SIZE):
+            blocco.append(indice(tipo=tipo, oggetto_id=pk, testo=normalizza(' '.join(str(v or '') for v in valori))))
+            if len(blocco) >= BATCH_SIZE:
+                indice.objects.using(alias).bulk_create(blocco)
+                blocco = []
+        indice.objects.using(alias).bulk_create(blocco)
+    if schema_editor.connection.vendor == 'sqlite':
+        # Compatta i segmenti FTS5 lasciati dagli inserimenti a blocchi
+        schema_editor.execute("INSERT INTO core_indicericerca_fts(core_indicericerca_fts) VALUES ('optimize')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndiceRicerca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('iscritto', 'Iscritto'), ('docente', 'Docente'), ('corso', 'Corso')], max_length=10, verbose_name='Tipo')),
+                ('oggetto_id', models.IntegerField(verbose_name='ID Oggetto')),
+                ('testo', models.TextField(verbose_name='Testo Indicizzato')),
+            ],
+            options={
+                'verbose_name': 'Voce Indice Ricerca',
+                'verbose_name_plural': 'Indice Ricerca',
+                'unique_together': {('tipo', 'oggetto_id')},
+            },
+        ),
+        migrations.RunPython(
+            esegui({'sqlite': SQLITE_CREA, 'mysql': MYSQL_CREA}),
+            esegui({'sqlite': SQLITE_ELIMINA, 'mysql': MYSQL_ELIMINA}),
+        ),
+        migrations.RunPython(popola_indice, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:40
+
+import unicodedata
+from django.db import migrations
+
+# Il testo degli iscritti ora comprende la matricola: l'indice va rigenerato
+TIPI = {
+    'iscritto': ('Iscritto', ['matricola', 'nominativo', 'codice_fiscale']),
+    'docente': ('Docente', ['nome']),
+    'corso': ('Corso', ['nome', 'descrizione']),
+}
+BATCH_SIZE = 1000
+
+
+def normalizza(testo):
+    """Come core.ricerca.normalizza, copiata qui perché la migrazione non cambi con il modulo"""
+    scomposto = unicodedata.normalize('NFKD', testo or '')
+    return ''.join(c for c in scomposto if not unicodedata.combining(c)).lower()
+
+
+def popola_indice(apps, schema_editor):
+    """Voci dell'indice per i dati esistenti, con i modelli storici e la connessione della migrazione"""
+    alias = schema_editor.connection.alias
+    indice = apps.get_model('core', 'IndiceRicerca')
+    indice.objects.using(alias).all().delete()
+    for tipo, (modello, campi) in TIPI.items():
+        righe = apps.get_model('core', modello).objects.using(alias).order_by().values_list('pk', *campi)
+        blocco = []
+        for pk, *valori in righe.iterator(chunk_size=BATCH_SIZE):
+            blocco.append(indice(tipo=tipo, oggetto_id=pk, testo=normalizza(' '.join(str(v or '') for v in valori))))
+            if len(blocco) >= BATCH_SIZE:
+                indice.objects.using(alias).bulk_create(blocco)
+                blocco = []
+        indice.objects.using(alias).bulk_create(blocco)
+    if schema_editor.connection.vendor == 'sqlite':
+        # Compatta i segmenti FTS5 lasciati dagli inserimenti a blocchi
+        schema_editor.execute("INSERT INTO core_indicericerca_fts(core_indicericerca_fts) VALUES ('optimize')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_indice_ricerca'),
+    ]
+
+    operations = [
+        migrations.RunPython(popola_indice, migrations.RunPython.noop),
+    ]
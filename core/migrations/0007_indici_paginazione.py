@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_indice_ricerca_matricola'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='iscrizioneannoaccademico',
+            index=models.Index(fields=['anno_accademico', 'data_iscrizione'], name='core_iscriz_anno_ac_3abf99_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lezione',
+            index=models.Index(fields=['data_lezione', 'edizione_corso'], name='core_lezion_data_le_676dc8_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def popola_contatori(apps, schema_editor):
+    EdizioneCorso = apps.get_model('core', 'EdizioneCorso')
+
+    def conteggio(nome_modello):
+        modello = apps.get_model('core', nome_modello)
+        return Coalesce(Subquery(
+            modello.objects.filter(
+                edizione_corso=OuterRef('pk')
+            ).order_by().values('edizione_corso').annotate(n=Count('pk')).values('n')
+        ), Value(0))
+
+    EdizioneCorso.objects.update(
+        numero_iscritti=conteggio('IscrizioneCorso'),
+        numero_lezioni=conteggio('Lezione'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_indici_paginazione'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edizionecorso',
+            name='numero_iscritti',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Numero Iscritti'),
+        ),
+        migrations.AddField(
+            model_name='edizionecorso',
+            name='numero_lezioni',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Numero Lezioni'),
+        ),
+        migrations.RunPython(popola_contatori, migrations.RunPython.noop),
+    ]
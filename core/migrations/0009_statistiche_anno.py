@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_contatori_edizione'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticheAnno',
+            fields=[
+                ('anno_accademico', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistiche', serialize=False, to='core.annoaccademico', verbose_name='Anno Accademico')),
+                ('totale_iscritti', models.PositiveIntegerField(default=0, verbose_name='Iscritti Anno')),
+                ('totale_edizioni', models.PositiveIntegerField(default=0, verbose_name='Edizioni Corsi')),
+                ('totale_iscrizioni_corso', models.PositiveIntegerField(default=0, verbose_name='Iscrizioni Corsi')),
+                ('totale_lezioni', models.PositiveIntegerField(default=0, verbose_name='Lezioni')),
+                ('presenza_media', models.FloatField(default=0, verbose_name='Presenza Media')),
+                ('edizioni_per_categoria', models.JSONField(default=list, verbose_name='Edizioni per Categoria')),
+                ('per_categoria', models.JSONField(default=list, verbose_name='Iscrizioni per Categoria')),
+                ('top_corsi', models.JSONField(default=list, verbose_name='Corsi più Frequentati')),
+                ('versione', models.PositiveIntegerField(default=0, verbose_name='Versione Dati')),
+                ('versione_calcolo', models.PositiveIntegerField(blank=True, null=True, verbose_name='Versione Calcolata')),
+                ('data_calcolo', models.DateTimeField(blank=True, null=True, verbose_name='Data Calcolo')),
+            ],
+            options={
+                'verbose_name': 'Statistiche Anno',
+                'verbose_name_plural': 'Statistiche Anni',
+                'ordering': ['-anno_accademico__anno'],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0009_statistiche_anno'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LavoroReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=30, verbose_name='Tipo Report')),
+                ('parametri', models.JSONField(blank=True, default=dict, verbose_name='Parametri')),
+                ('chiave', models.CharField(db_index=True, help_text='Tipo e parametri: una richiesta uguale a una in attesa la riusa', max_length=100, verbose_name='Chiave')),
+                ('descrizione', models.CharField(max_length=255, verbose_name='Descrizione')),
+                ('stato', models.CharField(choices=[('in_coda', 'In coda'), ('in_corso', 'In corso'), ('completato', 'Completato'), ('errore', 'Errore')], default='in_coda', max_length=10, verbose_name='Stato')),
+                ('tentativi', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativi')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('errore', models.TextField(blank=True, verbose_name='Errore')),
+                ('file', models.FileField(blank=True, upload_to='report/%Y/%m/', verbose_name='File')),
+                ('nome_file', models.CharField(blank=True, max_length=255, verbose_name='Nome File')),
+                ('data_creazione', models.DateTimeField(auto_now_add=True, verbose_name='Data Richiesta')),
+                ('data_inizio', models.DateTimeField(blank=True, null=True, verbose_name='Inizio Elaborazione')),
+                ('data_fine', models.DateTimeField(blank=True, null=True, verbose_name='Fine Elaborazione')),
+                ('scadenza', models.DateTimeField(blank=True, null=True, verbose_name='Scadenza File')),
+                ('richiesto_da', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Richiesto da')),
+            ],
+            options={
+                'verbose_name': 'Report in Background',
+                'verbose_name_plural': 'Report in Background',
+                'ordering': ['-data_creazione'],
+                'indexes': [models.Index(fields=['stato', 'data_creazione'], name='core_lavoro_stato_9791bb_idx')],
+            },
+        ),
+    ]
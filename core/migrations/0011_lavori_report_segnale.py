@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_lavori_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lavororeport',
+            name='data_segnale',
+            field=models.DateTimeField(blank=True, help_text='Aggiornata dal worker mentre il lavoro è in corso', null=True, verbose_name='Ultimo Segnale'),
+        ),
+    ]
@@ -4,9 +4,10 @@ File: core/models.py
 Descrizione: Modelli del database per il gestionale università adulti
 """
 
-from django.db import models
+from django.db import models, router, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.urls import reverse
+from django.utils import timezone
 from datetime import date
 
 
@@ -379,6 +380,12 @@ class EdizioneCorso(models.Model):
     # Info aggiuntive
     note = models.TextField(blank=True, verbose_name="Note")
     
+    # Contatori denormalizzati, aggiornati dai segnali di IscrizioneCorso e Lezione (core/contatori.py)
+    numero_iscritti = models.PositiveIntegerField(default=0, editable=False, verbose_name="Numero Iscritti")
+    numero_lezioni = models.PositiveIntegerField(default=0, editable=False, verbose_name="Numero Lezioni")
+    
+    CONTATORI = ('numero_iscritti', 'numero_lezioni')
+    
     class Meta:
         verbose_name = "Edizione Corso"
         verbose_name_plural = "Edizioni Corsi"
@@ -396,21 +403,56 @@ class EdizioneCorso(models.Model):
         """Restituisce la descrizione personalizzata o quella del corso master"""
         return self.descrizione_custom if self.descrizione_custom else self.corso.descrizione
     
-    @property
-    def numero_iscritti(self):
-        """Conta il numero di iscritti a questa edizione"""
-        return self.iscrizioni.count()
-    
-    @property
-    def numero_lezioni(self):
-        """Conta il numero di lezioni effettuate"""
-        return self.lezioni.count()
+    def save(self, *args, **kwargs):
+        # I contatori cambiano solo con UPDATE incrementali: il salvataggio di un'edizione
+        # letta prima di una nuova iscrizione non deve riportarli al valore vecchio.
+        # Prima di riscrivere tutti i campi si rileggono quelli salvati, a riga bloccata;
+        # update_fields esplicito e riga mancante (inserita) restano come in Django.
+        if self._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+            super().save(*args, **kwargs)
+            return
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            salvati = type(self)._base_manager.using(using).select_for_update().filter(
+                pk=self.pk
+            ).values(*self.CONTATORI).first()
+            for campo, valore in (salvati or {}).items():
+                setattr(self, campo, valore)
+            super().save(*args, **kwargs)
 
 
 # ============================================================================
 # MODELLI ISCRIZIONI E PRESENZE
 # ============================================================================
 
+class ContatoEdizioneMixin:
+    """
+    Per i modelli contati da un contatore di EdizioneCorso (IscrizioneCorso, Lezione):
+    il salvataggio è in transazione con l'aggiornamento del contatore fatto dal
+    segnale post_save, e l'edizione letta dal database resta disponibile per
+    accorgersi di uno spostamento su un'altra edizione.
+    """
+    # Edizione esclusa dalla lettura con only()/defer(): quella salvata non è nota
+    EDIZIONE_NON_LETTA = object()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        istanza = super().from_db(db, field_names, values)
+        istanza._edizione_corso_id_db = istanza.__dict__.get('edizione_corso_id', cls.EDIZIONE_NON_LETTA)
+        return istanza
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            if (getattr(self, '_edizione_corso_id_db', None) is self.EDIZIONE_NON_LETTA
+                    and 'edizione_corso_id' in self.__dict__):
+                # Edizione assegnata dopo una lettura che la escludeva: quella salvata va letta ora
+                self._edizione_corso_id_db = type(self)._base_manager.using(using).filter(
+                    pk=self.pk
+                ).values_list('edizione_corso_id', flat=True).first()
+            super().save(*args, **kwargs)
+
+
 class IscrizioneAnnoAccademico(models.Model):
     """
     Modello per l'iscrizione annuale di uno studente
@@ -430,12 +472,16 @@ class IscrizioneAnnoAccademico(models.Model):
         verbose_name_plural = "Iscrizioni Anno Accademico"
         ordering = ['-anno_accademico', 'data_iscrizione']
         unique_together = ['anno_accademico', 'iscritto']
+        indexes = [
+            # Paginazione a chiave della lista iscrizioni di un anno
+            models.Index(fields=['anno_accademico', 'data_iscrizione']),
+        ]
     
     def __str__(self):
         return f"{self.iscritto.nominativo} - {self.anno_accademico}"
 
 
-class IscrizioneCorso(models.Model):
+class IscrizioneCorso(ContatoEdizioneMixin, models.Model):
     """
     Modello per l'iscrizione di uno studente a un corso specifico
     Corrisponde a TFrequenzaCorsi nel vecchio database
@@ -461,7 +507,7 @@ class IscrizioneCorso(models.Model):
         return f"{self.iscritto.nominativo} - {self.edizione_corso}"
 
 
-class Lezione(models.Model):
+class Lezione(ContatoEdizioneMixin, models.Model):
     """
     Modello per le singole lezioni di un corso
     Corrisponde a TPresenzeCorsisti nel vecchio database
@@ -487,6 +533,10 @@ class Lezione(models.Model):
         verbose_name_plural = "Lezioni"
         ordering = ['-data_lezione', 'edizione_corso']
         unique_together = ['edizione_corso', 'data_lezione']
+        indexes = [
+            # Paginazione a chiave della lista lezioni (dalla più recente)
+            models.Index(fields=['data_lezione', 'edizione_corso']),
+        ]
     
     def __str__(self):
         return f"{self.edizione_corso.corso.nome} - {self.data_lezione.strftime('%d/%m/%Y')}"
@@ -513,3 +563,221 @@ class PresenzaLezione(models.Model):
     def __str__(self):
         stato = "Presente" if self.presente else "Assente"
         return f"{self.iscritto.nominativo} - {stato}"
+
+
+# ============================================================================
+# MODELLI DI SERVIZIO PER L'IMPORTAZIONE DAL VECCHIO DATABASE
+# ============================================================================
+
+class ImportWatermark(models.Model):
+    """
+    Stato dell'ultima importazione incrementale di una tabella legacy
+    (usato da import_old_data --incrementale)
+    """
+    tabella = models.CharField(max_length=50, unique=True, verbose_name="Tabella Legacy")
+    checksum = models.CharField(max_length=40, blank=True, verbose_name="Checksum Tabella",
+                                help_text="CHECKSUM TABLE di MySQL: se invariato la tabella non viene riletta")
+    chiave_max = models.CharField(max_length=100, blank=True, verbose_name="Chiave Massima")
+    righe = models.IntegerField(default=0, verbose_name="Righe Lette")
+    nuove = models.IntegerField(default=0, verbose_name="Righe Nuove")
+    modificate = models.IntegerField(default=0, verbose_name="Righe Modificate")
+    data_aggiornamento = models.DateTimeField(auto_now=True, verbose_name="Ultima Importazione")
+
+    class Meta:
+        verbose_name = "Watermark Importazione"
+        verbose_name_plural = "Watermark Importazione"
+        ordering = ['tabella']
+
+    def __str__(self):
+        return f"{self.tabella} ({self.righe} righe)"
+
+
+class ImportRigaLegacy(models.Model):
+    """
+    Impronta del contenuto di ogni riga legacy già importata, per riconoscere
+    alla successiva esecuzione le righe nuove o modificate
+    """
+    tabella = models.CharField(max_length=50, verbose_name="Tabella Legacy")
+    chiave = models.CharField(max_length=100, verbose_name="Chiave Riga")
+    impronta = models.CharField(max_length=16, verbose_name="Impronta Contenuto")
+
+    class Meta:
+        verbose_name = "Riga Legacy Importata"
+        verbose_name_plural = "Righe Legacy Importate"
+        unique_together = ['tabella', 'chiave']
+
+    def __str__(self):
+        return f"{self.tabella}[{self.chiave}]"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Avanzamento dell'ultima importazione, per sezione e per tabella letta,
+    aggiornato a ogni blocco consolidato (usato da import_old_data --resume)
+    """
+    sezione = models.CharField(max_length=50, verbose_name="Sezione")
+    tabella = models.CharField(max_length=50, blank=True, verbose_name="Tabella Legacy",
+                               help_text="Vuoto per il checkpoint dell'intera sezione")
+    righe = models.IntegerField(default=0, verbose_name="Righe Consolidate")
+    impronta = models.CharField(max_length=16, blank=True, verbose_name="Impronta Ultima Riga",
+                                help_text="Verifica alla ripresa che il vecchio DB non sia cambiato")
+    completato = models.BooleanField(default=False, verbose_name="Completato")
+    data_aggiornamento = models.DateTimeField(auto_now=True, verbose_name="Ultimo Aggiornamento")
+
+    class Meta:
+        verbose_name = "Checkpoint Importazione"
+        verbose_name_plural = "Checkpoint Importazione"
+        unique_together = ['sezione', 'tabella']
+        ordering = ['sezione', 'tabella']
+
+    def __str__(self):
+        stato = "completato" if self.completato else f"{self.righe} righe"
+        return f"{self.sezione}{f' / {self.tabella}' if self.tabella else ''} ({stato})"
+
+
+# ============================================================================
+# INDICE DI RICERCA
+# ============================================================================
+
+class IndiceRicerca(models.Model):
+    """
+    Testo normalizzato (minuscolo, senza accenti) di iscritti, docenti e corsi
+    per la ricerca globale. Su SQLite è indicizzato da una tabella FTS5 a
+    contenuto esterno, su MySQL da un indice FULLTEXT (migrazione 0005).
+    Aggiornato dai segnali dei modelli, ricostruibile con ricostruisci_indice_ricerca.
+    """
+    TIPO_CHOICES = [
+        ('iscritto', 'Iscritto'),
+        ('docente', 'Docente'),
+        ('corso', 'Corso'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, verbose_name="Tipo")
+    oggetto_id = models.IntegerField(verbose_name="ID Oggetto")
+    testo = models.TextField(verbose_name="Testo Indicizzato")
+
+    class Meta:
+        verbose_name = "Voce Indice Ricerca"
+        verbose_name_plural = "Indice Ricerca"
+        unique_together = ['tipo', 'oggetto_id']
+
+    def __str__(self):
+        return f"{self.tipo}[{self.oggetto_id}]"
+
+
+# ============================================================================
+# STATISTICHE PRECALCOLATE
+# ============================================================================
+
+class StatisticheAnno(models.Model):
+    """
+    Statistiche di un anno accademico già calcolate (totali, categorie, top corsi,
+    presenza media), lette da statistiche_anno, dashboard e dal confronto tra anni.
+    Ogni scrittura che riguarda l'anno incrementa versione (core/statistiche.py):
+    la riga è valida finché versione_calcolo coincide con versione, quindi gli anni
+    chiusi si leggono sempre da qui e quello in corso viene ricalcolato alla prima
+    lettura dopo una modifica. Si popola con aggiorna_statistiche.
+    """
+    anno_accademico = models.OneToOneField(AnnoAccademico, on_delete=models.CASCADE, primary_key=True,
+                                           related_name='statistiche', verbose_name="Anno Accademico")
+
+    # Totali
+    totale_iscritti = models.PositiveIntegerField(default=0, verbose_name="Iscritti Anno")
+    totale_edizioni = models.PositiveIntegerField(default=0, verbose_name="Edizioni Corsi")
+    totale_iscrizioni_corso = models.PositiveIntegerField(default=0, verbose_name="Iscrizioni Corsi")
+    totale_lezioni = models.PositiveIntegerField(default=0, verbose_name="Lezioni")
+    presenza_media = models.FloatField(default=0, verbose_name="Presenza Media")
+
+    # Dettagli, nella forma usata dai template
+    edizioni_per_categoria = models.JSONField(default=list, verbose_name="Edizioni per Categoria")
+    per_categoria = models.JSONField(default=list, verbose_name="Iscrizioni per Categoria")
+    top_corsi = models.JSONField(default=list, verbose_name="Corsi più Frequentati")
+
+    # Validità
+    versione = models.PositiveIntegerField(default=0, verbose_name="Versione Dati")
+    versione_calcolo = models.PositiveIntegerField(null=True, blank=True, verbose_name="Versione Calcolata")
+    data_calcolo = models.DateTimeField(null=True, blank=True, verbose_name="Data Calcolo")
+
+    class Meta:
+        verbose_name = "Statistiche Anno"
+        verbose_name_plural = "Statistiche Anni"
+        ordering = ['-anno_accademico__anno']
+
+    def __str__(self):
+        return f"Statistiche {self.anno_accademico}"
+
+    @property
+    def aggiornate(self):
+        return self.versione_calcolo == self.versione
+
+
+# ============================================================================
+# REPORT IN BACKGROUND
+# ============================================================================
+
+class LavoroReport(models.Model):
+    """
+    Report o export richiesto dall'interfaccia e generato dal comando worker_report
+    fuori dal ciclo della richiesta (core/lavori.py). Il file prodotto è salvato
+    in MEDIA_ROOT e resta scaricabile fino alla scadenza.
+    """
+    STATO_IN_CODA = 'in_coda'
+    STATO_IN_CORSO = 'in_corso'
+    STATO_COMPLETATO = 'completato'
+    STATO_ERRORE = 'errore'
+    STATO_CHOICES = [
+        (STATO_IN_CODA, 'In coda'),
+        (STATO_IN_CORSO, 'In corso'),
+        (STATO_COMPLETATO, 'Completato'),
+        (STATO_ERRORE, 'Errore'),
+    ]
+
+    tipo = models.CharField(max_length=30, verbose_name="Tipo Report")
+    parametri = models.JSONField(default=dict, blank=True, verbose_name="Parametri")
+    chiave = models.CharField(max_length=100, db_index=True, verbose_name="Chiave",
+                              help_text="Tipo e parametri: una richiesta uguale a una in attesa la riusa")
+    descrizione = models.CharField(max_length=255, verbose_name="Descrizione")
+    richiesto_da = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True,
+                                     verbose_name="Richiesto da")
+
+    # Esecuzione
+    stato = models.CharField(max_length=10, choices=STATO_CHOICES, default=STATO_IN_CODA, verbose_name="Stato")
+    tentativi = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativi")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+    errore = models.TextField(blank=True, verbose_name="Errore")
+
+    # Risultato
+    file = models.FileField(upload_to='report/%Y/%m/', blank=True, verbose_name="File")
+    nome_file = models.CharField(max_length=255, blank=True, verbose_name="Nome File")
+
+    # Tempi
+    data_creazione = models.DateTimeField(auto_now_add=True, verbose_name="Data Richiesta")
+    data_inizio = models.DateTimeField(null=True, blank=True, verbose_name="Inizio Elaborazione")
+    data_fine = models.DateTimeField(null=True, blank=True, verbose_name="Fine Elaborazione")
+    data_segnale = models.DateTimeField(null=True, blank=True, verbose_name="Ultimo Segnale",
+                                        help_text="Aggiornata dal worker mentre il lavoro è in corso")
+    scadenza = models.DateTimeField(null=True, blank=True, verbose_name="Scadenza File")
+
+    class Meta:
+        verbose_name = "Report in Background"
+        verbose_name_plural = "Report in Background"
+        ordering = ['-data_creazione']
+        indexes = [
+            # Prossimo lavoro in coda per il worker
+            models.Index(fields=['stato', 'data_creazione']),
+        ]
+
+    def __str__(self):
+        return f"{self.descrizione} ({self.get_stato_display()})"
+
+    def get_absolute_url(self):
+        return reverse('core:lavoro_report_detail', kwargs={'pk': self.pk})
+
+    @property
+    def in_attesa(self):
+        return self.stato in (self.STATO_IN_CODA, self.STATO_IN_CORSO)
+
+    @property
+    def scaricabile(self):
+        return (self.stato == self.STATO_COMPLETATO and bool(self.file)
+                and (self.scadenza is None or self.scadenza > timezone.now()))
@@ -0,0 +1,119 @@
+"""
+UNIGEST - Pacchetto dei report delle edizioni
+File: core/pacchetti.py
+Descrizione: Foglio presenze, elenco iscritti e registro lezioni di tutte le
+edizioni di un anno (o di un quadrimestre) in un unico ZIP.
+
+ReportLab è Python puro e usa un solo core: i PDF vengono generati da un pool
+di REPORT_PROCESSI processi (di default uno per core) e aggiunti allo ZIP man
+mano che sono pronti. Al pool vengono affidati al più IN_VOLO PDF per processo
+alla volta, quindi in memoria ci sono al più processi * IN_VOLO PDF, non
+l'intero pacchetto. Ogni processo
+passa dall'archivio di core/archivio_report.py: i PDF con dati invariati, già
+generati singolarmente o da un pacchetto precedente, non vengono rigenerati.
+Un PDF non riuscito non ferma il pacchetto: l'errore finisce in ERRORI.txt.
+"""
+
+import logging
+import multiprocessing
+import os
+import zipfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils.text import get_valid_filename
+from core.models import EdizioneCorso
+
+logger = logging.getLogger(__name__)
+
+# Report di ogni edizione, con i nomi di core/lavori.py
+TIPI_EDIZIONE = ('foglio_presenze', 'elenco_iscritti', 'registro_lezioni')
+# PDF per processo affidati al pool alla volta, tra in generazione e pronti da scrivere
+IN_VOLO = 2
+
+
+def edizioni(anno_id, quadrimestre=None):
+    """Edizioni dell'anno, eventualmente di un solo quadrimestre (numero)"""
+    queryset = EdizioneCorso.objects.filter(anno_accademico_id=anno_id)
+    if quadrimestre is not None:
+        queryset = queryset.filter(quadrimestre__numero=quadrimestre)
+    return queryset.select_related('corso', 'quadrimestre').order_by('corso__nome', 'quadrimestre__numero', 'pk')
+
+
+def _cartelle(elenco):
+    """Cartella nello ZIP di ogni edizione: nome del corso e quadrimestre, con l'id se si ripete"""
+    nomi = {edizione.pk: f'{edizione.corso.nome} - Q{edizione.quadrimestre.numero}' for edizione in elenco}
+    conteggio = Counter(nomi.values())
+    return {
+        pk: get_valid_filename(f'{nome} {pk}' if conteggio[nome] > 1 else nome)
+        for pk, nome in nomi.items()
+    }
+
+
+def _genera(tipo, edizione_id):
+    """Eseguita nei processi del pool: contenuto e nome del file del PDF"""
+    from core import lavori
+    file, nome_file = lavori.genera(tipo, edizione_id=edizione_id)
+    with file:
+        return file.read(), nome_file
+
+
+def _risultati(richieste, processi):
+    """(richiesta, contenuto, nome del file, errore) per ogni (tipo, edizione_id), in ordine di completamento"""
+    if processi == 1 or len(richieste) == 1:
+        for richiesta in richieste:
+            try:
+                yield (richiesta, *_genera(*richiesta), None)
+            except Exception as errore:
+                logger.exception("Report %s dell'edizione %s non riuscito", *richiesta)
+                yield richiesta, None, None, errore
+        return
+
+    # I processi figli aprono connessioni proprie; quelle del padre non vanno ereditate.
+    # spawn (invece di fork) non copia lock e socket del processo che avvia il pool.
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=processi, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+    ) as pool:
+        da_affidare = iter(richieste)
+        futuri = {}
+        while True:
+            for richiesta in islice(da_affidare, processi * IN_VOLO - len(futuri)):
+                futuri[pool.submit(_genera, *richiesta)] = richiesta
+            if not futuri:
+                break
+            completati, _ = wait(futuri, return_when=FIRST_COMPLETED)
+            for futuro in completati:
+                richiesta = futuri.pop(futuro)
+                try:
+                    yield (richiesta, *futuro.result(), None)
+                except Exception as errore:
+                    logger.error("Report %s dell'edizione %s non riuscito: %s", *richiesta, errore)
+                    yield richiesta, None, None, errore
+
+
+def scrivi_zip(file, anno_id, quadrimestre=None, processi=None):
+    """
+    Scrive su file (aperto in binario) lo ZIP con i report di ogni edizione,
+    una cartella per edizione. Restituisce (numero di PDF, errori).
+    """
+    processi = processi or getattr(settings, 'REPORT_PROCESSI', None) or os.cpu_count() or 1
+    elenco = list(edizioni(anno_id, quadrimestre))
+    cartelle = _cartelle(elenco)
+    richieste = [(tipo, edizione.pk) for edizione in elenco for tipo in TIPI_EDIZIONE]
+
+    scritti, errori = 0, []
+    # I PDF di ReportLab sono già compressi: ZIP_STORED evita di ricomprimerli
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as archivio:
+        for (tipo, edizione_id), contenuto, nome_file, errore in _risultati(richieste, processi):
+            if errore is not None:
+                errori.append(f'{cartelle[edizione_id]}: {tipo}: {errore}')
+                continue
+            archivio.writestr(f'{cartelle[edizione_id]}/{nome_file}', contenuto)
+            scritti += 1
+        if errori:
+            archivio.writestr('ERRORI.txt', '\n'.join(errori) + '\n')
+    return scritti, errori
@@ -0,0 +1,211 @@
+"""
+UNIGEST - Paginazione
+File: core/paginazione.py
+Descrizione: Paginazione a chiave (keyset/seek) per le liste più grandi.
+
+Invece di COUNT(*) + OFFSET, ogni pagina riparte dai valori della chiave di
+ordinamento dell'ultima (o prima) riga mostrata, passati nell'URL come cursore:
+WHERE chiave > ultimo_valore ORDER BY chiave LIMIT n. Con un indice sulla chiave
+la pagina 1.000 costa quanto la prima. Il totale, facoltativo, viene contato una
+volta per filtro e tenuto in cache finché non cambia la versione delle
+statistiche (core/statistiche.py), cioè fino alla prossima scrittura.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from core import statistiche
+
+PARAMETRI = ('dopo', 'prima', 'ultima', 'page')
+
+
+class Pagina:
+    """Una pagina letta a chiave: oggetti, link alle pagine vicine e totale (se contato)"""
+
+    def __init__(self, oggetti, per_pagina, numero, totale, successiva, precedente, parametri):
+        self.oggetti = oggetti
+        self.per_pagina = per_pagina
+        self.numero = numero
+        self.totale = totale
+        self.successiva = successiva
+        self.precedente = precedente
+        self.parametri = parametri
+
+    @property
+    def pagine(self):
+        if self.totale is None:
+            return None
+        return max((self.totale + self.per_pagina - 1) // self.per_pagina, 1)
+
+    def has_next(self):
+        return self.successiva is not None
+
+    def has_previous(self):
+        return self.precedente is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _url(self, **cursore):
+        return '?' + '&'.join(filter(None, [self.parametri, *(f'{k}={v}' for k, v in cursore.items())]))
+
+    @property
+    def url_prima(self):
+        return self._url()
+
+    @property
+    def url_ultima(self):
+        return self._url(ultima=1)
+
+    @property
+    def url_successiva(self):
+        return self._url(dopo=self.successiva) if self.successiva else None
+
+    @property
+    def url_precedente(self):
+        return self._url(prima=self.precedente) if self.precedente else None
+
+
+def codifica_cursore(valori, numero):
+    testo = json.dumps({'v': valori, 'n': numero}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(testo.encode()).decode().rstrip('=')
+
+
+def decodifica_cursore(cursore, lunghezza):
+    """
+    (valori, numero di pagina) dal cursore, None se non è valido: i valori devono
+    essere lunghezza (quanti i campi della chiave), scalari non nulli, e il numero
+    di pagina un intero
+    """
+    try:
+        testo = base64.urlsafe_b64decode(cursore + '=' * (-len(cursore) % 4))
+        dati = json.loads(testo)
+        valori, numero = dati['v'], dati.get('n')
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if not isinstance(valori, list) or len(valori) != lunghezza:
+        return None
+    if not all(isinstance(valore, (str, int, float)) for valore in valori):
+        return None
+    if numero is not None and (not isinstance(numero, int) or isinstance(numero, bool)):
+        return None
+    return valori, numero
+
+
+def condizione_seek(chiave, valori, indietro=False):
+    """
+    Righe che vengono dopo (o prima, con indietro) i valori indicati nell'ordinamento
+    chiave: (a > va) OR (a = va AND b > vb) OR ..., con < per i campi discendenti.
+    Il primo termine è ripetuto come intervallo (a >= va) perché il database
+    possa usare l'indice anche con la OR.
+    """
+    condizione = Q()
+    uguali = {}
+    for campo, valore in zip(chiave, valori):
+        nome = campo.lstrip('-')
+        operatore = 'gt' if campo.startswith('-') == indietro else 'lt'
+        condizione |= Q(**uguali, **{f'{nome}__{operatore}': valore})
+        uguali[nome] = valore
+    primo = chiave[0].lstrip('-')
+    operatore = 'gte' if chiave[0].startswith('-') == indietro else 'lte'
+    return Q(**{f'{primo}__{operatore}': valori[0]}) & condizione
+
+
+def inverti(chiave):
+    return [campo[1:] if campo.startswith('-') else f'-{campo}' for campo in chiave]
+
+
+def valori_chiave(oggetto, chiave):
+    return [getattr(oggetto, campo.lstrip('-')) for campo in chiave]
+
+
+def conta(queryset):
+    """COUNT del queryset, in cache fino alla prossima scrittura (versione delle statistiche)"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    impronta = hashlib.md5(f'{sql}|{params}|{statistiche.versione()}'.encode()).hexdigest()
+    chiave = f'paginazione:totale:{impronta}'
+    totale = cache.get(chiave)
+    if totale is None:
+        totale = queryset.count()
+        cache.set(chiave, totale, statistiche.TIMEOUT)
+    return totale
+
+
+def pagina_keyset(queryset, chiave, per_pagina, parametri, con_totale=True):
+    """
+    Pagina del queryset ordinato secondo chiave (campi non nulli, nel complesso
+    univoci: di solito l'ordinamento del modello più la chiave primaria).
+    parametri è request.GET: cursori dopo/prima, ultima=1 per l'ultima pagina;
+    gli altri parametri (filtri) vengono conservati nei link.
+    """
+    chiave = list(chiave)
+    totale = conta(queryset) if con_totale else None
+    pagine = max((totale + per_pagina - 1) // per_pagina, 1) if totale is not None else None
+
+    dopo = decodifica_cursore(parametri.get('dopo', ''), len(chiave))
+    prima = decodifica_cursore(parametri.get('prima', ''), len(chiave)) if not dopo else None
+    ultima = not dopo and not prima and parametri.get('ultima')
+    try:
+        oggetti, numero, ci_sono_precedenti, ci_sono_successive = _leggi(
+            queryset, chiave, per_pagina, pagine, dopo, prima, ultima
+        )
+    except (ValidationError, ValueError, TypeError):
+        # Valori del cursore non validi per i campi della chiave: si riparte dalla prima pagina
+        oggetti, numero, ci_sono_precedenti, ci_sono_successive = _leggi(
+            queryset, chiave, per_pagina, pagine, None, None, False
+        )
+
+    successiva = precedente = None
+    if oggetti and ci_sono_successive:
+        successiva = codifica_cursore(valori_chiave(oggetti[-1], chiave), numero)
+    if oggetti and ci_sono_precedenti:
+        precedente = codifica_cursore(valori_chiave(oggetti[0], chiave), numero)
+
+    filtri = parametri.copy()
+    for nome in PARAMETRI:
+        filtri.pop(nome, None)
+    return Pagina(oggetti, per_pagina, numero, totale, successiva, precedente, filtri.urlencode())
+
+
+def _leggi(queryset, chiave, per_pagina, pagine, dopo, prima, ultima):
+    """(oggetti, numero di pagina, ci sono pagine precedenti, ci sono pagine successive)"""
+    if prima or ultima:
+        # Lettura all'indietro, poi le righe vengono rimesse nell'ordine della lista
+        righe = queryset.order_by(*inverti(chiave))
+        if prima:
+            righe = righe.filter(condizione_seek(chiave, prima[0], indietro=True))
+        righe = list(righe[:per_pagina + 1])
+        altre = len(righe) > per_pagina
+        oggetti = righe[:per_pagina][::-1]
+        numero = (prima[1] - 1 if prima[1] else None) if prima else pagine
+        ci_sono_precedenti, ci_sono_successive = altre, bool(prima)
+    else:
+        righe = queryset.order_by(*chiave)
+        if dopo:
+            righe = righe.filter(condizione_seek(chiave, dopo[0]))
+        righe = list(righe[:per_pagina + 1])
+        oggetti = righe[:per_pagina]
+        numero = (dopo[1] + 1 if dopo[1] else None) if dopo else 1
+        ci_sono_precedenti, ci_sono_successive = bool(dopo), len(righe) > per_pagina
+    return oggetti, numero, ci_sono_precedenti, ci_sono_successive
+
+
+class KeysetMixin:
+    """
+    Per le ListView: sostituisce il Paginator di Django (COUNT + OFFSET) con la
+    paginazione a chiave. chiave_keyset è l'ordinamento della lista; con
+    totale_keyset=False il totale non viene contato.
+    """
+    chiave_keyset = None
+    totale_keyset = True
+
+    def paginate_queryset(self, queryset, page_size):
+        pagina = pagina_keyset(
+            queryset, self.chiave_keyset, page_size, self.request.GET, con_totale=self.totale_keyset
+        )
+        return None, pagina, pagina.oggetti, pagina.has_other_pages()
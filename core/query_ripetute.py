@@ -0,0 +1,137 @@
+"""
+UNIGEST - Query ripetute
+File: core/query_ripetute.py
+Descrizione: Middleware facoltativo che segnala le richieste in cui la stessa
+query viene eseguita troppe volte (il classico N+1 di un ciclo su una relazione
+non precaricata), per staging o per un campione del traffico di produzione.
+
+Ogni istruzione SQL passa da un execute_wrapper che si limita a contarla per
+testo; solo a fine richiesta i testi distinti vengono ridotti a un'impronta
+(valori letterali e liste IN normalizzati) e raggruppati. Lo stack viene letto
+solo quando una query supera la soglia, quindi il costo per query resta quello
+di un incremento in un dizionario.
+
+Configurazione (.env):
+    QUERY_RIPETUTE_ATTIVO=True     # senza, il middleware si disattiva all'avvio
+    QUERY_RIPETUTE_SOGLIA=10       # segnala oltre questo numero di esecuzioni
+    QUERY_RIPETUTE_CAMPIONE=0.05   # frazione di richieste esaminate
+"""
+
+import logging
+import random
+import re
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+_STRINGHE = re.compile(r"'(?:[^']|'')*'")
+_NUMERI = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SEGNAPOSTO = re.compile(r"%s|\?")
+_LISTE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPAZI = re.compile(r"\s+")
+_TRANSAZIONI = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def impronta(sql):
+    """Forma della query senza valori: stringhe e numeri diventano ?, le liste IN (...)"""
+    sql = _STRINGHE.sub('?', sql)
+    sql = _NUMERI.sub('?', sql)
+    sql = _SEGNAPOSTO.sub('?', sql)
+    sql = _LISTE.sub('(...)', sql)
+    return _SPAZI.sub(' ', sql).strip()
+
+
+def riepilogo_stack():
+    """File e righe del progetto nello stack corrente, più i template in corso di rendering"""
+    radice = str(settings.BASE_DIR)
+    righe, template = [], []
+    frame = sys._getframe(1)
+    while frame is not None:
+        codice = frame.f_code
+        nome_file = codice.co_filename
+        if nome_file.startswith(radice) and 'site-packages' not in nome_file:
+            if Path(nome_file) != Path(__file__):
+                righe.append(f"{Path(nome_file).relative_to(radice)}:{frame.f_lineno} in {codice.co_name}")
+        elif codice.co_name == 'render':
+            istanza = frame.f_locals.get('self')
+            if isinstance(istanza, Template) and istanza.name and istanza.name not in template:
+                template.append(istanza.name)
+        frame = frame.f_back
+    return righe, template
+
+
+class ContatoreQuery:
+    """execute_wrapper: conta le esecuzioni per testo SQL e legge lo stack alla soglia"""
+
+    def __init__(self, soglia):
+        self.soglia = soglia
+        self.conteggi = {}
+        self.stack = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        conteggio = self.conteggi.get(sql, 0) + 1
+        self.conteggi[sql] = conteggio
+        if conteggio == self.soglia + 1:
+            self.stack[sql] = riepilogo_stack()
+        return execute(sql, params, many, context)
+
+    def ripetute(self):
+        """[(impronta, esecuzioni, stack)] delle query oltre la soglia, dalla più ripetuta"""
+        gruppi = {}
+        for sql, conteggio in self.conteggi.items():
+            chiave = impronta(sql)
+            if chiave.startswith(_TRANSAZIONI):
+                continue
+            totale, stack = gruppi.get(chiave, (0, None))
+            gruppi[chiave] = (totale + conteggio, stack or self.stack.get(sql))
+        return sorted(
+            ((chiave, totale, stack) for chiave, (totale, stack) in gruppi.items() if totale > self.soglia),
+            key=lambda voce: -voce[1]
+        )
+
+
+class QueryRipetuteMiddleware:
+    """
+    Registra un warning per ogni query eseguita più di QUERY_RIPETUTE_SOGLIA volte
+    nella stessa richiesta, con vista, template e righe di codice coinvolte.
+    Va messo in testa a MIDDLEWARE per contare anche le query degli altri middleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_RIPETUTE_ATTIVO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.soglia = getattr(settings, 'QUERY_RIPETUTE_SOGLIA', 10)
+        self.campione = getattr(settings, 'QUERY_RIPETUTE_CAMPIONE', 1.0)
+
+    def __call__(self, request):
+        if self.campione < 1 and random.random() >= self.campione:
+            return self.get_response(request)
+
+        contatore = ContatoreQuery(self.soglia)
+        with ExitStack() as wrapper:
+            for connessione in connections.all():
+                wrapper.enter_context(connessione.execute_wrapper(contatore))
+            response = self.get_response(request)
+
+        for sql, totale, stack in contatore.ripetute():
+            self.segnala(request, sql, totale, stack)
+        return response
+
+    def segnala(self, request, sql, totale, stack):
+        match = getattr(request, 'resolver_match', None)
+        vista = match.view_name if match else '-'
+        righe, template = stack or ([], [])
+        logger.warning(
+            "Query ripetuta %s volte in %s (%s %s)%s\n  SQL: %s%s",
+            totale, vista, request.method, request.get_full_path(),
+            f" template: {', '.join(template)}" if template else '',
+            sql[:500],
+            ''.join(f"\n    {riga}" for riga in righe) or "\n    (stack non disponibile)"
+        )
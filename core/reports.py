@@ -2,43 +2,102 @@
 UNIGEST - Report PDF
 File: core/reports.py
 Descrizione: Generazione report PDF con ReportLab
+
+Gli stili sono creati una volta all'import del modulo. Le tabelle sono descritte
+da un elenco di colonne (colonna()) e costruite da tabella() come LongTable con
+l'intestazione ripetuta su ogni pagina: le celle sono stringhe semplici, e solo
+un testo più largo della sua colonna diventa un Paragraph che va a capo. Le
+righe sono lette con values(), senza costruire gli oggetti dei modelli.
 """
 
+from functools import lru_cache
+from io import BytesIO
+from datetime import date
+from itertools import groupby
+from xml.sax.saxutils import escape
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.platypus import (
-    SimpleDocTemplate, Table, TableStyle, Paragraph,
-    Spacer, PageBreak, Image
+    SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 )
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from reportlab.pdfgen import canvas
-from django.http import HttpResponse
-from io import BytesIO
-from datetime import date
+from reportlab.lib.enums import TA_CENTER
+
+
+# ============================================================================
+# STILI
+# ============================================================================
+
+STILI = getSampleStyleSheet()
+
+STILE_INFO = ParagraphStyle('InfoStyle', parent=STILI['Normal'], fontSize=10, spaceAfter=20)
+
+STILE_CATEGORIA = ParagraphStyle(
+    'CategoryStyle',
+    parent=STILI['Heading2'],
+    fontSize=12,
+    textColor=colors.HexColor('#0d6efd'),
+    spaceAfter=10,
+    spaceBefore=15
+)
+
+# Righe alternate del corpo delle tabelle
+SFONDO_RIGHE = [colors.white, colors.HexColor('#f8f9fa')]
+
+# Padding di default delle celle di ReportLab: 6 punti a sinistra e a destra, 3 sopra e sotto
+PADDING_ORIZZONTALE = 12
+PADDING_VERTICALE = 6
+
+
+@lru_cache(maxsize=None)
+def stile_titolo(colore):
+    """Stile del titolo di un report, nel colore del report"""
+    return ParagraphStyle(
+        f'CustomTitle{colore}',
+        parent=STILI['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor(colore),
+        spaceAfter=20,
+        alignment=TA_CENTER
+    )
+
+
+@lru_cache(maxsize=None)
+def stile_cella(dimensione):
+    """Stile dei Paragraph nelle celle che vanno a capo"""
+    return ParagraphStyle(
+        f'Cella{dimensione}', parent=STILI['Normal'], fontName='Helvetica',
+        fontSize=dimensione, leading=dimensione * 1.2
+    )
 
 
+# ============================================================================
+# DOCUMENTO E TABELLE
+# ============================================================================
+
 def crea_header_footer(canvas_obj, doc):
     """
     Crea header e footer per ogni pagina
     """
     canvas_obj.saveState()
+    larghezza, altezza = doc.pagesize
 
     # Header
     canvas_obj.setFont('Helvetica-Bold', 10)
-    canvas_obj.drawString(2*cm, A4[1] - 1.5*cm, "UNIVERSITÀ DEGLI ADULTI")
+    canvas_obj.drawString(2*cm, altezza - 1.5*cm, "UNIVERSITÀ DEGLI ADULTI")
     canvas_obj.setFont('Helvetica', 8)
     canvas_obj.drawRightString(
-        A4[0] - 2*cm,
-        A4[1] - 1.5*cm,
+        larghezza - 2*cm,
+        altezza - 1.5*cm,
         f"Generato il {date.today().strftime('%d/%m/%Y')}"
     )
 
     # Footer
     canvas_obj.setFont('Helvetica', 8)
     canvas_obj.drawCentredString(
-        A4[0] / 2,
+        larghezza / 2,
         1*cm,
         f"Pagina {doc.page}"
     )
@@ -46,458 +105,280 @@ def crea_header_footer(canvas_obj, doc):
     canvas_obj.restoreState()
 
 
-def foglio_presenze_pdf(edizione_corso):
-    """
-    1. FOGLIO PRESENZE - Registro per appello
-    """
+def genera_pdf(elements, pagesize=A4):
+    """Impagina gli elementi con header e footer e restituisce il PDF in un BytesIO"""
     buffer = BytesIO()
     doc = SimpleDocTemplate(
         buffer,
-        pagesize=A4,
+        pagesize=pagesize,
         rightMargin=1.5*cm,
         leftMargin=1.5*cm,
         topMargin=2.5*cm,
         bottomMargin=2*cm
     )
+    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
+    buffer.seek(0)
+    return buffer
 
-    elements = []
-    styles = getSampleStyleSheet()
 
-    # Stile titolo
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#0d6efd'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
+def titolo(testo, colore):
+    return Paragraph(testo, stile_titolo(colore))
 
-    # Titolo
-    title = Paragraph(
-        f"FOGLIO PRESENZE<br/>{edizione_corso.corso.nome}",
-        title_style
-    )
-    elements.append(title)
-
-    # Info corso
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=20
-    )
 
-    info_text = f"""
-    <b>Anno Accademico:</b> {edizione_corso.anno_accademico.anno}<br/>
-    <b>Quadrimestre:</b> {edizione_corso.quadrimestre}<br/>
-    <b>Docente:</b> {edizione_corso.docente.nome}<br/>
-    <b>Orario:</b> {edizione_corso.giorni_settimana} -
-    {edizione_corso.ora_inizio.strftime('%H:%M')} /
-    {edizione_corso.ora_fine.strftime('%H:%M')}
+def colonna(intestazione, larghezza, valore, allinea='CENTER', a_capo=False, vuoto='-', massimo=None):
     """
+    Colonna di una tabella: valore è il nome di un campo della riga o una
+    funzione(riga); i valori vuoti diventano vuoto e quelli oltre massimo
+    caratteri vengono troncati. Con a_capo il testo più largo della colonna va
+    a capo invece di uscire dalla cella.
+    """
+    return {
+        'intestazione': intestazione,
+        'larghezza': larghezza,
+        'valore': valore if callable(valore) else (lambda riga: riga[valore]),
+        'allinea': allinea,
+        'a_capo': a_capo,
+        'vuoto': vuoto,
+        'massimo': massimo,
+    }
 
-    elements.append(Paragraph(info_text, info_style))
-    elements.append(Spacer(1, 10))
 
-    # Tabella iscritti
-    iscritti = edizione_corso.iscrizioni.all().select_related('iscritto').order_by('iscritto__nominativo')
+# Colonna con il numero progressivo della riga
+NUMERO = colonna('#', 1*cm, lambda riga: riga['#'])
 
-    # Header tabella
-    data = [
-        ['#', 'Nominativo', 'Telefono', 'Firma 1', 'Firma 2', 'Firma 3', 'Firma 4']
-    ]
 
-    # Righe iscritti
-    for i, iscrizione in enumerate(iscritti, 1):
-        row = [
-            str(i),
-            iscrizione.iscritto.nominativo,
-            iscrizione.iscritto.cellulare or iscrizione.iscritto.telefono or '-',
-            '',  # Spazio per firma
-            '',
-            '',
-            ''
-        ]
-        data.append(row)
-
-    # Crea tabella
-    table = Table(data, colWidths=[1*cm, 6*cm, 3.5*cm, 2*cm, 2*cm, 2*cm, 2*cm])
-
-    # Stile tabella
-    table.setStyle(TableStyle([
-        # Header
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0d6efd')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+def tabella(righe, colonne, sfondo_intestazione, testo_intestazione=colors.whitesmoke,
+            dimensione=8, dimensione_intestazione=9, spazio_intestazione=3, numerata=False, stile=()):
+    """
+    LongTable con una riga per ogni elemento di righe (dizionari) e l'intestazione
+    ripetuta su ogni pagina. stile aggiunge comandi TableStyle a quelli comuni,
+    senza cambiare padding e dimensioni dei caratteri.
+
+    Le altezze delle righe sono calcolate qui e passate a LongTable: senza,
+    ReportLab le ricalcola a ogni pagina scorrendo tutte le righe rimaste,
+    con un costo che cresce col quadrato delle righe.
+    """
+    if numerata:
+        colonne = [NUMERO] + list(colonne)
+        righe = ({**riga, '#': str(numero)} for numero, riga in enumerate(righe, 1))
+
+    # Larghezza utile per il testo di ogni colonna, oltre la quale si va a capo
+    limiti = [
+        colonna['larghezza'] - PADDING_ORIZZONTALE if colonna['a_capo'] else None
+        for colonna in colonne
+    ]
+    interlinea = dimensione * 1.2
+    dati = [[colonna['intestazione'] for colonna in colonne]]
+    altezze = [dimensione_intestazione * 1.2 + 3 + spazio_intestazione]
+    for riga in righe:
+        celle = []
+        altezza = interlinea
+        for colonna, limite in zip(colonne, limiti):
+            valore = colonna['valore'](riga)
+            testo = str(valore) if valore not in (None, '') else colonna['vuoto']
+            if colonna['massimo']:
+                testo = testo[:colonna['massimo']]
+            if limite and stringWidth(testo, 'Helvetica', dimensione) > limite:
+                testo = Paragraph(escape(testo), stile_cella(dimensione))
+                altezza = max(altezza, testo.wrap(limite, 0)[1])
+            elif '\n' in testo:
+                altezza = max(altezza, interlinea * (testo.count('\n') + 1))
+            celle.append(testo)
+        dati.append(celle)
+        altezze.append(altezza + PADDING_VERTICALE)
+
+    comandi = [
+        ('BACKGROUND', (0, 0), (-1, 0), sfondo_intestazione),
+        ('TEXTCOLOR', (0, 0), (-1, 0), testo_intestazione),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-
-        # Body
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+        ('FONTSIZE', (0, 0), (-1, 0), dimensione_intestazione),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTNAME', (0, 1), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ALIGN', (1, 1), (1, -1), 'LEFT'),  # Nome a sinistra
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-    ]))
+        ('FONTSIZE', (0, 1), (-1, -1), dimensione),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), SFONDO_RIGHE),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), spazio_intestazione),
+    ]
+    comandi += [
+        ('ALIGN', (indice, 1), (indice, -1), colonna['allinea'])
+        for indice, colonna in enumerate(colonne) if colonna['allinea'] != 'CENTER'
+    ]
 
-    elements.append(table)
+    table = LongTable(
+        dati, colWidths=[colonna['larghezza'] for colonna in colonne], rowHeights=altezze, repeatRows=1
+    )
+    table.setStyle(TableStyle(comandi + list(stile)))
+    return table
 
-    # Genera PDF
-    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
-    buffer.seek(0)
 
-    return buffer
+def _iscritti_edizione(edizione_corso):
+    return list(edizione_corso.iscrizioni.order_by('iscritto__nominativo').values(
+        'iscritto__nominativo', 'iscritto__telefono', 'iscritto__cellulare', 'iscritto__email'
+    ))
 
 
-def elenco_iscritti_pdf(edizione_corso):
-    """
-    2. ELENCO ISCRITTI - Lista completa con dati anagrafici
-    """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=1.5*cm,
-        leftMargin=1.5*cm,
-        topMargin=2.5*cm,
-        bottomMargin=2*cm
-    )
+# ============================================================================
+# REPORT
+# ============================================================================
 
-    elements = []
-    styles = getSampleStyleSheet()
+COLONNE_FOGLIO_PRESENZE = [
+    colonna('Nominativo', 6*cm, 'iscritto__nominativo', allinea='LEFT'),
+    colonna('Telefono', 3.5*cm, lambda riga: riga['iscritto__cellulare'] or riga['iscritto__telefono']),
+] + [
+    colonna(f'Firma {numero}', 2*cm, lambda riga: '', vuoto='') for numero in range(1, 5)
+]
 
-    # Titolo
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#198754'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
 
-    title = Paragraph(
-        f"ELENCO ISCRITTI<br/>{edizione_corso.corso.nome}",
-        title_style
-    )
-    elements.append(title)
-
-    # Info corso
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=20
-    )
-
-    info_text = f"""
-    <b>Anno:</b> {edizione_corso.anno_accademico.anno} |
-    <b>Quadrimestre:</b> {edizione_corso.quadrimestre} |
-    <b>Docente:</b> {edizione_corso.docente.nome}<br/>
-    <b>Totale Iscritti:</b> {edizione_corso.iscrizioni.count()}
+def foglio_presenze_pdf(edizione_corso):
     """
+    1. FOGLIO PRESENZE - Registro per appello
+    """
+    info_text = (
+        f"<b>Anno Accademico:</b> {edizione_corso.anno_accademico.anno}<br/>"
+        f"<b>Quadrimestre:</b> {edizione_corso.quadrimestre}<br/>"
+        f"<b>Docente:</b> {escape(edizione_corso.docente.nome)}<br/>"
+        f"<b>Orario:</b> {escape(edizione_corso.giorni_settimana)} - "
+        f"{edizione_corso.ora_inizio.strftime('%H:%M')} / "
+        f"{edizione_corso.ora_fine.strftime('%H:%M')}"
+    )
+    elements = [
+        titolo(f"FOGLIO PRESENZE<br/>{escape(edizione_corso.corso.nome)}", '#0d6efd'),
+        Paragraph(info_text, STILE_INFO),
+        Spacer(1, 10),
+        tabella(
+            _iscritti_edizione(edizione_corso), COLONNE_FOGLIO_PRESENZE, colors.HexColor('#0d6efd'),
+            spazio_intestazione=12, numerata=True,
+            stile=[('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]
+        ),
+    ]
+    return genera_pdf(elements)
 
-    elements.append(Paragraph(info_text, info_style))
-    elements.append(Spacer(1, 10))
-
-    # Tabella iscritti
-    iscritti = edizione_corso.iscrizioni.all().select_related('iscritto').order_by('iscritto__nominativo')
 
-    data = [['#', 'Nominativo', 'Telefono', 'Cellulare', 'Email']]
+COLONNE_CONTATTI = [
+    colonna('Telefono', 3*cm, 'iscritto__telefono'),
+    colonna('Cellulare', 3*cm, 'iscritto__cellulare'),
+]
 
-    for i, iscrizione in enumerate(iscritti, 1):
-        iscr = iscrizione.iscritto
-        row = [
-            str(i),
-            iscr.nominativo,
-            iscr.telefono or '-',
-            iscr.cellulare or '-',
-            Paragraph(iscr.email or '-', styles['Normal'])
-        ]
-        data.append(row)
 
-    table = Table(data, colWidths=[1*cm, 5*cm, 3*cm, 3*cm, 5*cm])
+def elenco_iscritti_pdf(edizione_corso):
+    """
+    2. ELENCO ISCRITTI - Lista completa con dati anagrafici
+    """
+    iscritti = _iscritti_edizione(edizione_corso)
+    info_text = (
+        f"<b>Anno:</b> {edizione_corso.anno_accademico.anno} | "
+        f"<b>Quadrimestre:</b> {edizione_corso.quadrimestre} | "
+        f"<b>Docente:</b> {escape(edizione_corso.docente.nome)}<br/>"
+        f"<b>Totale Iscritti:</b> {len(iscritti)}"
+    )
+    colonne = [
+        colonna('Nominativo', 5*cm, 'iscritto__nominativo', allinea='LEFT'),
+        *COLONNE_CONTATTI,
+        colonna('Email', 5*cm, 'iscritto__email', a_capo=True),
+    ]
+    elements = [
+        titolo(f"ELENCO ISCRITTI<br/>{escape(edizione_corso.corso.nome)}", '#198754'),
+        Paragraph(info_text, STILE_INFO),
+        Spacer(1, 10),
+        tabella(iscritti, colonne, colors.HexColor('#198754'), numerata=True),
+    ]
+    return genera_pdf(elements)
 
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#198754')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-    ]))
 
-    elements.append(table)
+COLONNE_CORSI_ANNO = [
+    colonna('Corso', 6*cm, 'corso__nome', allinea='LEFT', a_capo=True),
+    colonna('Docente', 5*cm, 'docente__nome', massimo=30),
+    colonna('Q', 1*cm, 'quadrimestre__numero'),
+    colonna('Giorni', 4*cm, 'giorni_settimana', massimo=20),
+    colonna('Orario', 3*cm, lambda riga: f"{riga['ora_inizio'].strftime('%H:%M')}-{riga['ora_fine'].strftime('%H:%M')}"),
+    colonna('Iscritti', 2*cm, 'numero_iscritti'),
+]
 
-    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
-    buffer.seek(0)
-
-    return buffer
 
 def elenco_corsi_anno_pdf(anno_accademico):
     """
     3. ELENCO CORSI ANNO - Tutti i corsi dell'anno
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(A4),  # Orizzontale
-        rightMargin=1.5*cm,
-        leftMargin=1.5*cm,
-        topMargin=2.5*cm,
-        bottomMargin=2*cm
-    )
+    from core.models import EdizioneCorso
 
-    elements = []
-    styles = getSampleStyleSheet()
+    elements = [
+        titolo(f"ELENCO CORSI<br/>Anno Accademico {anno_accademico.anno}", '#dc3545'),
+        Spacer(1, 20),
+    ]
 
-    # Titolo
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#dc3545'),
-        spaceAfter=20,
-        alignment=TA_CENTER
+    # Edizioni di tutte le categorie con una query, raggruppate nell'ordine delle categorie
+    edizioni = EdizioneCorso.objects.filter(
+        anno_accademico=anno_accademico,
+        corso__categoria__isnull=False
+    ).order_by('corso__categoria__ordine', 'corso__categoria_id', 'corso__nome').values(
+        'corso__categoria_id', 'corso__categoria__nome', 'corso__nome', 'docente__nome',
+        'quadrimestre__numero', 'giorni_settimana', 'ora_inizio', 'ora_fine', 'numero_iscritti'
     )
 
-    title = Paragraph(
-        f"ELENCO CORSI<br/>Anno Accademico {anno_accademico.anno}",
-        title_style
-    )
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-
-    # Edizioni per categoria
-    from core.models import EdizioneCorso, CategoriaCorso
-
-    categorie = CategoriaCorso.objects.all().order_by('ordine')
-
-    for categoria in categorie:
-        edizioni = EdizioneCorso.objects.filter(
-            anno_accademico=anno_accademico,
-            corso__categoria=categoria
-        ).select_related('corso', 'docente', 'quadrimestre').order_by('corso__nome')
-
-        if not edizioni.exists():
-            continue
-
-        # Titolo categoria
-        cat_style = ParagraphStyle(
-            'CategoryStyle',
-            parent=styles['Heading2'],
-            fontSize=12,
-            textColor=colors.HexColor('#0d6efd'),
-            spaceAfter=10,
-            spaceBefore=15
-        )
-        elements.append(Paragraph(f"<b>{categoria.nome}</b>", cat_style))
-
-        # Tabella corsi
-        data = [['Corso', 'Docente', 'Q', 'Giorni', 'Orario', 'Iscritti']]
-
-        for ed in edizioni:
-            row = [
-                Paragraph(ed.corso.nome, styles['Normal']),
-                ed.docente.nome[:30],  # Tronca se troppo lungo
-                str(ed.quadrimestre.numero),
-                ed.giorni_settimana[:20],
-                f"{ed.ora_inizio.strftime('%H:%M')}-{ed.ora_fine.strftime('%H:%M')}",
-                str(ed.iscrizioni.count())
-            ]
-            data.append(row)
-
-        table = Table(data, colWidths=[6*cm, 5*cm, 1*cm, 4*cm, 3*cm, 2*cm])
-
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e9ecef')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Nome corso a sinistra
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
-
-        elements.append(table)
+    for (_, nome_categoria), righe in groupby(
+        edizioni, key=lambda riga: (riga['corso__categoria_id'], riga['corso__categoria__nome'])
+    ):
+        elements.append(Paragraph(f"<b>{escape(nome_categoria)}</b>", STILE_CATEGORIA))
+        elements.append(tabella(
+            righe, COLONNE_CORSI_ANNO, colors.HexColor('#e9ecef'),
+            testo_intestazione=colors.black, dimensione=7, dimensione_intestazione=8
+        ))
         elements.append(Spacer(1, 15))
 
-    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
-    buffer.seek(0)
-
-    return buffer
+    return genera_pdf(elements, pagesize=landscape(A4))
 
 
 def rubrica_contatti_pdf(anno_accademico):
     """
     4. RUBRICA CONTATTI - Elenco telefonico iscritti
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=1.5*cm,
-        leftMargin=1.5*cm,
-        topMargin=2.5*cm,
-        bottomMargin=2*cm
-    )
-
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Titolo
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#6f42c1'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-
-    title = Paragraph(
-        f"RUBRICA CONTATTI<br/>Anno Accademico {anno_accademico.anno}",
-        title_style
-    )
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-
-    # Prendi tutti gli iscritti dell'anno
     from core.models import IscrizioneAnnoAccademico
 
     iscrizioni_anno = IscrizioneAnnoAccademico.objects.filter(
         anno_accademico=anno_accademico
-    ).select_related('iscritto').order_by('iscritto__nominativo')
-
-    data = [['Nominativo', 'Telefono', 'Cellulare', 'Email']]
-
-    for iscrizione in iscrizioni_anno:
-        iscr = iscrizione.iscritto
-        row = [
-            iscr.nominativo,
-            iscr.telefono or '-',
-            iscr.cellulare or '-',
-            Paragraph(iscr.email or '-', styles['Normal'])
-        ]
-        data.append(row)
-
-    table = Table(data, colWidths=[5*cm, 3*cm, 3*cm, 6*cm])
-
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#6f42c1')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-    ]))
+    ).order_by('iscritto__nominativo').values(
+        'iscritto__nominativo', 'iscritto__telefono', 'iscritto__cellulare', 'iscritto__email'
+    )
+    colonne = [
+        colonna('Nominativo', 5*cm, 'iscritto__nominativo', allinea='LEFT'),
+        *COLONNE_CONTATTI,
+        colonna('Email', 6*cm, 'iscritto__email', a_capo=True),
+    ]
+    elements = [
+        titolo(f"RUBRICA CONTATTI<br/>Anno Accademico {anno_accademico.anno}", '#6f42c1'),
+        Spacer(1, 20),
+        tabella(iscrizioni_anno.iterator(chunk_size=2000), colonne, colors.HexColor('#6f42c1')),
+    ]
+    return genera_pdf(elements)
 
-    elements.append(table)
 
-    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
-    buffer.seek(0)
-
-    return buffer
+COLONNE_REGISTRO = [
+    colonna('Data', 2.5*cm, lambda riga: riga['data_lezione'].strftime('%d/%m/%Y')),
+    colonna('Argomento', 7*cm, 'descrizione', allinea='LEFT', a_capo=True, massimo=50),
+    colonna('Docente', 4*cm, 'docente__nome', massimo=25),
+    colonna('Ore', 1.5*cm, 'ore_lezione'),
+    colonna('Presenti', 2*cm, 'numero_presenti'),
+]
 
 
 def registro_lezioni_pdf(edizione_corso):
     """
     5. REGISTRO LEZIONI - Elenco lezioni effettuate
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=1.5*cm,
-        leftMargin=1.5*cm,
-        topMargin=2.5*cm,
-        bottomMargin=2*cm
-    )
-
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Titolo
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.HexColor('#fd7e14'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    )
-
-    title = Paragraph(
-        f"REGISTRO LEZIONI<br/>{edizione_corso.corso.nome}",
-        title_style
-    )
-    elements.append(title)
-
-    # Info
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=20
+    lezioni = list(edizione_corso.lezioni.order_by('data_lezione').values(
+        'data_lezione', 'descrizione', 'docente__nome', 'ore_lezione', 'numero_presenti'
+    ))
+    totale_ore = sum(lezione['ore_lezione'] for lezione in lezioni)
+
+    info_text = (
+        f"<b>Anno:</b> {edizione_corso.anno_accademico.anno} | "
+        f"<b>Docente:</b> {escape(edizione_corso.docente.nome)}<br/>"
+        f"<b>Totale Lezioni:</b> {len(lezioni)} | "
+        f"<b>Totale Ore:</b> {totale_ore}"
     )
-
-    lezioni = edizione_corso.lezioni.all().order_by('data_lezione')
-    totale_ore = sum([l.ore_lezione for l in lezioni])
-
-    info_text = f"""
-    <b>Anno:</b> {edizione_corso.anno_accademico.anno} |
-    <b>Docente:</b> {edizione_corso.docente.nome}<br/>
-    <b>Totale Lezioni:</b> {lezioni.count()} |
-    <b>Totale Ore:</b> {totale_ore}
-    """
-
-    elements.append(Paragraph(info_text, info_style))
-    elements.append(Spacer(1, 10))
-
-    # Tabella lezioni
-    data = [['#', 'Data', 'Argomento', 'Docente', 'Ore', 'Presenti']]
-
-    for i, lezione in enumerate(lezioni, 1):
-        row = [
-            str(i),
-            lezione.data_lezione.strftime('%d/%m/%Y'),
-            Paragraph(lezione.descrizione[:50] or '-', styles['Normal']),
-            lezione.docente.nome[:25],
-            str(lezione.ore_lezione),
-            str(lezione.numero_presenti)
-        ]
-        data.append(row)
-
-    table = Table(data, colWidths=[1*cm, 2.5*cm, 7*cm, 4*cm, 1.5*cm, 2*cm])
-
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#fd7e14')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('ALIGN', (2, 1), (2, -1), 'LEFT'),  # Argomento a sinistra
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-    ]))
-
-    elements.append(table)
-
-    doc.build(elements, onFirstPage=crea_header_footer, onLaterPages=crea_header_footer)
-    buffer.seek(0)
-
-    return buffer
-
+    elements = [
+        titolo(f"REGISTRO LEZIONI<br/>{escape(edizione_corso.corso.nome)}", '#fd7e14'),
+        Paragraph(info_text, STILE_INFO),
+        Spacer(1, 10),
+        tabella(lezioni, COLONNE_REGISTRO, colors.HexColor('#fd7e14'), testo_intestazione=colors.white, numerata=True),
+    ]
+    return genera_pdf(elements)
@@ -0,0 +1,155 @@
+"""
+UNIGEST - Ricerca
+File: core/ricerca.py
+Descrizione: Indice full-text per la ricerca globale di iscritti, docenti e corsi.
+
+Il testo di ogni oggetto viene normalizzato (minuscolo, senza accenti) e salvato
+in IndiceRicerca. Su SQLite la ricerca usa la tabella FTS5 core_indicericerca_fts
+(ordinamento bm25), su MySQL l'indice FULLTEXT in modalità booleana (ordinamento
+per rilevanza); ogni parola cercata vale anche come prefisso ("ross" trova
+"Rossi"). Con altri database, o se nessuna parola è indicizzabile, la ricerca
+ripiega su un LIKE sul testo normalizzato.
+"""
+
+import re
+import unicodedata
+from django.apps import apps as django_apps
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from core.models import IndiceRicerca
+
+TABELLA_FTS = 'core_indicericerca_fts'
+# Lunghezza minima delle parole nell'indice FULLTEXT di InnoDB (innodb_ft_min_token_size)
+MYSQL_LUNGHEZZA_MIN = 3
+
+# tipo -> (modello, campi letti per comporre il testo)
+TIPI = {
+    'iscritto': ('Iscritto', ['matricola', 'nominativo', 'codice_fiscale']),
+    'docente': ('Docente', ['nome']),
+    'corso': ('Corso', ['nome', 'descrizione']),
+}
+
+
+def normalizza(testo):
+    """Minuscolo e senza accenti/diacritici: 'Niccolò' -> 'niccolo'"""
+    scomposto = unicodedata.normalize('NFKD', testo or '')
+    return ''.join(c for c in scomposto if not unicodedata.combining(c)).lower()
+
+
+def parole(query):
+    """Parole della query normalizzata, senza punteggiatura né operatori"""
+    return re.findall(r'\w+', normalizza(query))
+
+
+def tipo_di(instance):
+    """Tipo dell'indice per un'istanza, None se il modello non è indicizzato"""
+    nome = instance._meta.object_name
+    return next((tipo for tipo, (modello, _) in TIPI.items() if modello == nome), None)
+
+
+def testo_di(tipo, instance):
+    return normalizza(' '.join(str(getattr(instance, campo) or '') for campo in TIPI[tipo][1]))
+
+
+def aggiorna(instance):
+    """Crea o aggiorna la voce dell'indice di un iscritto, docente o corso"""
+    tipo = tipo_di(instance)
+    IndiceRicerca.objects.update_or_create(
+        tipo=tipo, oggetto_id=instance.pk, defaults={'testo': testo_di(tipo, instance)}
+    )
+
+
+def rimuovi(instance):
+    IndiceRicerca.objects.filter(tipo=tipo_di(instance), oggetto_id=instance.pk).delete()
+
+
+def ricostruisci(batch_size=1000):
+    """Rigenera l'intero indice dai dati attuali; restituisce le voci per tipo"""
+    IndiceRicerca.objects.all().delete()
+    conteggi = {}
+    for tipo, (modello, campi) in TIPI.items():
+        blocco = []
+        conteggi[tipo] = 0
+        for pk, *valori in django_apps.get_model('core', modello).objects.order_by().values_list('pk', *campi).iterator(chunk_size=batch_size):
+            testo = normalizza(' '.join(str(v or '') for v in valori))
+            blocco.append(IndiceRicerca(tipo=tipo, oggetto_id=pk, testo=testo))
+            if len(blocco) >= batch_size:
+                IndiceRicerca.objects.bulk_create(blocco)
+                conteggi[tipo] += len(blocco)
+                blocco = []
+        IndiceRicerca.objects.bulk_create(blocco)
+        conteggi[tipo] += len(blocco)
+    if connection.vendor == 'sqlite':
+        # Compatta i segmenti FTS5 lasciati dagli inserimenti a blocchi
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABELLA_FTS}({TABELLA_FTS}) VALUES ('optimize')")
+    return conteggi
+
+
+def cerca(query, tipo, limite=10):
+    """ID degli oggetti di un tipo che contengono tutte le parole (anche come prefisso), dal più rilevante"""
+    termini = parole(query)
+    if not termini:
+        return []
+
+    if connection.vendor == 'sqlite':
+        espressione = ' '.join(f'"{t}"*' for t in termini)
+        sql = (f"SELECT i.oggetto_id FROM {TABELLA_FTS} JOIN core_indicericerca i ON i.id = {TABELLA_FTS}.rowid "
+               f"WHERE {TABELLA_FTS} MATCH %s AND i.tipo = %s ORDER BY {TABELLA_FTS}.rank LIMIT %s")
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [espressione, tipo, limite])
+            return [riga[0] for riga in cursor.fetchall()]
+
+    indicizzabili = [t for t in termini if len(t) >= MYSQL_LUNGHEZZA_MIN]
+    if connection.vendor == 'mysql' and indicizzabili:
+        corte = [t for t in termini if len(t) < MYSQL_LUNGHEZZA_MIN]
+        espressione = ' '.join(f'+{t}*' for t in indicizzabili)
+        sql = ("SELECT oggetto_id FROM core_indicericerca "
+               "WHERE tipo = %s AND MATCH(testo) AGAINST (%s IN BOOLEAN MODE) "
+               "ORDER BY MATCH(testo) AGAINST (%s IN BOOLEAN MODE) DESC LIMIT %s")
+        with connection.cursor() as cursor:
+            # Se ci sono parole troppo corte per l'indice si leggono più candidati da filtrare
+            cursor.execute(sql, [tipo, espressione, espressione, limite * 5 if corte else limite])
+            ids = [riga[0] for riga in cursor.fetchall()]
+        if corte and ids:
+            voci = IndiceRicerca.objects.filter(tipo=tipo, oggetto_id__in=ids)
+            for termine in corte:
+                voci = voci.filter(testo__contains=termine)
+            validi = set(voci.values_list('oggetto_id', flat=True))
+            ids = [i for i in ids if i in validi][:limite]
+        return ids
+
+    voci = IndiceRicerca.objects.filter(tipo=tipo)
+    for termine in termini:
+        voci = voci.filter(testo__contains=termine)
+    return list(voci.values_list('oggetto_id', flat=True)[:limite])
+
+
+def filtra(queryset, query, tipo):
+    """
+    Restringe il queryset agli oggetti che contengono tutte le parole (anche come
+    prefisso) con una sola query SQL; l'ordinamento resta quello del queryset.
+    """
+    termini = parole(query)
+    voci = IndiceRicerca.objects.filter(tipo=tipo)
+    if connection.vendor == 'sqlite' and termini:
+        espressione = ' '.join(f'"{t}"*' for t in termini)
+        voci = voci.filter(id__in=RawSQL(f"SELECT rowid FROM {TABELLA_FTS} WHERE {TABELLA_FTS} MATCH %s", [espressione]))
+        termini = []
+    elif connection.vendor == 'mysql' and any(len(t) >= MYSQL_LUNGHEZZA_MIN for t in termini):
+        espressione = ' '.join(f'+{t}*' for t in termini if len(t) >= MYSQL_LUNGHEZZA_MIN)
+        voci = voci.filter(id__in=RawSQL(
+            "SELECT id FROM core_indicericerca WHERE MATCH(testo) AGAINST (%s IN BOOLEAN MODE)", [espressione]
+        ))
+        termini = [t for t in termini if len(t) < MYSQL_LUNGHEZZA_MIN]
+    for termine in termini:
+        voci = voci.filter(testo__contains=termine)
+    return queryset.filter(pk__in=voci.values('oggetto_id'))
+
+
+def cerca_oggetti(query, tipo, limite=10):
+    """Oggetti del tipo indicato in ordine di rilevanza"""
+    modello = django_apps.get_model('core', TIPI[tipo][0])
+    ids = cerca(query, tipo, limite)
+    oggetti = modello.objects.in_bulk(ids)
+    return [oggetti[i] for i in ids if i in oggetti]
@@ -0,0 +1,99 @@
+"""
+UNIGEST - Signals
+File: core/signals.py
+Descrizione: Ricevitori dei segnali dei modelli.
+Le scritture su anagrafiche, edizioni, iscrizioni e lezioni invalidano la
+cache delle statistiche (core/statistiche.py) dell'anno accademico coinvolto;
+le scritture su AnnoAccademico la cache di processo degli anni (core/middleware.py).
+Le invalidazioni avvengono al commit della transazione che scrive: fatte prima,
+un'altra richiesta potrebbe ricalcolare e rimettere in cache i dati vecchi.
+Iscritti, docenti e corsi sono tenuti allineati nell'indice di ricerca (core/ricerca.py).
+Iscrizioni ai corsi e lezioni aggiornano i contatori della loro edizione (core/contatori.py).
+"""
+
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core import contatori, ricerca, statistiche
+from core.middleware import invalida_anni_accademici
+from core.models import (
+    Iscritto, Docente, Corso, AnnoAccademico, EdizioneCorso,
+    IscrizioneAnnoAccademico, IscrizioneCorso, Lezione
+)
+
+
+@receiver([post_save, post_delete], sender=Iscritto)
+@receiver([post_save, post_delete], sender=Docente)
+@receiver([post_save, post_delete], sender=Corso)
+def invalida_statistiche_generali(sender, instance, **kwargs):
+    """Totali della home; i nomi di corsi e docenti compaiono anche nei top corsi di ogni anno"""
+    if sender is Iscritto:
+        transaction.on_commit(statistiche.invalida)
+    else:
+        transaction.on_commit(statistiche.invalida_tutto)
+
+
+@receiver([post_save, post_delete], sender=EdizioneCorso)
+@receiver([post_save, post_delete], sender=IscrizioneAnnoAccademico)
+@receiver([post_save, post_delete], sender=IscrizioneCorso)
+def invalida_statistiche_anno(sender, instance, **kwargs):
+    transaction.on_commit(partial(statistiche.invalida, instance.anno_accademico_id))
+
+
+@receiver([post_save, post_delete], sender=Lezione)
+def invalida_statistiche_lezione(sender, instance, **kwargs):
+    # L'edizione è già in memoria quando la lezione viene da un form o da una cancellazione a cascata
+    if Lezione.edizione_corso.is_cached(instance):
+        anno_id = instance.edizione_corso.anno_accademico_id
+    else:
+        anno_id = EdizioneCorso.objects.filter(
+            pk=instance.edizione_corso_id
+        ).values_list('anno_accademico_id', flat=True).first()
+    transaction.on_commit(partial(statistiche.invalida, anno_id))
+
+
+@receiver([post_save, post_delete], sender=AnnoAccademico)
+def invalida_anni(sender, instance, **kwargs):
+    # save() disattiva anche gli altri anni con un update(): va riletta tutta la tabella
+    transaction.on_commit(invalida_anni_accademici)
+
+
+@receiver(post_save, sender=Iscritto)
+@receiver(post_save, sender=Docente)
+@receiver(post_save, sender=Corso)
+def aggiorna_indice_ricerca(sender, instance, raw=False, **kwargs):
+    # raw: caricamento da fixture, l'indice si ricostruisce con ricostruisci_indice_ricerca
+    if not raw:
+        ricerca.aggiorna(instance)
+
+
+@receiver(post_delete, sender=Iscritto)
+@receiver(post_delete, sender=Docente)
+@receiver(post_delete, sender=Corso)
+def rimuovi_indice_ricerca(sender, instance, **kwargs):
+    ricerca.rimuovi(instance)
+
+
+@receiver(post_save, sender=IscrizioneCorso)
+@receiver(post_save, sender=Lezione)
+def aggiorna_contatori_edizione(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Una riga già salvata conta per l'edizione letta dal database (ContatoEdizioneMixin)
+    precedente = None if created else getattr(instance, '_edizione_corso_id_db', instance.edizione_corso_id)
+    if precedente is sender.EDIZIONE_NON_LETTA:
+        # Letta senza l'edizione e non assegnata: save() non l'ha scritta, il contatore non cambia
+        return
+    if precedente != instance.edizione_corso_id:
+        contatori.sposta(sender, precedente, instance.edizione_corso_id)
+    instance._edizione_corso_id_db = instance.edizione_corso_id
+
+
+@receiver(post_delete, sender=IscrizioneCorso)
+@receiver(post_delete, sender=Lezione)
+def decrementa_contatori_edizione(sender, instance, origin=None, **kwargs):
+    # Cancellazione a cascata di un'edizione: i contatori se ne vanno con lei
+    if isinstance(origin, EdizioneCorso) or getattr(origin, 'model', None) is EdizioneCorso:
+        return
+    contatori.sposta(sender, instance.edizione_corso_id, None)
@@ -0,0 +1,179 @@
+/**
+ * UNIGEST - Autocompletamento iscritti
+ * File: core/static/js/autocomplete.js
+ * Descrizione: Trasforma le select con attributo data-autocomplete (widget
+ * IscrittoAutocomplete) in un campo di ricerca che interroga l'endpoint JSON
+ * core:iscritto_autocomplete, una pagina di risultati alla volta.
+ */
+
+// ============================================================================
+// INITIALIZATION
+// ============================================================================
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('select[data-autocomplete]').forEach(initAutocomplete);
+});
+
+const AUTOCOMPLETE_MIN_CARATTERI = 2;
+const AUTOCOMPLETE_ATTESA_MS = 250;
+
+// ============================================================================
+// AUTOCOMPLETE
+// ============================================================================
+
+/**
+ * Nasconde la select e la sostituisce con un campo di testo e un elenco di risultati
+ */
+function initAutocomplete(select) {
+    const wrapper = document.createElement('div');
+    wrapper.className = 'position-relative';
+
+    const input = document.createElement('input');
+    input.type = 'text';
+    input.className = select.className || 'form-control';
+    input.placeholder = 'Cerca per nome, matricola o codice fiscale';
+    input.autocomplete = 'off';
+    const selezionata = select.options[select.selectedIndex];
+    input.value = selezionata && selezionata.value ? selezionata.text : '';
+
+    const elenco = document.createElement('div');
+    elenco.className = 'list-group position-absolute w-100 shadow-sm d-none';
+    elenco.style.zIndex = 1050;
+    elenco.style.maxHeight = '300px';
+    elenco.style.overflowY = 'auto';
+
+    select.classList.add('d-none');
+    select.parentNode.insertBefore(wrapper, select);
+    wrapper.appendChild(input);
+    wrapper.appendChild(elenco);
+    wrapper.appendChild(select);
+
+    const stato = {query: '', pagina: 1, richiesta: 0, timer: null};
+
+    input.addEventListener('input', function() {
+        clearTimeout(stato.timer);
+        const query = input.value.trim();
+        if (query === '') {
+            select.value = '';
+            select.dispatchEvent(new Event('change'));
+        }
+        if (query.length < AUTOCOMPLETE_MIN_CARATTERI) {
+            nascondiElenco(elenco);
+            return;
+        }
+        stato.timer = setTimeout(function() {
+            stato.query = query;
+            stato.pagina = 1;
+            caricaRisultati(select, input, elenco, stato, false);
+        }, AUTOCOMPLETE_ATTESA_MS);
+    });
+
+    input.addEventListener('keydown', function(e) {
+        const voci = Array.from(elenco.querySelectorAll('.list-group-item'));
+        const attiva = elenco.querySelector('.active');
+        let indice = voci.indexOf(attiva);
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            if (!voci.length) return;
+            indice = e.key === 'ArrowDown' ? Math.min(indice + 1, voci.length - 1) : Math.max(indice - 1, 0);
+            voci.forEach(v => v.classList.remove('active'));
+            voci[indice].classList.add('active');
+            voci[indice].scrollIntoView({block: 'nearest'});
+        } else if (e.key === 'Enter' && attiva) {
+            e.preventDefault();
+            attiva.click();
+        } else if (e.key === 'Escape') {
+            nascondiElenco(elenco);
+        }
+    });
+
+    // Ritardo per lasciare arrivare il click su una voce dell'elenco
+    input.addEventListener('blur', function() {
+        setTimeout(function() { nascondiElenco(elenco); }, 200);
+    });
+}
+
+/**
+ * Legge una pagina di risultati; con accoda=true la aggiunge a quelle già mostrate
+ */
+function caricaRisultati(select, input, elenco, stato, accoda) {
+    const url = new URL(select.dataset.autocomplete, window.location.origin);
+    url.searchParams.set('q', stato.query);
+    url.searchParams.set('pagina', stato.pagina);
+    const richiesta = ++stato.richiesta;
+
+    fetch(url, {headers: {'Accept': 'application/json'}})
+        .then(response => response.json())
+        .then(function(dati) {
+            // Risposta superata da una ricerca più recente
+            if (richiesta !== stato.richiesta) return;
+            mostraRisultati(select, input, elenco, stato, dati, accoda);
+        })
+        .catch(function(errore) {
+            console.error('UNIGEST - Autocompletamento iscritti:', errore);
+            if (typeof showToast === 'function') {
+                showToast('Errore durante la ricerca degli iscritti', 'danger');
+            }
+        });
+}
+
+/**
+ * Mostra i risultati e, se ce ne sono altri, la voce per caricare la pagina successiva
+ */
+function mostraRisultati(select, input, elenco, stato, dati, accoda) {
+    const altri = elenco.querySelector('[data-altri]');
+    if (altri) altri.remove();
+    if (!accoda) elenco.innerHTML = '';
+
+    dati.risultati.forEach(function(risultato) {
+        const voce = document.createElement('button');
+        voce.type = 'button';
+        voce.className = 'list-group-item list-group-item-action';
+        voce.textContent = risultato.testo;
+        voce.addEventListener('mousedown', e => e.preventDefault());
+        voce.addEventListener('click', function() {
+            selezionaIscritto(select, input, risultato);
+            nascondiElenco(elenco);
+        });
+        elenco.appendChild(voce);
+    });
+
+    if (!accoda && !dati.risultati.length) {
+        const vuoto = document.createElement('div');
+        vuoto.className = 'list-group-item text-muted';
+        vuoto.textContent = 'Nessun iscritto trovato';
+        elenco.appendChild(vuoto);
+    }
+
+    if (dati.altri) {
+        const prossima = document.createElement('button');
+        prossima.type = 'button';
+        prossima.className = 'list-group-item list-group-item-action text-primary';
+        prossima.dataset.altri = '1';
+        prossima.innerHTML = '<i class="bi bi-three-dots"></i> Altri risultati';
+        prossima.addEventListener('mousedown', e => e.preventDefault());
+        prossima.addEventListener('click', function() {
+            stato.pagina += 1;
+            caricaRisultati(select, input, elenco, stato, true);
+        });
+        elenco.appendChild(prossima);
+    }
+
+    elenco.classList.remove('d-none');
+}
+
+/**
+ * Imposta l'iscritto scelto come unica opzione selezionata della select
+ */
+function selezionaIscritto(select, input, risultato) {
+    Array.from(select.options).forEach(function(opzione) {
+        if (opzione.value) opzione.remove();
+    });
+    select.add(new Option(risultato.testo, risultato.id, true, true));
+    input.value = risultato.testo;
+    select.dispatchEvent(new Event('change'));
+}
+
+function nascondiElenco(elenco) {
+    elenco.classList.add('d-none');
+}
@@ -0,0 +1,48 @@
+/**
+ * UNIGEST - Report in background
+ * File: core/static/js/lavori.js
+ * Descrizione: Nella pagina di un report accodato interroga l'endpoint di stato
+ * (core:lavoro_report_stato) finché il file non è pronto, poi avvia il download
+ * e ricarica la pagina per mostrare l'esito.
+ */
+
+// ============================================================================
+// INITIALIZATION
+// ============================================================================
+
+document.addEventListener('DOMContentLoaded', function() {
+    const contenitore = document.querySelector('#lavoro-report[data-stato-url]');
+    if (contenitore) controllaStato(contenitore, 0);
+});
+
+const LAVORI_ATTESA_MIN_MS = 1000;
+const LAVORI_ATTESA_MAX_MS = 10000;
+
+// ============================================================================
+// POLLING
+// ============================================================================
+
+/**
+ * Chiede lo stato del lavoro; l'attesa tra due richieste cresce fino a LAVORI_ATTESA_MAX_MS
+ */
+function controllaStato(contenitore, tentativo) {
+    fetch(contenitore.dataset.statoUrl, {headers: {'Accept': 'application/json'}})
+        .then(response => response.json())
+        .then(function(dati) {
+            const etichetta = contenitore.querySelector('[data-descrizione-stato]');
+            if (etichetta) etichetta.textContent = dati.descrizione_stato;
+
+            if (dati.in_attesa) {
+                const attesa = Math.min(LAVORI_ATTESA_MIN_MS * Math.pow(1.5, tentativo), LAVORI_ATTESA_MAX_MS);
+                setTimeout(function() { controllaStato(contenitore, tentativo + 1); }, attesa);
+                return;
+            }
+            if (dati.url_scarica) window.location.href = dati.url_scarica;
+            // Dopo l'avvio del download la pagina mostra l'esito definitivo
+            setTimeout(function() { window.location.reload(); }, 1500);
+        })
+        .catch(function(errore) {
+            console.error('UNIGEST - Report in background:', errore);
+            setTimeout(function() { controllaStato(contenitore, tentativo + 1); }, LAVORI_ATTESA_MAX_MS);
+        });
+}
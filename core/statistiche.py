@@ -0,0 +1,223 @@
+"""
+UNIGEST - Statistiche
+File: core/statistiche.py
+Descrizione: Calcolo e cache delle statistiche mostrate da home, dashboard e
+statistiche_anno.
+
+Ogni snapshot è salvato nella cache di Django insieme alla versione con cui è
+stato calcolato; i segnali in core/signals.py cambiano la versione (generale o
+dell'anno accademico) a ogni scrittura dei modelli coinvolti, così uno snapshot
+calcolato prima della scrittura non viene più considerato valido.
+Un solo processo alla volta ricalcola uno snapshot scaduto (lock su file di
+core/lock.py): gli altri servono lo snapshot precedente o, se non esiste,
+attendono il risultato. Funziona con qualunque backend di cache, compresi
+LocMemCache e FileBasedCache.
+
+Sotto la cache, le statistiche di ogni anno sono salvate nel database
+(StatisticheAnno): le stesse scritture ne incrementano la versione, quindi un
+anno chiuso non viene più ricalcolato e la cache persa costa una sola lettura
+di riga. Il confronto tra anni legge tutte le righe con una query.
+"""
+
+import logging
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Avg, F, Sum
+from django.utils import timezone
+from core import lock
+from core.models import (
+    Iscritto, Docente, Corso, AnnoAccademico, EdizioneCorso,
+    IscrizioneAnnoAccademico, IscrizioneCorso, Lezione, StatisticheAnno
+)
+
+logger = logging.getLogger(__name__)
+
+PREFISSO = 'statistiche'
+# Durata massima di uno snapshot anche senza scritture (rete di sicurezza per bulk_create e update)
+TIMEOUT = getattr(settings, 'STATISTICHE_CACHE_TIMEOUT', 600)
+# Durata del lock di ricalcolo e attesa massima di chi trova il lock occupato
+TIMEOUT_LOCK = 30
+ATTESA_MAX = 5
+# Campi di StatisticheAnno restituiti da statistiche_anno()
+CAMPI_ANNO = (
+    'totale_iscritti', 'totale_edizioni', 'totale_iscrizioni_corso', 'totale_lezioni',
+    'edizioni_per_categoria', 'per_categoria', 'top_corsi', 'presenza_media',
+)
+
+
+def _chiave_versione(anno_id):
+    return f"{PREFISSO}:versione:{anno_id or 'generale'}"
+
+
+def versione(anno_id=None):
+    """Versione corrente delle statistiche generali (anno_id=None) o di un anno"""
+    chiave = _chiave_versione(anno_id)
+    valore = cache.get(chiave)
+    if valore is None:
+        # Versione persa (primo avvio o eliminata dal backend): ne crea una nuova
+        cache.add(chiave, uuid.uuid4().hex, None)
+        valore = cache.get(chiave)
+    return valore
+
+
+def invalida(anno_id=None):
+    """
+    Rende obsolete le statistiche generali e, se indicato, quelle di un anno.
+    Una versione casuale (invece di un contatore) non può tornare a coincidere
+    con uno snapshot vecchio se la chiave viene eliminata dal backend.
+    """
+    chiavi = [_chiave_versione(None)] + ([_chiave_versione(anno_id)] if anno_id else [])
+    cache.set_many({chiave: uuid.uuid4().hex for chiave in chiavi}, None)
+    if anno_id:
+        StatisticheAnno.objects.filter(pk=anno_id).update(versione=F('versione') + 1)
+
+
+def invalida_tutto():
+    """
+    Rende obsolete le statistiche di tutti gli anni, dopo le scritture massive
+    (bulk_create, update) che non emettono segnali
+    """
+    cache.set_many({
+        _chiave_versione(anno_id): uuid.uuid4().hex
+        for anno_id in [None] + list(AnnoAccademico.objects.values_list('id', flat=True))
+    }, None)
+    StatisticheAnno.objects.update(versione=F('versione') + 1)
+
+
+def _snapshot(nome, anno_id, calcola):
+    """
+    Restituisce lo snapshot nome/anno_id dalla cache se ancora valido, altrimenti
+    lo ricalcola con calcola(). Protezione dallo stampede: il ricalcolo è eseguito
+    solo da chi ottiene il lock; gli altri usano lo snapshot precedente se c'è,
+    altrimenti attendono fino a ATTESA_MAX secondi prima di calcolarlo da sé.
+    """
+    chiave = f"{PREFISSO}:{nome}:{anno_id or 'generale'}"
+    chiave_lock = f"{chiave}:lock"
+    attuale = versione(anno_id)
+    voce = cache.get(chiave)
+    if voce and voce['versione'] == attuale:
+        return voce['dati']
+
+    token = lock.acquisisci(chiave_lock, TIMEOUT_LOCK)
+    if token is None:
+        if voce:
+            return voce['dati']
+        scadenza = time.monotonic() + ATTESA_MAX
+        while time.monotonic() < scadenza:
+            time.sleep(0.1)
+            voce = cache.get(chiave)
+            if voce:
+                return voce['dati']
+        logger.warning("Statistiche %s: lock di ricalcolo occupato da oltre %ss", chiave, ATTESA_MAX)
+
+    try:
+        inizio = time.perf_counter()
+        dati = calcola()
+        # Salvato con la versione letta prima del calcolo: se nel frattempo c'è
+        # stata una scrittura, il prossimo accesso lo ricalcola
+        cache.set(chiave, {'versione': attuale, 'dati': dati}, TIMEOUT)
+        logger.debug("Statistiche %s ricalcolate in %.3fs", chiave, time.perf_counter() - inizio)
+    finally:
+        # Chi ha smesso di attendere non ha il lock e non lo cancella
+        lock.rilascia(chiave_lock, token)
+    return dati
+
+
+def _top_corsi(anno_id):
+    """Le 10 edizioni con più iscritti, con i soli dati mostrati dai template (salvati in JSON)"""
+    return [{
+        'pk': edizione.pk,
+        'corso': {
+            'nome': edizione.corso.nome,
+            'categoria': {'nome': edizione.corso.categoria.nome} if edizione.corso.categoria else None,
+        },
+        'quadrimestre': str(edizione.quadrimestre),
+        'docente': {'nome': edizione.docente.nome},
+        'numero_iscritti': edizione.numero_iscritti,
+    } for edizione in EdizioneCorso.objects.filter(
+        anno_accademico_id=anno_id
+    ).select_related(
+        'corso__categoria', 'quadrimestre', 'docente'
+    ).order_by('-numero_iscritti')[:10]]
+
+
+def statistiche_generali():
+    """Totali della home page"""
+    return _snapshot('generali', None, lambda: {
+        'totale_iscritti': Iscritto.objects.count(),
+        'totale_docenti': Docente.objects.filter(attivo=True).count(),
+        'totale_corsi': Corso.objects.filter(visibile=True).count(),
+    })
+
+
+def calcola_anno(anno_id):
+    """Statistiche di un anno calcolate dalle tabelle, nei campi di StatisticheAnno"""
+    edizioni = EdizioneCorso.objects.filter(anno_accademico_id=anno_id)
+    lezioni = Lezione.objects.filter(edizione_corso__anno_accademico_id=anno_id)
+    return {
+        'totale_iscritti': IscrizioneAnnoAccademico.objects.filter(anno_accademico_id=anno_id).count(),
+        'totale_edizioni': edizioni.count(),
+        'totale_iscrizioni_corso': IscrizioneCorso.objects.filter(anno_accademico_id=anno_id).count(),
+        'totale_lezioni': lezioni.count(),
+        'edizioni_per_categoria': list(edizioni.values(
+            'corso__categoria__nome'
+        ).annotate(
+            totale=Count('id')
+        ).order_by('-totale')),
+        'per_categoria': list(edizioni.values(
+            'corso__categoria__nome'
+        ).annotate(
+            num_edizioni=Count('id'),
+            num_iscritti=Sum('numero_iscritti')
+        ).order_by('-num_iscritti')),
+        'top_corsi': _top_corsi(anno_id),
+        'presenza_media': lezioni.filter(numero_presenti__gt=0).aggregate(
+            Avg('numero_presenti')
+        )['numero_presenti__avg'] or 0,
+    }
+
+
+def snapshot_anno(anno_id, forza=False):
+    """
+    Riga di StatisticheAnno dell'anno, ricalcolata se manca, se è superata da
+    una scrittura o con forza=True. Il risultato viene salvato solo se la
+    versione non è cambiata durante il calcolo.
+    """
+    riga, _ = StatisticheAnno.objects.get_or_create(anno_accademico_id=anno_id)
+    if riga.aggiornate and not forza:
+        return riga
+
+    versione_letta = riga.versione
+    dati = calcola_anno(anno_id)
+    adesso = timezone.now()
+    StatisticheAnno.objects.filter(pk=anno_id, versione=versione_letta).update(
+        **dati, versione_calcolo=versione_letta, data_calcolo=adesso
+    )
+    for campo, valore in dati.items():
+        setattr(riga, campo, valore)
+    riga.versione_calcolo, riga.data_calcolo = versione_letta, adesso
+    return riga
+
+
+def statistiche_anno(anno_id):
+    """Statistiche di un anno accademico per home, dashboard e statistiche_anno"""
+    def calcola():
+        riga = snapshot_anno(anno_id)
+        return {campo: getattr(riga, campo) for campo in CAMPI_ANNO}
+    return _snapshot('anno', anno_id, calcola)
+
+
+def confronto_anni():
+    """Statistiche di tutti gli anni, dal più recente: una query se sono tutte aggiornate"""
+    def calcola():
+        confronto = []
+        for anno in AnnoAccademico.objects.select_related('statistiche').order_by('-anno'):
+            riga = getattr(anno, 'statistiche', None)  # RelatedObjectDoesNotExist è un AttributeError
+            if riga is None or not riga.aggiornate:
+                riga = snapshot_anno(anno.pk)
+            riga.anno_accademico = anno
+            confronto.append(riga)
+        return confronto
+    return _snapshot('confronto', None, calcola)
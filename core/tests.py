@@ -1,3 +1,1546 @@
-from django.test import TestCase
+"""
+UNIGEST - Test
+File: core/tests.py
+Descrizione: Test di UNIGEST. In testa il budget di query e di tempo per ogni
+URL di core/urls.py; seguono i test delle singole funzionalità, sulla base
+comune UnigestTestCase.
 
-# Create your tests here.
+Il dataset del budget è generato da seed_synthetic (300 iscritti, 2 anni): con
+decine di righe per pagina, una query per riga (N+1) sfora subito il budget.
+Ogni URL viene chiamato a cache vuota, cioè nel caso peggiore, con le
+statistiche degli anni precalcolate da aggiorna_statistiche. Un URL nuovo
+senza una voce in BUDGET fa fallire il test: il budget va dichiarato insieme
+alla vista.
+
+    python manage.py test core
+
+I tempi sono pensati per una macchina di sviluppo; su macchine lente si possono
+allargare con BUDGET_TEMPO_FATTORE=2.
+"""
+
+import base64
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from openpyxl import load_workbook
+from django.apps import apps
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from core import archivio_report, contatori, esportazioni, lavori, lock, pacchetti, reports, statistiche, urls
+from core.management.commands.collega_coniugi import collega_coppie, verifica_simmetria
+from core.management.commands.import_old_data import Command as ImportOldDataCommand
+from core.management.sorgente_file import SorgenteCsv, SorgenteDump, apri_sorgente
+from core.forms import IscrittoForm
+from core.middleware import (
+    CHIAVE_RINNOVO, CHIAVE_SESSIONE, AnnoAccademicoMiddleware, invalida_anni_accademici
+)
+from core.query_ripetute import QueryRipetuteMiddleware, impronta
+from core.paginazione import codifica_cursore
+from core.models import (
+    Autorita, Comune, AnnoAccademico, EdizioneCorso, IscrizioneAnnoAccademico, IscrizioneCorso,
+    Iscritto, Docente, Lezione, PresenzaLezione, StatisticheAnno, LavoroReport, ImportCheckpoint, ImportRigaLegacy,
+    ImportWatermark
+)
+
+FATTORE_TEMPO = float(os.environ.get('BUDGET_TEMPO_FATTORE', 1))
+# I file dei report generati nei test non finiscono nella MEDIA_ROOT del progetto
+MEDIA_TEST = tempfile.mkdtemp(prefix='unigest-test-media-')
+ARCHIVIO_TEST = os.path.join(MEDIA_TEST, 'archivio')
+LOCK_TEST = os.path.join(MEDIA_TEST, 'lock')
+
+# nome URL -> (numero massimo di query, tempo massimo in millisecondi)
+BUDGET = {
+    'home': (10, 300),
+    'dashboard': (4, 300),
+    'iscritto_list': (4, 300),
+    'iscritto_detail': (7, 300),
+    'iscritto_create': (6, 300),
+    'iscritto_update': (8, 300),
+    'iscritto_delete': (3, 300),
+    'docente_list': (4, 300),
+    'docente_detail': (3, 300),
+    'docente_create': (3, 300),
+    'docente_update': (4, 300),
+    'autorita_list': (4, 300),
+    'autorita_detail': (3, 300),
+    'autorita_create': (3, 300),
+    'autorita_update': (4, 300),
+    'corso_list': (4, 300),
+    'corso_detail': (4, 300),
+    'corso_create': (4, 300),
+    'corso_update': (5, 300),
+    'edizione_list': (4, 300),
+    'edizione_detail': (8, 300),
+    'edizione_create': (6, 500),
+    'edizione_update': (9, 500),
+    'gestione_iscrizioni': (4, 300),
+    'iscrizione_anno_list': (4, 300),
+    'iscrizione_anno_create': (3, 300),
+    'export_iscritti_excel': (4, 300),
+    'export_iscritti_csv': (2, 1000),
+    'iscrizione_corso_list': (4, 300),
+    'iscrizione_corso_create': (4, 300),
+    'lezione_list': (4, 300),
+    'lezione_detail': (3, 300),
+    'lezione_create': (2, 300),
+    'lezione_update': (3, 300),
+    'gestione_presenze': (5, 300),
+    'report_menu': (4, 500),
+    'foglio_presenze_pdf': (6, 300),
+    'elenco_iscritti_pdf': (6, 300),
+    'statistiche_anno': (6, 500),
+    'elenco_corsi_anno_pdf': (7, 300),
+    'rubrica_contatti_pdf': (6, 300),
+    'registro_lezioni_pdf': (6, 300),
+    'report_edizioni_zip': (4, 300),
+    'lavoro_report_detail': (3, 300),
+    'lavoro_report_stato': (3, 300),
+    'lavoro_report_scarica': (3, 300),
+    'ricerca_globale': (8, 300),
+    'iscritto_autocomplete': (2, 300),
+    'cambia_anno_accademico': (1, 300),
+}
+
+# Generazione di ogni tipo di report (core/lavori.py) fuori dall'archivio:
+# tipo -> (numero massimo di query, tempo massimo in millisecondi)
+BUDGET_REPORT = {
+    'foglio_presenze': (5, 500),
+    'elenco_iscritti': (5, 500),
+    'registro_lezioni': (5, 500),
+    'elenco_corsi_anno': (6, 500),
+    'rubrica_contatti': (5, 500),
+    'iscritti_excel': (3, 1000),
+    # Tre PDF per ogni edizione dell'anno, in un solo processo
+    'pacchetto_edizioni': (160, 3000),
+}
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_TEST, ignore_errors=True)
+
+
+# Vecchio database UNIPIEVE in miniatura, letto da import_old_data --sorgente come
+# cartella di CSV: tabella -> (colonne, righe). Gli iscritti 1 e 3 hanno lo stesso
+# codice fiscale, quindi il 3 viene rifiutato insieme alle sue iscrizioni.
+LEGACY = {
+    'TAnagrafe': (
+        ['Matr', 'Sesso', 'Titolo', 'Nominativo', 'Moglie', 'Indirizzo', 'Paese', 'Telefono', 'Cellulare',
+         'LuogoNascita', 'DataNascita', 'TitoloStudio', 'ProfAtt', 'ProfPass', 'Pensionato', 'Posta',
+         'Email', 'WhatsApp', 'CF'],
+        [
+            [1, 'M', 'Sig.', 'ROSSI MARIO', 2, 'Via Roma 1', 100, '0571111111', '', 'Empoli', '1950-03-01',
+             'Diploma', '', 'Impiegato', 'Si', 1, 'rossi@example.com', 1, 'RSSMRA50C01D403X'],
+            [2, 'F', 'Sig.ra', 'BIANCHI ANNA', 1, 'Via Roma 1', 100, '0571111111', '', 'Empoli', '1952-07-11',
+             'Laurea', 'Pensionato', '', 'Si', 1, '', 0, 'BNCNNA52L51D403Y'],
+            [3, 'F', '', 'VERDI LUCIA', 0, 'Via Pisa 3', 101, '', '3331234567', 'Vinci', '',
+             '', '', '', 'No', 0, '', 0, 'RSSMRA50C01D403X'],
+        ],
+    ),
+    'TTitoloStudio': (['TitoloStudio'], [['Diploma'], ['Laurea']]),
+    'TProfAtt': (['ProfAtt'], [['Pensionato']]),
+    'TProfPass': (['ProfPass'], [['Impiegato']]),
+    'TDocenti': (
+        ['ID', 'Titolo', 'Nome', 'Telefono', 'Cellulare', 'Indirizzo', 'Paese', 'Cap', 'Email'],
+        [[1, 'Prof.', 'NERI CARLO', '', '', '', 100, '', 'neri@example.com'],
+         [2, 'Dott.ssa', 'BRUNI ELENA', '', '', '', 101, '', '']],
+    ),
+    'TAutorita': (
+        ['ID', 'Titolo', 'Nome', 'Carica', 'Indirizzo', 'Paese', 'Cap', 'Telefono', 'Email'],
+        [[1, 'Dott.', 'GIALLI PAOLO', 'Sindaco', '', 100, '', '', '']],
+    ),
+    'TCategorie': (['IDCAT', 'Categoria'], [[1, 'Lingue'], [2, 'Cultura']]),
+    'TGruppi': (['ID', 'Gruppo'], [[1, 'Mattina']]),
+    'TCorsi': (
+        ['Codice', 'Corsi', 'Dettaglio', 'CAT', 'GRUPPO', 'Visibile'],
+        [[10, 'Inglese', '', 1, 1, 1], [20, 'Storia locale', '', 2, 0, 1]],
+    ),
+    'TAnnoAccademico': (['AnnoAccademico', 'progr'], [['2023/2024', 1], ['2024/2025', 2]]),
+    'TCorsiAnnualiDocenti': (
+        ['ID', 'Anno', 'Codice', 'Descrizione', 'Quadrimestre', 'Insegnante', 'Assistente', 'Vice',
+         'Giorni', 'Dalle', 'Alle', 'Note'],
+        [[101, '2024/2025', 10, '', 1, 1, 0, 0, 'Lun', '09:00', '11:00', ''],
+         [102, '2024/2025', 20, '', 2, 2, 0, 0, 'Mer', '15:00', '17:00', '']],
+    ),
+    'TIscrizioneAnnoAccademico': (
+        ['AnnoAccademico', 'Matricola', 'Ricevuta', 'Data'],
+        [['2024/2025', 1, 1, '2024-10-01'], ['2024/2025', 2, 2, '2024-10-01'], ['2024/2025', 3, 3, '2024-10-02']],
+    ),
+    'TFrequenzaCorsi': (
+        ['AnnoAccademico', 'Corso', 'Matricola', 'Ricevuta', 'Data'],
+        [['2024/2025', 10, 1, 1, '2024-10-01'], ['2024/2025', 20, 2, 2, '2024-10-01'],
+         ['2024/2025', 10, 3, 3, '2024-10-02']],
+    ),
+    'TPresenzeCorsisti': (
+        ['ID_corso_annuale', 'data', 'corso', 'descrizione', 'insegnante', 'presenze', 'ore', 'annoacc'],
+        [[101, '2024-10-07', 10, 'Presentazione', 1, 2, 2.0, '2024/2025'],
+         [101, '2024-10-14', 10, 'Verbi', 1, 1, 2.0, '2024/2025'],
+         [102, '2024-10-09', 20, 'Le pievi', 2, 1, 1.5, '2024/2025']],
+    ),
+}
+
+
+def carica_legacy(alias='old_database'):
+    """Crea le tabelle di LEGACY nel database alias, con i tipi di colonna del vecchio database"""
+    with connections[alias].cursor() as cursor:
+        for tabella, (colonne, righe) in LEGACY.items():
+            righe = [[None if valore == '' else valore for valore in riga] for riga in righe]
+            tipi = []
+            for i in range(len(colonne)):
+                valore = next((riga[i] for riga in righe if riga[i] is not None), '')
+                tipi.append(
+                    'INTEGER' if isinstance(valore, int) else 'REAL' if isinstance(valore, float)
+                    else 'TIMESTAMP' if re.match(r'^\d{4}-\d{2}-\d{2}$', valore) else 'TEXT'
+                )
+            for riga in righe:
+                for i, tipo in enumerate(tipi):
+                    if tipo == 'TIMESTAMP' and riga[i]:
+                        riga[i] += ' 00:00:00'
+            cursor.execute(f'CREATE TABLE "{tabella}" ({", ".join(f"{c} {t}" for c, t in zip(colonne, tipi))})')
+            cursor.executemany(f'INSERT INTO "{tabella}" VALUES ({", ".join(["%s"] * len(colonne))})', righe)
+
+
+# Dati importati confrontati tra due importazioni: modello -> campi (senza chiavi
+# autoincrementali né date di inserimento)
+IMPORTATI = {
+    'Comune': ('id', 'nome'),
+    'TitoloStudio': ('descrizione',),
+    'ProfessioneAttuale': ('descrizione',),
+    'ProfessionePassata': ('descrizione',),
+    'Iscritto': ('matricola', 'sesso', 'titolo', 'nominativo', 'indirizzo', 'comune_id', 'telefono', 'cellulare',
+                 'luogo_nascita', 'data_nascita', 'codice_fiscale', 'email', 'ha_whatsapp', 'riceve_posta',
+                 'e_pensionato', 'titolo_studio__descrizione', 'professione_attuale__descrizione',
+                 'professione_passata__descrizione', 'coniuge_id'),
+    'Docente': ('id', 'titolo', 'nome', 'telefono', 'cellulare', 'indirizzo', 'comune_id', 'email', 'attivo'),
+    'Autorita': ('id', 'titolo', 'nome', 'carica', 'email'),
+    'CategoriaCorso': ('id', 'nome', 'ordine'),
+    'GruppoCorso': ('id', 'nome'),
+    'Corso': ('codice', 'nome', 'descrizione', 'categoria_id', 'gruppo_id'),
+    'AnnoAccademico': ('anno', 'data_inizio', 'data_fine', 'attivo'),
+    'EdizioneCorso': ('id', 'anno_accademico__anno', 'corso__codice', 'quadrimestre__numero', 'docente_id',
+                      'descrizione_custom', 'giorni_settimana', 'ora_inizio', 'ora_fine',
+                      'numero_iscritti', 'numero_lezioni'),
+    'IscrizioneAnnoAccademico': ('anno_accademico__anno', 'iscritto_id', 'numero_ricevuta', 'data_iscrizione'),
+    'IscrizioneCorso': ('anno_accademico__anno', 'edizione_corso_id', 'iscritto_id', 'numero_ricevuta', 'data_iscrizione'),
+    'Lezione': ('edizione_corso_id', 'data_lezione', 'descrizione', 'docente_id', 'numero_presenti', 'ore_lezione'),
+    'IndiceRicerca': ('tipo', 'oggetto_id', 'testo'),
+}
+
+
+def scrivi_legacy(cartella, **tabelle):
+    """Scrive in cartella un CSV per tabella di LEGACY; tabelle sostituisce le righe di alcune tabelle"""
+    for tabella, (colonne, righe) in LEGACY.items():
+        with open(os.path.join(cartella, f'{tabella}.csv'), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(colonne)
+            writer.writerows(tabelle.get(tabella, righe))
+
+
+def leggi_zip(file):
+    """Contenuto di ogni file dello ZIP, per nome"""
+    with zipfile.ZipFile(file) as archivio:
+        return {nome: archivio.read(nome) for nome in archivio.namelist()}
+
+
+# Cache in memoria; file dei report, PDF archiviati e lock nelle cartelle temporanee
+# dei test invece che in quelle del progetto
+IMPOSTAZIONI_TEST = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'ALLOWED_HOSTS': ['testserver'],
+    'MEDIA_ROOT': MEDIA_TEST,
+    'REPORT_CACHE_DIR': ARCHIVIO_TEST,
+    'LOCK_DIR': LOCK_TEST,
+}
+
+
+@override_settings(**IMPOSTAZIONI_TEST)
+class UnigestTestCase(TestCase):
+    """
+    Base dei test sul database, con IMPOSTAZIONI_TEST: dataset generato da
+    seed_synthetic con i parametri di DATI (None per partire dal database vuoto)
+    e cache svuotata a ogni test.
+    """
+    DATI = {'iscritti': 100, 'anni': 1, 'seed': 7}
+
+    @classmethod
+    def setUpTestData(cls):
+        if cls.DATI:
+            call_command('seed_synthetic', **cls.DATI, stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+
+# Come in produzione (docker.env.example): le viste dei report accodano e basta
+@override_settings(REPORT_IN_BACKGROUND=True)
+class BudgetQueryTest(UnigestTestCase):
+    """Ogni URL dell'app resta entro il suo budget di query e di tempo"""
+    DATI = {'iscritti': 300, 'anni': 2, 'seed': 42}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Come in produzione, dove le statistiche degli anni sono precalcolate
+        call_command('aggiorna_statistiche', stdout=StringIO())
+        Autorita.objects.create(nome='Mario Rossi', carica='Sindaco', comune=Comune.objects.first())
+
+        cls.anno = AnnoAccademico.objects.order_by('-anno').first()
+        cls.edizione = EdizioneCorso.objects.filter(
+            anno_accademico=cls.anno, lezioni__isnull=False
+        ).order_by('pk').first()
+        iscritto_id = IscrizioneCorso.objects.filter(edizione_corso=cls.edizione).values_list('iscritto_id', flat=True)[0]
+        # Chiave primaria da usare per ogni prefisso di nome URL (iscritto_detail -> iscritto)
+        cls.pk = {
+            'iscritto': iscritto_id,
+            'docente': cls.edizione.docente_id,
+            'autorita': Autorita.objects.get().pk,
+            'corso': cls.edizione.corso_id,
+            'edizione': cls.edizione.pk,
+            'gestione': cls.edizione.pk,
+            'lezione': cls.edizione.lezioni.order_by('pk').first().pk,
+            'lavoro': lavori.esegui(lavori.accoda('elenco_iscritti', 'test', edizione_id=cls.edizione.pk)).pk,
+        }
+
+    def url(self, pattern):
+        kwargs = {}
+        for nome in pattern.pattern.converters:
+            if nome == 'pk':
+                kwargs[nome] = self.pk[pattern.name.split('_')[0]]
+            elif nome == 'edizione_id':
+                kwargs[nome] = self.edizione.pk
+            elif nome == 'anno_id':
+                kwargs[nome] = self.anno.pk
+        url = reverse(f'core:{pattern.name}', kwargs=kwargs)
+        if pattern.name in ('ricerca_globale', 'iscritto_autocomplete'):
+            url += '?q=ross'
+        return url
+
+    def test_ogni_url_ha_un_budget(self):
+        senza_budget = [p.name for p in urls.urlpatterns if p.name not in BUDGET]
+        self.assertEqual(senza_budget, [], 'URL senza budget di query in core/tests.py')
+
+    def test_budget_query_e_tempo(self):
+        for pattern in urls.urlpatterns:
+            if pattern.name not in BUDGET:
+                continue
+            max_query, max_ms = BUDGET[pattern.name]
+            url = self.url(pattern)
+            with self.subTest(url=pattern.name):
+                cache.clear()
+                with CaptureQueriesContext(connection) as query:
+                    inizio = time.perf_counter()
+                    response = self.client.get(url)
+                    if response.streaming:
+                        # Le risposte in streaming eseguono le query durante l'invio
+                        b''.join(response.streaming_content)
+                    durata = (time.perf_counter() - inizio) * 1000
+                self.assertIn(response.status_code, (200, 302), url)
+                self.assertLessEqual(
+                    len(query), max_query,
+                    f'{url}: {len(query)} query (budget {max_query})\n'
+                    + '\n'.join(q['sql'][:200] for q in query.captured_queries)
+                )
+                self.assertLessEqual(durata, max_ms * FATTORE_TEMPO, f'{url}: {durata:.0f} ms (budget {max_ms} ms)')
+
+    def test_ogni_report_ha_un_budget(self):
+        self.assertEqual(sorted(BUDGET_REPORT), sorted(lavori.TIPI), 'Tipi di report senza budget in core/tests.py')
+
+    @override_settings(REPORT_PROCESSI=1)
+    def test_budget_generazione_report(self):
+        # Con REPORT_IN_BACKGROUND=True le URL dei report misurano solo l'accodamento: qui la generazione vera
+        parametri = {
+            'foglio_presenze': {'edizione_id': self.edizione.pk},
+            'elenco_iscritti': {'edizione_id': self.edizione.pk},
+            'registro_lezioni': {'edizione_id': self.edizione.pk},
+            'elenco_corsi_anno': {'anno_id': self.anno.pk},
+            'rubrica_contatti': {'anno_id': self.anno.pk},
+            'iscritti_excel': {},
+            'pacchetto_edizioni': {'anno_id': self.anno.pk},
+        }
+        for tipo, (max_query, max_ms) in BUDGET_REPORT.items():
+            with self.subTest(tipo=tipo):
+                shutil.rmtree(ARCHIVIO_TEST, ignore_errors=True)
+                with CaptureQueriesContext(connection) as query:
+                    inizio = time.perf_counter()
+                    contenuto, _ = lavori.genera(tipo, **parametri[tipo])
+                    durata = (time.perf_counter() - inizio) * 1000
+                contenuto.close()
+                self.assertLessEqual(
+                    len(query), max_query,
+                    f'{tipo}: {len(query)} query (budget {max_query})\n'
+                    + '\n'.join(q['sql'][:200] for q in query.captured_queries)
+                )
+                self.assertLessEqual(durata, max_ms * FATTORE_TEMPO, f'{tipo}: {durata:.0f} ms (budget {max_ms} ms)')
+
+
+@override_settings(QUERY_RIPETUTE_ATTIVO=True, QUERY_RIPETUTE_SOGLIA=3, QUERY_RIPETUTE_CAMPIONE=1.0)
+class QueryRipetuteTest(TestCase):
+    """Il middleware segnala le query ripetute oltre la soglia, ignorando i valori"""
+
+    def test_impronta_ignora_i_valori(self):
+        self.assertEqual(
+            impronta("SELECT * FROM t WHERE a = 1 AND b = 'x' AND c IN (%s, %s)"),
+            impronta("SELECT *  FROM t WHERE a = 25 AND b = 'l''altro' AND c IN (%s)"),
+        )
+
+    def test_segnala_query_oltre_la_soglia(self):
+        def vista(request):
+            for anno in range(5):
+                list(AnnoAccademico.objects.filter(anno=f'{anno}'))
+            list(Comune.objects.all())
+            return None
+
+        middleware = QueryRipetuteMiddleware(vista)
+        with self.assertLogs('core.query_ripetute', 'WARNING') as log:
+            middleware(RequestFactory().get('/'))
+        self.assertEqual(len(log.output), 1)
+        self.assertIn('5 volte', log.output[0])
+        self.assertIn('core_annoaccademico', log.output[0])
+        self.assertIn('core/tests.py', log.output[0])
+
+
+class PresenzeLezioneTest(UnigestTestCase):
+    """gestione_presenze crea le presenze mancanti e salva solo quelle cambiate"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lezione = Lezione.objects.filter(edizione_corso__numero_iscritti__gt=2).first()
+        cls.url = reverse('core:gestione_presenze', kwargs={'pk': cls.lezione.pk})
+
+    def test_presenze_create_e_salvate(self):
+        PresenzaLezione.objects.filter(lezione=self.lezione).delete()
+        iscritti = set(IscrizioneCorso.objects.filter(
+            edizione_corso_id=self.lezione.edizione_corso_id
+        ).values_list('iscritto_id', flat=True))
+
+        # Le presenze mancanti nascono tutte presenti, una volta sola
+        self.assertEqual(len(self.client.get(self.url).context['presenze']), len(iscritti))
+        self.client.get(self.url)
+        presenze = PresenzaLezione.objects.filter(lezione=self.lezione)
+        self.assertEqual(set(presenze.values_list('iscritto_id', flat=True)), iscritti)
+        self.assertFalse(presenze.filter(presente=False).exists())
+
+        presenti = list(presenze.order_by('pk').values_list('pk', flat=True)[:2])
+        dati = {f'presenza_{pk}': 'on' for pk in presenti}
+        response = self.client.post(self.url, dati)
+        self.assertRedirects(response, reverse('core:lezione_detail', kwargs={'pk': self.lezione.pk}))
+        self.assertEqual(set(presenze.filter(presente=True).values_list('pk', flat=True)), set(presenti))
+        self.lezione.refresh_from_db()
+        self.assertEqual(self.lezione.numero_presenti, 2)
+
+        # Nessuna presenza cambiata: nessun aggiornamento delle presenze
+        with CaptureQueriesContext(connection) as query:
+            self.client.post(self.url, dati)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "core_presenzalezione"') for q in query.captured_queries), 0)
+
+        self.client.post(self.url, {})
+        self.lezione.refresh_from_db()
+        self.assertEqual(self.lezione.numero_presenti, 0)
+
+
+@override_settings(SESSION_RINNOVO=3600)
+class AnnoAccademicoMiddlewareTest(UnigestTestCase):
+    """L'anno selezionato si risolve senza query ripetute e la sessione viene scritta solo se serve"""
+    DATI = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vecchio = AnnoAccademico.objects.create(anno='2022-2023', data_inizio=date(2022, 10, 1), data_fine=date(2023, 6, 30))
+        cls.attivo = AnnoAccademico.objects.create(anno='2023-2024', data_inizio=date(2023, 10, 1), data_fine=date(2024, 6, 30), attivo=True)
+        cls.recente = AnnoAccademico.objects.create(anno='2024-2025', data_inizio=date(2024, 10, 1), data_fine=date(2025, 6, 30))
+
+    def richiesta(self, sessione=None, corrente='2030-2031'):
+        """(id dell'anno risolto nella vista, sessione) di una richiesta passata dal middleware"""
+        request = RequestFactory().get('/')
+        request.session = sessione if sessione is not None else SessionStore()
+        risolto = {}
+
+        def vista(request):
+            risolto['anno'] = getattr(request.anno_accademico, 'pk', None)
+            return HttpResponse()
+
+        with mock.patch('core.middleware.calcola_anno_corrente', return_value=corrente):
+            AnnoAccademicoMiddleware(vista)(request)
+        return risolto['anno'], request.session
+
+    def test_anno_selezionato(self):
+        # Senza selezione: l'anno corrente per data, poi quello attivo, poi il più recente
+        self.assertEqual(self.richiesta(corrente='2022-2023')[0], self.vecchio.pk)
+        anno, sessione = self.richiesta()
+        self.assertEqual(anno, self.attivo.pk)
+        self.assertEqual(sessione[CHIAVE_SESSIONE], self.attivo.pk)
+        AnnoAccademico.objects.filter(pk=self.attivo.pk).update(attivo=False)
+        invalida_anni_accademici()
+        self.assertEqual(self.richiesta()[0], self.recente.pk)
+
+        # Anno in sessione, anche dopo una modifica degli anni (segnali e versione in cache)
+        sessione = SessionStore()
+        sessione[CHIAVE_SESSIONE] = self.vecchio.pk
+        self.assertEqual(self.richiesta(sessione)[0], self.vecchio.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vecchio.delete()
+        self.assertEqual(self.richiesta(sessione)[0], self.recente.pk)
+
+        response = self.client.post(reverse('core:cambia_anno_accademico'), {'anno_id': self.attivo.pk, 'next': '/unigest/'})
+        self.assertRedirects(response, '/unigest/', fetch_redirect_response=False)
+        self.assertEqual(self.client.session[CHIAVE_SESSIONE], self.attivo.pk)
+
+    def test_anni_letti_una_volta(self):
+        self.richiesta()
+        with self.assertNumQueries(0):
+            self.richiesta()
+        with self.captureOnCommitCallbacks(execute=True):
+            nuovo = AnnoAccademico.objects.create(anno='2025-2026', data_inizio=date(2025, 10, 1), data_fine=date(2026, 6, 30))
+            # Fino al commit le altre richieste continuano a usare gli anni già letti
+            with self.assertNumQueries(0):
+                self.richiesta()
+        self.assertEqual(self.richiesta(corrente='2025-2026')[0], nuovo.pk)
+
+    def test_sessione_rinnovata_al_piu_ogni_session_rinnovo(self):
+        _, sessione = self.richiesta()
+        self.assertTrue(sessione.modified)
+        rinnovata = sessione[CHIAVE_RINNOVO]
+
+        # Anno invariato e rinnovo recente: la sessione non viene riscritta
+        sessione.modified = False
+        self.richiesta(sessione)
+        self.assertFalse(sessione.modified)
+
+        # Rinnovo più vecchio di SESSION_RINNOVO: la sessione viene riscritta per prolungarne la scadenza
+        with mock.patch('core.middleware.time.time', return_value=rinnovata + 3601):
+            self.richiesta(sessione)
+        self.assertTrue(sessione.modified)
+        self.assertEqual(sessione[CHIAVE_RINNOVO], rinnovata + 3601)
+
+
+@override_settings(AUTOCOMPLETE_PER_PAGINA=2)
+class AutocompletamentoIscrittiTest(UnigestTestCase):
+    """I campi iscritto cercano sull'endpoint JSON a pagine e nell'HTML hanno solo l'opzione selezionata"""
+    DATI = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rossi = [Iscritto.objects.create(sesso='M', nominativo=f'ROSSI MARIO {lettera}') for lettera in 'ABCDE']
+        cls.nicolo = Iscritto.objects.create(sesso='M', nominativo='BIANCHI NICOLÒ', codice_fiscale='BNCNCL50A01D403Z',
+                                             e_assistente=True)
+        cls.url = reverse('core:iscritto_autocomplete')
+
+    def cerca(self, **parametri):
+        dati = self.client.get(self.url, parametri).json()
+        return [risultato['id'] for risultato in dati['risultati']], dati['altri']
+
+    def test_ricerca_e_pagine(self):
+        rossi = [iscritto.pk for iscritto in self.rossi]
+        self.assertEqual(self.cerca(q='ross'), (rossi[:2], True))
+        self.assertEqual(self.cerca(q='ross', pagina=2), (rossi[2:4], True))
+        self.assertEqual(self.cerca(q='ross', pagina=3), (rossi[4:], False))
+        self.assertEqual(self.cerca(q='ross', pagina='x'), (rossi[:2], True))
+        self.assertEqual(self.cerca(q='ross mario d'), ([rossi[3]], False))
+
+        # Senza accenti, per codice fiscale (prefisso) e per matricola
+        for query in ('nicolo', 'bncncl', str(self.nicolo.pk)):
+            with self.subTest(query):
+                self.assertEqual(self.cerca(q=query), ([self.nicolo.pk], False))
+        self.assertEqual(self.cerca(q='ross', assistenti=1), ([], False))
+        self.assertEqual(self.cerca(assistenti=1), ([self.nicolo.pk], False))
+        self.assertEqual(self.client.get(self.url, {'q': 'bianchi'}).json()['risultati'][0]['testo'], str(self.nicolo))
+
+    def test_widget_solo_opzione_selezionata(self):
+        iscritto = self.rossi[0]
+        iscritto.coniuge = self.nicolo
+        with self.assertNumQueries(1):
+            html = str(IscrittoForm(instance=iscritto)['coniuge'])
+        self.assertEqual(html.count('<option'), 2)
+        self.assertIn(f'value="{self.nicolo.pk}" selected', html)
+        self.assertIn(f'data-autocomplete="{self.url}"', html)
+
+
+class ListePaginateTest(UnigestTestCase):
+    """Liste paginate a chiave e filtrate per anno accademico"""
+    DATI = {'iscritti': 150, 'anni': 2, 'seed': 7}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.anni = list(AnnoAccademico.objects.order_by('anno'))
+
+    def scorri(self, url, link, inizio=''):
+        """Pagine (numero, chiavi primarie) dalla pagina inizio, seguendo il link indicato finché c'è"""
+        pagine = []
+        response = self.client.get(url + inizio)
+        while True:
+            pagina = response.context['page_obj']
+            pagine.append((pagina.numero, [oggetto.pk for oggetto in pagina.oggetti]))
+            if getattr(pagina, link) is None:
+                return pagine, response.context['page_obj']
+            response = self.client.get(url + getattr(pagina, link))
+
+    def test_cursore_avanti_e_indietro(self):
+        for nome, modello, ordine in (
+            ('iscritto_list', Iscritto, ('nominativo', 'matricola')),
+            ('lezione_list', Lezione, ('-data_lezione', 'edizione_corso_id')),
+        ):
+            with self.subTest(nome):
+                url = reverse(f'core:{nome}')
+                attese = list(modello.objects.order_by(*ordine).values_list('pk', flat=True))
+                avanti, ultima = self.scorri(url, 'url_successiva')
+                self.assertGreater(len(avanti), 2)
+                self.assertEqual([numero for numero, _ in avanti], list(range(1, len(avanti) + 1)))
+                self.assertEqual([pk for _, pagina in avanti for pk in pagina], attese)
+
+                # Tornando indietro dall'ultima pagina raggiunta: le stesse pagine con gli stessi numeri
+                indietro, _ = self.scorri(url, 'url_precedente', ultima.url_precedente)
+                self.assertEqual(indietro, avanti[-2::-1])
+
+                # ?ultima=1 legge le ultime righe all'indietro: pagine piene a partire dalla fine
+                indietro, _ = self.scorri(url, 'url_precedente', '?ultima=1')
+                self.assertEqual(indietro[0][0], len(avanti))
+                self.assertEqual([pk for _, pagina in indietro[::-1] for pk in pagina], attese)
+
+    def test_cursore_non_valido(self):
+        url = reverse('core:iscritto_list')
+        prima_pagina = self.client.get(url).context['page_obj']
+        cursori = [
+            '%%%', 'abc', base64.urlsafe_b64encode(b'non json').decode(),
+            base64.urlsafe_b64encode(b'{"n": 2}').decode(),
+            codifica_cursore([], 2),
+            codifica_cursore(['Rossi'], 2),
+            codifica_cursore([None, None], 2),
+            codifica_cursore([['Rossi'], {'m': 1}], 2),
+            base64.urlsafe_b64encode(b'{"v": ["Rossi", "1"], "n": "due"}').decode(),
+        ]
+        for cursore in cursori:
+            with self.subTest(cursore):
+                pagina = self.client.get(url, {'dopo': cursore}).context['page_obj']
+                self.assertEqual((pagina.numero, pagina.oggetti), (1, prima_pagina.oggetti))
+                self.assertFalse(pagina.has_previous())
+
+        # Valori del tipo sbagliato per i campi della chiave (data, id)
+        url = reverse('core:lezione_list')
+        prima_pagina = self.client.get(url).context['page_obj']
+        for valori in (['non una data', 1], ['2024-01-01', 'abc']):
+            with self.subTest(valori):
+                for parametro in ('dopo', 'prima'):
+                    risposta = self.client.get(url, {parametro: codifica_cursore(valori, 2)})
+                    pagina = risposta.context['page_obj']
+                    self.assertEqual((pagina.numero, pagina.oggetti), (1, prima_pagina.oggetti))
+
+    def test_filtro_anno_visibile(self):
+        for nome, modello in (('iscrizione_anno_list', IscrizioneAnnoAccademico), ('iscrizione_corso_list', IscrizioneCorso)):
+            url = reverse(f'core:{nome}')
+            sessione = self.client.session
+            sessione[CHIAVE_SESSIONE] = self.anni[0].pk
+            sessione.save()
+            for parametri, anno in (({}, self.anni[0]), ({'anno': self.anni[1].pk}, self.anni[1]), ({'anno': 'tutti'}, None)):
+                with self.subTest(nome, **parametri):
+                    response = self.client.get(url, parametri)
+                    self.assertEqual(response.context['anno_filtro'], anno)
+                    self.assertContains(response, f'Anno {anno.anno}' if anno else 'Tutti gli anni')
+                    iscrizioni = modello.objects.filter(anno_accademico=anno) if anno else modello.objects.all()
+                    self.assertEqual(response.context['page_obj'].totale, iscrizioni.count())
+                    if anno:
+                        self.assertEqual({i.anno_accademico_id for i in response.context['iscrizioni']}, {anno.pk})
+                    # Il filtro resta nei link delle altre pagine
+                    if 'anno' in parametri and response.context['page_obj'].has_next():
+                        self.assertIn(f"anno={parametri['anno']}", response.context['page_obj'].url_successiva)
+
+
+class EsportazioneIscrittiTest(UnigestTestCase):
+    """CSV ed Excel degli iscritti contengono tutte le righe, nell'ordine e nel formato attesi"""
+    DATI = None
+
+    @classmethod
+    def setUpTestData(cls):
+        empoli = Comune.objects.create(nome='Empoli')
+        cls.iscritti = [
+            Iscritto.objects.create(sesso='F', nominativo='BIANCHI ANNA', data_nascita=date(1950, 3, 1), comune=empoli,
+                                    telefono='0571 1', email='anna@example.com'),
+            Iscritto.objects.create(sesso='M', nominativo='ROSSI; "MARIO"', cellulare='333 1'),
+            Iscritto.objects.create(sesso='F', nominativo='VERDI LUCIA'),
+            Iscritto.objects.create(sesso='F', nominativo='VERDI LUCIA'),
+            Iscritto.objects.create(sesso='M', nominativo='ZANI NICOLÒ'),
+        ]
+        a, b, c, d, e = (iscritto.pk for iscritto in cls.iscritti)
+        cls.attese = [
+            ['Matricola', 'Nominativo', 'Sesso', 'Data Nascita', 'Comune', 'Telefono', 'Cellulare', 'Email'],
+            [a, 'BIANCHI ANNA', 'Femmina', '01/03/1950', 'Empoli', '0571 1', '', 'anna@example.com'],
+            [b, 'ROSSI; "MARIO"', 'Maschio', '', '', '', '333 1', ''],
+            [c, 'VERDI LUCIA', 'Femmina', '', '', '', '', ''],
+            [d, 'VERDI LUCIA', 'Femmina', '', '', '', '', ''],
+            [e, 'ZANI NICOLÒ', 'Maschio', '', '', '', '', ''],
+        ]
+
+    def test_blocchi(self):
+        # Il confine tra due blocchi cade tra i due omonimi: nessuna riga persa o ripetuta
+        blocchi = list(esportazioni.blocchi_iscritti(blocco=3))
+        self.assertEqual([len(righe) for righe in blocchi], [3, 2])
+        self.assertEqual([riga for righe in blocchi for riga in righe], self.attese[1:])
+
+    def test_csv(self):
+        response = self.client.get(reverse('core:export_iscritti_csv'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=iscritti.csv')
+        testo = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(testo.startswith('\ufeff'))
+        righe = list(csv.reader(StringIO(testo[1:]), delimiter=';'))
+        self.assertEqual(righe, [[str(valore) for valore in riga] for riga in self.attese])
+
+    def test_excel(self):
+        response = self.client.get(reverse('core:export_iscritti_excel'), follow=True)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="iscritti.xlsx"')
+        foglio = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)['Iscritti']
+        righe = [[valore if valore is not None else '' for valore in riga] for riga in foglio.iter_rows(values_only=True)]
+        self.assertEqual(righe, self.attese)
+
+
+class ContatoriEdizioneTest(UnigestTestCase):
+    """numero_iscritti e numero_lezioni seguono le scritture su iscrizioni e lezioni"""
+
+    def assertAllineati(self):
+        self.assertEqual(contatori.disallineate().count(), 0)
+
+    def test_seed_ricalcola_i_contatori(self):
+        self.assertAllineati()
+        self.assertTrue(EdizioneCorso.objects.filter(numero_iscritti__gt=0, numero_lezioni__gt=0).exists())
+
+    def test_creazione_spostamento_e_cancellazione(self):
+        iscrizione = IscrizioneCorso.objects.first()
+        altra = EdizioneCorso.objects.filter(
+            anno_accademico=iscrizione.anno_accademico
+        ).exclude(iscrizioni__iscritto=iscrizione.iscritto).first()
+
+        iscrizione.edizione_corso = altra
+        iscrizione.save()
+        self.assertAllineati()
+
+        lezione = Lezione.objects.first()
+        nuova = Lezione.objects.create(
+            edizione_corso=lezione.edizione_corso, data_lezione=date(2099, 1, 1), docente=lezione.docente
+        )
+        self.assertAllineati()
+
+        nuova.delete()
+        iscrizione.iscritto.delete()  # cascata sulle sue iscrizioni ai corsi
+        self.assertAllineati()
+
+    def test_lettura_senza_edizione(self):
+        iscrizione = IscrizioneCorso.objects.filter(edizione_corso__numero_iscritti__gt=0).first()
+        altra = EdizioneCorso.objects.filter(
+            anno_accademico=iscrizione.anno_accademico
+        ).exclude(iscrizioni__iscritto=iscrizione.iscritto).first()
+
+        parziale = IscrizioneCorso.objects.only('pk', 'numero_ricevuta').get(pk=iscrizione.pk)
+        parziale.numero_ricevuta = 99
+        parziale.save()
+        self.assertAllineati()
+
+        parziale = IscrizioneCorso.objects.defer('edizione_corso').get(pk=iscrizione.pk)
+        parziale.edizione_corso = altra
+        parziale.save()
+        self.assertAllineati()
+
+        lezione = Lezione.objects.defer('edizione_corso').first()
+        lezione.descrizione = 'modificata'
+        lezione.save()
+        self.assertAllineati()
+
+    def test_salvataggio_edizione_non_sovrascrive_i_contatori(self):
+        edizione = EdizioneCorso.objects.filter(numero_iscritti__gt=0).first()
+        letta_prima = EdizioneCorso.objects.get(pk=edizione.pk)
+        IscrizioneCorso.objects.filter(edizione_corso=edizione).first().delete()
+        letta_prima.note = 'modificata'
+        letta_prima.save()
+        self.assertAllineati()
+        self.assertEqual(letta_prima.numero_iscritti, edizione.numero_iscritti - 1)
+
+    def test_salvataggio_edizione_come_in_django(self):
+        edizione = EdizioneCorso.objects.filter(numero_iscritti__gt=0).first()
+        # update_fields esplicito con un contatore: viene scritto
+        edizione.numero_iscritti += 5
+        edizione.save(update_fields=['numero_iscritti'])
+        self.assertEqual(EdizioneCorso.objects.get(pk=edizione.pk).numero_iscritti, edizione.numero_iscritti)
+
+        # Riga non più presente: save() la inserisce di nuovo
+        EdizioneCorso.objects.filter(pk=edizione.pk).delete()
+        edizione.save()
+        self.assertTrue(EdizioneCorso.objects.filter(pk=edizione.pk).exists())
+
+    def test_lista_edizioni_in_una_query(self):
+        with self.assertNumQueries(1):
+            conteggi = [(e.numero_iscritti, e.numero_lezioni) for e in EdizioneCorso.objects.select_related('corso')]
+        self.assertTrue(conteggi)
+
+
+class StatisticheAnnoTest(UnigestTestCase):
+    """Le statistiche precalcolate restano valide fino alla prossima scrittura sull'anno"""
+    DATI = {'iscritti': 100, 'anni': 2, 'seed': 7}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        call_command('aggiorna_statistiche', stdout=StringIO())
+        cls.anno = AnnoAccademico.objects.order_by('anno').first()
+
+    def test_anno_precalcolato_in_una_query(self):
+        statistiche.versione(self.anno.pk)
+        with self.assertNumQueries(1):
+            dati = statistiche.statistiche_anno(self.anno.pk)
+        self.assertEqual(dati, statistiche.calcola_anno(self.anno.pk))
+
+    def test_scrittura_rende_obsolete_le_statistiche(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            IscrizioneCorso.objects.filter(anno_accademico=self.anno).first().delete()
+            # L'invalidazione aspetta il commit della scrittura
+            self.assertTrue(StatisticheAnno.objects.get(pk=self.anno.pk).aggiornate)
+        self.assertFalse(StatisticheAnno.objects.get(pk=self.anno.pk).aggiornate)
+        dati = statistiche.statistiche_anno(self.anno.pk)
+        self.assertEqual(dati, statistiche.calcola_anno(self.anno.pk))
+        self.assertTrue(StatisticheAnno.objects.get(pk=self.anno.pk).aggiornate)
+
+    def test_confronto_anni(self):
+        statistiche.versione()
+        with self.assertNumQueries(1):
+            confronto = statistiche.confronto_anni()
+        self.assertEqual([r.anno_accademico.anno for r in confronto],
+                         list(AnnoAccademico.objects.order_by('-anno').values_list('anno', flat=True)))
+
+
+@override_settings(LOCK_DIR=LOCK_TEST)
+class LockTest(SimpleTestCase):
+    """Un lock è di un solo processo alla volta e lo cancella solo chi lo ha preso"""
+
+    def test_acquisizione_e_rilascio(self):
+        token = lock.acquisisci('prova', 30)
+        self.assertIsNotNone(token)
+        self.assertIsNone(lock.acquisisci('prova', 30))
+        # Chi non ha il lock (ha smesso di attendere) non lo cancella
+        lock.rilascia('prova', None)
+        lock.rilascia('prova', 'token-di-un-altro')
+        self.assertIsNone(lock.acquisisci('prova', 30))
+        lock.rilascia('prova', token)
+        token = lock.acquisisci('prova', 30)
+        self.assertIsNotNone(token)
+        lock.rilascia('prova', token)
+
+    def test_lock_abbandonato_ripreso_dopo_la_durata(self):
+        abbandonato = lock.acquisisci('abbandonato', 30)
+        passato = time.time() - 60
+        os.utime(lock._percorso('abbandonato'), (passato, passato))
+        token = lock.acquisisci('abbandonato', 30)
+        self.assertNotIn(token, (None, abbandonato))
+        lock.rilascia('abbandonato', abbandonato)
+        self.assertIsNone(lock.acquisisci('abbandonato', 30))
+        lock.rilascia('abbandonato', token)
+
+    def test_un_solo_thread_ottiene_il_lock(self):
+        presi = []
+        partenza = threading.Barrier(8)
+
+        def prova():
+            partenza.wait()
+            presi.append(lock.acquisisci('conteso', 30))
+
+        threads = [threading.Thread(target=prova) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        vinti = [token for token in presi if token]
+        self.assertEqual(len(vinti), 1)
+        lock.rilascia('conteso', vinti[0])
+
+
+@override_settings(REPORT_IN_BACKGROUND=True)
+class LavoriReportTest(UnigestTestCase):
+    """I report richiesti dalle viste vengono generati dal worker e scaricati dalla pagina del lavoro"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.edizione = EdizioneCorso.objects.filter(numero_iscritti__gt=0).first()
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(ARCHIVIO_TEST, ignore_errors=True)
+
+    def test_richiesta_worker_e_download(self):
+        url = reverse('core:foglio_presenze_pdf', kwargs={'edizione_id': self.edizione.pk})
+        response = self.client.get(url)
+        lavoro = LavoroReport.objects.get()
+        self.assertRedirects(response, lavoro.get_absolute_url())
+        self.assertTrue(self.client.get(reverse('core:lavoro_report_stato', kwargs={'pk': lavoro.pk})).json()['in_attesa'])
+
+        # Una seconda richiesta uguale riusa il lavoro in attesa
+        self.client.get(url)
+        self.assertEqual(LavoroReport.objects.count(), 1)
+
+        call_command('worker_report', una_volta=True, stdout=StringIO())
+        lavoro.refresh_from_db()
+        self.assertEqual(lavoro.stato, LavoroReport.STATO_COMPLETATO)
+        response = self.client.get(reverse('core:lavoro_report_scarica', kwargs={'pk': lavoro.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        # Con gli stessi dati il PDF arriva subito dall'archivio, senza un nuovo lavoro
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(LavoroReport.objects.count(), 1)
+
+    @override_settings(REPORT_IN_BACKGROUND=False)
+    def test_senza_worker_generato_nella_richiesta(self):
+        # Il file arriva nella risposta: nessun lavoro (e quindi nessun file in MEDIA_ROOT) da ripulire
+        for url in (reverse('core:registro_lezioni_pdf', kwargs={'edizione_id': self.edizione.pk}),
+                    reverse('core:export_iscritti_excel')):
+            with self.subTest(url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+                self.assertTrue(b''.join(response.streaming_content)[:4] in (b'%PDF', b'PK\x03\x04'))
+        self.assertFalse(LavoroReport.objects.exists())
+
+    def test_errore_registrato_nel_lavoro(self):
+        lavoro = lavori.accoda('registro_lezioni', 'inesistente', edizione_id=0)
+        call_command('worker_report', una_volta=True, stdout=StringIO(), stderr=StringIO())
+        lavoro.refresh_from_db()
+        self.assertEqual(lavoro.stato, LavoroReport.STATO_ERRORE)
+        self.assertIn('DoesNotExist', lavoro.errore)
+
+    def test_lavoro_bloccato_torna_in_coda_e_scaduto_viene_cancellato(self):
+        bloccato = lavori.accoda('elenco_iscritti', 'test', edizione_id=self.edizione.pk)
+        in_corso = lavori.prendi_prossimo('worker-morto')
+        # In corso da un'ora ma con il segnale del worker appena aggiornato: è un lavoro lungo, non bloccato
+        LavoroReport.objects.filter(pk=bloccato.pk).update(data_inizio=timezone.now() - timedelta(hours=1))
+        self.assertTrue(lavori.segnala(in_corso))
+        self.assertEqual(lavori.recupera_bloccati(), 0)
+
+        LavoroReport.objects.filter(pk=bloccato.pk).update(data_segnale=timezone.now() - timedelta(hours=1))
+        self.assertEqual(lavori.recupera_bloccati(), 1)
+        self.assertEqual(LavoroReport.objects.get(pk=bloccato.pk).stato, LavoroReport.STATO_IN_CODA)
+
+        completato = lavori.esegui(lavori.prendi_prossimo('worker'))
+        percorso = completato.file.path
+        LavoroReport.objects.filter(pk=completato.pk).update(scadenza=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(lavori.pulisci_scaduti(), 1)
+        self.assertFalse(os.path.exists(percorso))
+
+
+class ArchivioReportTest(UnigestTestCase):
+    """I PDF con gli stessi dati vengono generati una volta sola e riletti da disco"""
+    DATI = {'iscritti': 100, 'anni': 1, 'seed': 11}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.edizione = EdizioneCorso.objects.filter(numero_iscritti__gt=0, numero_lezioni__gt=0).first()
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(ARCHIVIO_TEST, ignore_errors=True)
+        self.generati = 0
+
+    def genera(self, nome='report.pdf'):
+        def genera():
+            self.generati += 1
+            return tempfile.TemporaryFile(), nome
+        return genera
+
+    def test_chiave_cambia_con_i_dati(self):
+        parametri = {'edizione_id': self.edizione.pk}
+        iniziale = archivio_report.chiave('elenco_iscritti', **parametri)
+        self.assertEqual(archivio_report.chiave('elenco_iscritti', **parametri), iniziale)
+        self.assertNotEqual(archivio_report.chiave('foglio_presenze', **parametri), iniziale)
+
+        iscritto = self.edizione.iscrizioni.first().iscritto
+        iscritto.telefono = '000 1234567'
+        iscritto.save()
+        modificata = archivio_report.chiave('elenco_iscritti', **parametri)
+        self.assertNotEqual(modificata, iniziale)
+
+        self.edizione.iscrizioni.first().delete()
+        self.assertNotEqual(archivio_report.chiave('elenco_iscritti', **parametri), modificata)
+
+        registro = archivio_report.chiave('registro_lezioni', **parametri)
+        lezione = self.edizione.lezioni.first()
+        lezione.descrizione = 'Argomento cambiato'
+        lezione.save()
+        self.assertNotEqual(archivio_report.chiave('registro_lezioni', **parametri), registro)
+
+        corsi = archivio_report.chiave('elenco_corsi_anno', anno_id=self.edizione.anno_accademico_id)
+        self.edizione.giorni_settimana = 'Sabato'
+        self.edizione.save()
+        self.assertNotEqual(archivio_report.chiave('elenco_corsi_anno', anno_id=self.edizione.anno_accademico_id), corsi)
+
+    def test_generato_una_volta(self):
+        chiave = archivio_report.chiave('elenco_iscritti', edizione_id=self.edizione.pk)
+        primo = archivio_report.ottieni(chiave, self.genera('iscritti/corso.pdf'))
+        secondo = archivio_report.ottieni(chiave, self.genera())
+        self.assertEqual(self.generati, 1)
+        self.assertEqual(primo, secondo)
+        self.assertEqual(primo.name, 'iscritticorso.pdf')
+
+    def test_richieste_simultanee_attendono_il_primo(self):
+        chiave = 'ab' * 32
+        # Un altro processo ha il lock e salva il PDF poco dopo
+        token = lock.acquisisci(f'archivio_report:{chiave}:lock', archivio_report.TIMEOUT_LOCK)
+        salvataggio = threading.Timer(0.3, archivio_report.salva, [chiave, 'report.pdf', tempfile.TemporaryFile()])
+        salvataggio.start()
+        archivio_report.ottieni(chiave, self.genera())
+        salvataggio.join()
+        self.assertEqual(self.generati, 0)
+        lock.rilascia(f'archivio_report:{chiave}:lock', token)
+
+    def test_chi_smette_di_attendere_non_cancella_il_lock_altrui(self):
+        chiave = 'cd' * 32
+        chiave_lock = f'archivio_report:{chiave}:lock'
+        token = lock.acquisisci(chiave_lock, archivio_report.TIMEOUT_LOCK)
+        with mock.patch.object(archivio_report, 'ATTESA_MAX', 0.2), self.assertLogs('core.archivio_report', 'WARNING'):
+            archivio_report.ottieni(chiave, self.genera())
+        self.assertEqual(self.generati, 1)
+        # Il lock resta di chi lo aveva preso
+        self.assertIsNone(lock.acquisisci(chiave_lock, archivio_report.TIMEOUT_LOCK))
+        lock.rilascia(chiave_lock, token)
+
+    def test_cancellati_i_meno_usati(self):
+        chiavi = [f'{i:064x}' for i in range(3)]
+        for i, chiave in enumerate(chiavi):
+            with tempfile.TemporaryFile() as contenuto:
+                contenuto.write(b'x' * 1000)
+                archivio_report.salva(chiave, 'report.pdf', contenuto)
+            os.utime(archivio_report.cerca(chiave), (1000 + i, 1000 + i))
+        # Il primo è il più vecchio, ma una lettura lo rende il più recente
+        archivio_report.cerca(chiavi[0])
+
+        self.assertEqual(archivio_report.sfoltisci(limite=2000), 1)
+        self.assertIsNone(archivio_report.cerca(chiavi[1]))
+        self.assertIsNotNone(archivio_report.cerca(chiavi[0]))
+        self.assertIsNotNone(archivio_report.cerca(chiavi[2]))
+
+
+class PacchettoEdizioniTest(UnigestTestCase):
+    """Lo ZIP contiene i tre report di ogni edizione, una cartella per edizione"""
+    DATI = {'iscritti': 60, 'anni': 1, 'seed': 13}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.anno = AnnoAccademico.objects.get()
+
+    def test_zip_anno_e_quadrimestre(self):
+        with tempfile.TemporaryFile() as file:
+            scritti, errori = pacchetti.scrivi_zip(file, self.anno.pk, processi=1)
+            contenuto = leggi_zip(file)
+        edizioni = EdizioneCorso.objects.filter(anno_accademico=self.anno).count()
+        self.assertEqual((scritti, errori), (3 * edizioni, []))
+        self.assertEqual(len(contenuto), 3 * edizioni)
+        self.assertEqual(len({nome.split('/')[0] for nome in contenuto}), edizioni)
+        self.assertTrue(all(pdf.startswith(b'%PDF') for pdf in contenuto.values()))
+
+        with tempfile.TemporaryFile() as file:
+            scritti, _ = pacchetti.scrivi_zip(file, self.anno.pk, quadrimestre=1, processi=1)
+        self.assertEqual(scritti, 3 * pacchetti.edizioni(self.anno.pk, 1).count())
+
+    def test_comando(self):
+        output = os.path.join(MEDIA_TEST, 'pacchetto.zip')
+        call_command('report_edizioni', self.anno.anno, quadrimestre=2, processi=1, output=output, stdout=StringIO())
+        self.assertEqual(len(leggi_zip(output)), 3 * pacchetti.edizioni(self.anno.pk, 2).count())
+
+    def test_pool_con_al_piu_in_volo_pdf_per_processo(self):
+        # Pool finto: conta i PDF affidati e non ancora restituiti a scrivi_zip
+        affidati, restituiti, in_volo = [], [], []
+
+        class Pool:
+            def __init__(self, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *errore):
+                pass
+
+            def submit(self, funzione, tipo, edizione_id):
+                affidati.append((tipo, edizione_id))
+                in_volo.append(len(affidati) - len(restituiti))
+                futuro = Future()
+                futuro.set_result((b'%PDF', f'{tipo}.pdf'))
+                return futuro
+
+        richieste = [('foglio_presenze', numero) for numero in range(20)]
+        with mock.patch('core.pacchetti.ProcessPoolExecutor', Pool), mock.patch('core.pacchetti.connections'):
+            for richiesta, *_ in pacchetti._risultati(richieste, processi=3):
+                restituiti.append(richiesta)
+        self.assertEqual(sorted(restituiti), richieste)
+        self.assertEqual(max(in_volo), 3 * pacchetti.IN_VOLO)
+
+
+@override_settings(**IMPOSTAZIONI_TEST)
+class PacchettoProcessiTest(TransactionTestCase):
+    """
+    Con più processi il pacchetto contiene gli stessi PDF. I processi del pool
+    leggono le impostazioni dall'ambiente e non vedono il database di test in
+    memoria: i dati, già confermati (TransactionTestCase), vengono copiati in un file.
+    """
+
+    def test_pool_di_processi(self):
+        call_command('seed_synthetic', iscritti=60, anni=1, seed=13, stdout=StringIO())
+        anno = AnnoAccademico.objects.get()
+        cartella = tempfile.mkdtemp(prefix='unigest-test-pool-')
+        self.addCleanup(shutil.rmtree, cartella, ignore_errors=True)
+        with sqlite3.connect(os.path.join(cartella, 'db.sqlite3')) as copia:
+            connection.ensure_connection()
+            connection.connection.backup(copia)
+        ambiente = {
+            'DB_ENGINE': 'sqlite', 'DB_NAME': os.path.join(cartella, 'db.sqlite3'),
+            'CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'REPORT_CACHE_DIR': os.path.join(cartella, 'archivio'), 'LOCK_DIR': os.path.join(cartella, 'lock'),
+        }
+
+        with mock.patch.dict(os.environ, ambiente), tempfile.TemporaryFile() as file:
+            scritti, errori = pacchetti.scrivi_zip(file, anno.pk, quadrimestre=1, processi=2)
+            contenuto = leggi_zip(file)
+        with tempfile.TemporaryFile() as file:
+            pacchetti.scrivi_zip(file, anno.pk, quadrimestre=1, processi=1)
+            sequenziale = leggi_zip(file)
+
+        richiesti = 3 * pacchetti.edizioni(anno.pk, 1).count()
+        self.assertEqual((scritti, errori), (richiesti, []))
+        self.assertEqual(sorted(contenuto), sorted(sequenziale))
+        self.assertTrue(all(pdf.startswith(b'%PDF') for pdf in contenuto.values()))
+        # Generati dai processi del pool, nel loro archivio
+        self.assertEqual(len(list(Path(ambiente['REPORT_CACHE_DIR']).glob('??/*/*.pdf'))), richiesti)
+
+
+class TabellaReportTest(TestCase):
+    """Le tabelle dei PDF hanno celle semplici, salvo i testi da mandare a capo, e altezze già calcolate"""
+
+    def test_celle_e_altezze(self):
+        colonne = [
+            reports.colonna('Nominativo', 5*reports.cm, 'nome', allinea='LEFT'),
+            reports.colonna('Email', 3*reports.cm, 'email', a_capo=True),
+        ]
+        righe = [
+            {'nome': 'Rossi & Figli', 'email': 'breve@x.it'},
+            {'nome': 'Bianchi', 'email': 'un.indirizzo.molto.lungo@dominio-lunghissimo.example.com'},
+            {'nome': 'Verdi', 'email': None},
+        ]
+        tabella = reports.tabella(righe, colonne, reports.colors.black, numerata=True)
+        dati = tabella._cellvalues
+        self.assertEqual(dati[0], ['#', 'Nominativo', 'Email'])
+        self.assertEqual(dati[1], ['1', 'Rossi & Figli', 'breve@x.it'])
+        self.assertIsInstance(dati[2][2], reports.Paragraph)
+        self.assertEqual(dati[3][2], '-')
+        self.assertNotIn(None, tabella._argH)
+        self.assertGreater(tabella._argH[2], tabella._argH[1])
+        self.assertEqual(tabella.repeatRows, 1)
+
+
+class ImportOldDataTest(UnigestTestCase):
+    """
+    import_old_data con il vecchio database in miniatura, letto da una cartella
+    di CSV (--sorgente) o dalle tabelle create in old_database
+    """
+    databases = {'default', 'old_database'}
+    DATI = None
+
+    def setUp(self):
+        super().setUp()
+        self.cartella = tempfile.mkdtemp(prefix='unigest-test-legacy-')
+        self.addCleanup(shutil.rmtree, self.cartella, ignore_errors=True)
+
+    def importa(self, *opzioni, sorgente=True, **tabelle):
+        """Importazione dai CSV di LEGACY, o con sorgente=False da old_database (vedi carica_legacy)"""
+        if sorgente:
+            scrivi_legacy(self.cartella, **tabelle)
+            opzioni = ('--sorgente', self.cartella) + opzioni
+        output = StringIO()
+        call_command('import_old_data', *opzioni, stdout=output)
+        return output.getvalue()
+
+    def importati(self):
+        """Righe importate di ogni modello di IMPORTATI, ordinate"""
+        return {
+            modello: sorted(apps.get_model('core', modello).objects.values_list(*campi), key=repr)
+            for modello, campi in IMPORTATI.items()
+        }
+
+    def importa_e_annulla(self, *opzioni, **kwargs):
+        """Dati importati con le opzioni indicate, a partire dal database vuoto; l'importazione viene poi annullata"""
+        with transaction.atomic():
+            self.importa(*opzioni, **kwargs)
+            importati = self.importati()
+            transaction.set_rollback(True)
+        return importati
+
+    def test_bulk_equivalente_a_riga_per_riga(self):
+        riga_per_riga = self.importa_e_annulla()
+        self.assertEqual(len(riga_per_riga['Iscritto']), 2)
+        self.assertEqual(len(riga_per_riga['Lezione']), 3)
+        self.assertEqual(riga_per_riga, self.importa_e_annulla('--bulk'))
+        self.assertEqual(riga_per_riga, self.importa_e_annulla('--bulk', '--batch-size', '1'))
+
+    def test_sorgente_csv_equivalente_al_vecchio_database(self):
+        dai_csv = self.importa_e_annulla('--bulk')
+        carica_legacy()
+        self.assertEqual(dai_csv, self.importa_e_annulla('--bulk', sorgente=False))
+
+    def test_lettura_a_blocchi_dal_vecchio_database(self):
+        carica_legacy()
+        report = os.path.join(self.cartella, 'report.json')
+        a_blocchi = self.importa_e_annulla('--fetch-size', '1', '--report', report, sorgente=False)
+        self.assertEqual(len(a_blocchi['IscrizioneCorso']), 2)
+        self.assertEqual(a_blocchi, self.importa_e_annulla(sorgente=False))
+        with open(report, encoding='utf-8') as f:
+            sezioni = {sezione['nome']: sezione for sezione in json.load(f)['sezioni']}
+        self.assertEqual(sezioni['Anagrafica Iscritti']['righe_lette'], 3)
+        self.assertEqual(sezioni['Registro Lezioni']['righe_lette'], 3)
+
+    def test_report_delle_metriche_per_sezione(self):
+        report = os.path.join(self.cartella, 'report.json')
+        output = self.importa('--bulk', '--report', report)
+        with open(report, encoding='utf-8') as f:
+            dati = json.load(f)
+
+        self.assertEqual([sezione['nome'] for sezione in dati['sezioni']], [
+            'Tabelle Supporto', 'Staff Docente', 'Anagrafica Iscritti', 'Catalogo Corsi', 'Anni Accademici',
+            'Edizioni Annuali', 'Iscrizioni Anno', 'Iscrizioni Corsi', 'Registro Lezioni',
+        ])
+        self.assertTrue(dati['opzioni']['bulk'])
+        self.assertEqual(dati['sorgente'], self.cartella)
+        self.assertEqual(dati['totali']['iscritti'], 2)
+        self.assertEqual(dati['totali']['lezioni'], 3)
+
+        sezioni = {sezione['nome']: sezione for sezione in dati['sezioni']}
+        iscritti = sezioni['Anagrafica Iscritti']
+        self.assertEqual((iscritti['righe_lette'], iscritti['righe_scritte'], iscritti['errori']), (3, 2, 1))
+        self.assertIsNone(iscritti['errore_critico'])
+        # Una lettura del file di TAnagrafe, e le scritture sul nuovo database
+        self.assertEqual(iscritti['query']['sorgente'], 1)
+        self.assertGreater(iscritti['query']['default'], 0)
+        self.assertTrue(all(schema['sql'] for schema in iscritti['query_principali']))
+        self.assertEqual(sezioni['Registro Lezioni']['righe_scritte'], 3)
+
+        self.assertIn('Prestazioni per sezione', output)
+        self.assertRegex(output, r'- Anagrafica Iscritti: [\d.]+s / 3, 2 / ')
+
+        with self.assertRaises(CommandError):
+            self.importa('--report', os.path.join(self.cartella, 'inesistente', 'report.json'))
+
+    def test_savepoint_per_riga_nei_blocchi(self):
+        # Riga per riga: l'iscritto 2 viene scritto e poi fallisce, l'iscritto 3 ha il CF
+        # dell'iscritto 1. Si annullano solo le loro scritture, non il resto del blocco.
+        scrivi = ImportOldDataCommand.scrivi
+
+        def scrivi_poi_fallisce(comando, model, defaults=None, **lookup):
+            risultato = scrivi(comando, model, defaults=defaults, **lookup)
+            if lookup == {'matricola': 2}:
+                raise RuntimeError('scrittura interrotta')
+            return risultato
+
+        with transaction.atomic():
+            with mock.patch.object(ImportOldDataCommand, 'scrivi', scrivi_poi_fallisce):
+                self.importa('--batch-size', '2')
+            self.assertEqual(list(Iscritto.objects.values_list('matricola', flat=True)), [1])
+            checkpoint = ImportCheckpoint.objects.get(sezione='Anagrafica Iscritti', tabella='TAnagrafe')
+            self.assertEqual((checkpoint.righe, checkpoint.completato), (3, True))
+            transaction.set_rollback(True)
+
+        # In bulk il blocco rifiutato viene ripetuto riga per riga
+        report = os.path.join(self.cartella, 'report.json')
+        output = self.importa('--bulk', '--report', report)
+        self.assertIn('Blocco Iscritto rifiutato', output)
+        self.assertEqual(sorted(Iscritto.objects.values_list('matricola', flat=True)), [1, 2])
+        with open(report, encoding='utf-8') as f:
+            sezioni = {sezione['nome']: sezione for sezione in json.load(f)['sezioni']}
+        self.assertEqual(sezioni['Anagrafica Iscritti']['errori'], 1)
+
+    def test_sezioni_parallele_dopo_le_dipendenze(self):
+        comando = ImportOldDataCommand()
+        comando.jobs = 3
+        concluse = []
+
+        def esegui(nome, funzione):
+            time.sleep(funzione())
+            concluse.append(nome)
+
+        comando.run_section_worker = esegui
+        tasks = [
+            ('Supporto', lambda: 0.05, []),
+            ('Staff', lambda: 0.01, ['Supporto']),
+            ('Iscritti', lambda: 0.02, ['Supporto']),
+            ('Catalogo', lambda: 0, []),
+            ('Edizioni', lambda: 0, ['Staff', 'Catalogo']),
+            ('Iscrizioni', lambda: 0, ['Iscritti', 'Edizioni']),
+        ]
+        comando.run_parallel(tasks)
+        self.assertEqual(sorted(concluse), sorted(nome for nome, _, _ in tasks))
+        for nome, _, dipendenze in tasks:
+            for dipendenza in dipendenze:
+                self.assertLess(concluse.index(dipendenza), concluse.index(nome))
+        # Catalogo non dipende da nulla e non aspetta Supporto
+        self.assertLess(concluse.index('Catalogo'), concluse.index('Supporto'))
+
+        with self.assertRaises(CommandError):
+            comando.run_parallel([('A', lambda: 0, ['B']), ('B', lambda: 0, ['A'])])
+        with self.assertRaises(CommandError):
+            comando.run_parallel([('A', lambda: 0, ['Inesistente'])])
+
+    def test_jobs_su_sqlite_in_sequenza(self):
+        sequenziale = self.importa_e_annulla('--bulk')
+        with transaction.atomic():
+            output = self.importa('--bulk', '--jobs', '4')
+            self.assertEqual(self.importati(), sequenziale)
+            transaction.set_rollback(True)
+        self.assertIn('SQLite ammette un solo scrittore', output)
+
+    def importa_interrotta(self, tabella, dopo, *opzioni):
+        """Importazione in cui la lettura di tabella si interrompe dopo `dopo` righe (connessione persa)"""
+        righe_tabella = SorgenteCsv.righe_tabella
+
+        def interrotta(sorgente, nome):
+            for i, riga in enumerate(righe_tabella(sorgente, nome)):
+                if nome == tabella and i == dopo:
+                    raise OSError('connessione persa')
+                yield riga
+
+        with mock.patch.object(SorgenteCsv, 'righe_tabella', interrotta):
+            return self.importa(*opzioni)
+
+    def test_ripresa_dall_ultimo_checkpoint(self):
+        completa = self.importa_e_annulla('--bulk')
+        for opzioni in (['--batch-size', '1'], ['--bulk', '--batch-size', '1']):
+            with self.subTest(opzioni=opzioni), transaction.atomic():
+                output = self.importa_interrotta('TPresenzeCorsisti', 2, *opzioni)
+                self.assertIn('Errore critico in Registro Lezioni: connessione persa', output)
+                # Le righe dei blocchi consolidati restano
+                self.assertEqual(Lezione.objects.count(), 2)
+                self.assertEqual(ImportCheckpoint.objects.get(sezione='Registro Lezioni', tabella='TPresenzeCorsisti').righe, 2)
+
+                output = self.importa('--resume', *opzioni)
+                self.assertIn('Anagrafica Iscritti già completata', output)
+                self.assertIn('TPresenzeCorsisti: ripresa dopo 2 righe già consolidate', output)
+                self.assertEqual(self.importati(), completa)
+                transaction.set_rollback(True)
+
+    def test_ripresa_da_capo_se_il_vecchio_database_cambia(self):
+        with transaction.atomic():
+            self.importa_interrotta('TPresenzeCorsisti', 2, '--batch-size', '1')
+            colonne, lezioni = LEGACY['TPresenzeCorsisti']
+            output = self.importa('--resume', '--batch-size', '1', TPresenzeCorsisti=[lezioni[1], lezioni[0], lezioni[2]])
+            self.assertIn('il vecchio database è cambiato dopo il checkpoint, rilettura da capo', output)
+            self.assertEqual(Lezione.objects.count(), 3)
+            transaction.set_rollback(True)
+
+    def test_collegamento_coniugi(self):
+        self.importa('--bulk')
+        self.assertEqual(dict(Iscritto.objects.values_list('matricola', 'coniuge_id')), {1: 2, 2: 1})
+
+        # Una sola lettura degli iscritti, nessuna scrittura per le coppie già collegate
+        with self.assertNumQueries(1):
+            esito = collega_coppie([(1, 2), (2, 1), (1, 9)])
+        self.assertEqual(esito, {'collegati': 0, 'gia_collegati': 2, 'non_trovati': 1})
+
+        Iscritto.objects.filter(matricola=2).update(coniuge=None)
+        self.assertEqual(verifica_simmetria(), ([], [(1, 2)], []))
+        Iscritto.objects.filter(matricola=2).update(coniuge=2)
+        self.assertEqual(verifica_simmetria(), ([(1, 2, 2)], [], [(2,)]))
+        self.assertEqual(collega_coppie([(2, 1)], sovrascrivi=False)['gia_collegati'], 1)
+        self.assertEqual(collega_coppie([(2, 1)])['collegati'], 1)
+        self.assertEqual(verifica_simmetria(), ([], [], []))
+
+        # Il comando legge le coppie dal vecchio database
+        carica_legacy()
+        Iscritto.objects.update(coniuge=None)
+        output = StringIO()
+        call_command('collega_coniugi', stdout=output)
+        self.assertIn('Coniugi collegati: 2', output.getvalue())
+        self.assertIn('Tutti i collegamenti sono reciproci', output.getvalue())
+
+    def test_reimportazione_idempotente(self):
+        for opzioni in ([], ['--bulk']):
+            with self.subTest(opzioni=opzioni), transaction.atomic():
+                self.importa(*opzioni)
+                prima = self.importati()
+                self.importa(*opzioni)
+                self.assertEqual(self.importati(), prima)
+                transaction.set_rollback(True)
+
+    def verifica_righe_saltate_rielaborate(self, *opzioni):
+        # L'iscritto 3 viene rifiutato (codice fiscale duplicato): le sue iscrizioni
+        # vengono saltate senza registrarne l'impronta
+        self.importa('--incrementale', *opzioni)
+        self.assertFalse(Iscritto.objects.filter(matricola=3).exists())
+        self.assertFalse(ImportRigaLegacy.objects.filter(tabella='TIscrizioneAnnoAccademico', chiave='2024/2025|3').exists())
+        self.assertFalse(ImportRigaLegacy.objects.filter(tabella='TFrequenzaCorsi', chiave='2024/2025|10|3').exists())
+        self.assertEqual(IscrizioneAnnoAccademico.objects.count(), 2)
+        self.assertEqual(IscrizioneCorso.objects.count(), 2)
+
+        # Corretto il codice fiscale nel vecchio database, la riesecuzione importa
+        # l'iscritto e le iscrizioni rimaste invariate
+        colonne, anagrafe = LEGACY['TAnagrafe']
+        corretta = [riga[:-1] + ['VRDLCU55M41M059Z'] if riga[0] == 3 else riga for riga in anagrafe]
+        self.importa('--incrementale', *opzioni, TAnagrafe=corretta)
+        self.assertTrue(Iscritto.objects.filter(matricola=3).exists())
+        self.assertTrue(IscrizioneAnnoAccademico.objects.filter(iscritto_id=3, anno_accademico__anno='2024-2025').exists())
+        self.assertTrue(IscrizioneCorso.objects.filter(iscritto_id=3, edizione_corso_id=101).exists())
+        self.assertTrue(ImportRigaLegacy.objects.filter(tabella='TFrequenzaCorsi', chiave='2024/2025|10|3').exists())
+
+    def test_incrementale_rielabora_le_righe_saltate(self):
+        self.verifica_righe_saltate_rielaborate()
+
+    def test_incrementale_bulk_rielabora_le_righe_saltate(self):
+        self.verifica_righe_saltate_rielaborate('--bulk')
+
+    def test_incrementale_solo_righe_nuove_o_modificate(self):
+        colonne, docenti = LEGACY['TDocenti']
+        cambiati = [docenti[0], docenti[1][:2] + ['BRUNI ELENA MARIA'] + docenti[1][3:],
+                    [3, 'Prof.', 'ROSSI PAOLO', '', '', '', 100, '', '']]
+        for opzioni in ([], ['--bulk']):
+            with self.subTest(opzioni=opzioni), transaction.atomic():
+                self.importa('--incrementale', *opzioni)
+                watermark = ImportWatermark.objects.get(tabella='TDocenti')
+                self.assertEqual((watermark.righe, watermark.nuove, watermark.modificate), (2, 2, 0))
+                self.assertEqual(ImportRigaLegacy.objects.filter(tabella='TDocenti').count(), 2)
+
+                # Nessuna modifica: nessuna riga elaborata
+                output = self.importa('--incrementale', *opzioni)
+                self.assertIn('TDocenti: 0 nuove, 0 modificate, 2 invariate', output)
+                self.assertIn('TPresenzeCorsisti: 0 nuove, 0 modificate, 3 invariate', output)
+
+                output = self.importa('--incrementale', *opzioni, TDocenti=cambiati)
+                self.assertIn('TDocenti: 1 nuove, 1 modificate, 1 invariate', output)
+                self.assertEqual(
+                    list(Docente.objects.filter(pk__in=[1, 2, 3]).order_by('pk').values_list('nome', flat=True)),
+                    ['NERI CARLO', 'BRUNI ELENA MARIA', 'ROSSI PAOLO']
+                )
+                self.assertEqual(ImportRigaLegacy.objects.filter(tabella='TDocenti').count(), 3)
+                transaction.set_rollback(True)
+
+    def test_upsert_bulk_cambia_l_impronta_dei_report(self):
+        # Gli aggiornamenti a blocchi aggiornano data_modifica, su cui si basa l'archivio dei PDF
+        self.importa('--bulk', '--incrementale')
+        registro = archivio_report.chiave('registro_lezioni', edizione_id=101)
+        colonne, lezioni = LEGACY['TPresenzeCorsisti']
+        self.importa('--bulk', '--incrementale', TPresenzeCorsisti=[lezioni[0][:3] + ['Argomento cambiato'] + lezioni[0][4:]] + lezioni[1:])
+        self.assertEqual(Lezione.objects.get(edizione_corso_id=101, descrizione='Argomento cambiato').ore_lezione, 2.0)
+        self.assertNotEqual(archivio_report.chiave('registro_lezioni', edizione_id=101), registro)
+
+        registro = archivio_report.chiave('registro_lezioni', edizione_id=101)
+        colonne, docenti = LEGACY['TDocenti']
+        self.importa('--bulk', '--incrementale', TDocenti=[docenti[0][:2] + ['NERI CARLO ALBERTO'] + docenti[0][3:]] + docenti[1:])
+        self.assertNotEqual(archivio_report.chiave('registro_lezioni', edizione_id=101), registro)
+
+
+# mysqldump in miniatura: tipi di colonna, escape, NULL, date zero, più INSERT per tabella
+DUMP = r"""-- MySQL dump 10.13
+DROP TABLE IF EXISTS `TAnagrafe`;
+CREATE TABLE `TAnagrafe` (
+  `Matr` int(11) NOT NULL,
+  `Nominativo` varchar(60) DEFAULT NULL,
+  `Telefono` varchar(20) DEFAULT NULL,
+  `DataNascita` datetime DEFAULT NULL,
+  `DataIscrizione` date DEFAULT NULL,
+  `Quota` decimal(6,2) DEFAULT NULL,
+  `Ore` double DEFAULT NULL,
+  `Moglie` int(11) DEFAULT NULL,
+  PRIMARY KEY (`Matr`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+INSERT INTO `TAnagrafe` VALUES (1,'D\'ANGELO MARIA','0571 123','1950-03-01 00:00:00','2023-10-01',25.50,1.5,2),(2,'ROSSI ''PINO''\nSECONDA RIGA','',NULL,'0000-00-00',NULL,2,1);
+INSERT INTO `TAnagrafe` VALUES (3,'VERDI, ANNA (VINCI)','0571',NULL,NULL,0.00,NULL,0);
+DROP TABLE IF EXISTS `TCorsi`;
+CREATE TABLE `TCorsi` (
+  `Codice` int(11) NOT NULL,
+  `Nome` varchar(60) DEFAULT NULL
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
+INSERT INTO `TCorsi` VALUES (10,'INFORMATICA');
+"""
+
+
+class SorgenteFileTest(SimpleTestCase):
+    """Lettura del vecchio database da un dump o da una cartella di CSV (import_old_data --sorgente)"""
+
+    def setUp(self):
+        self.cartella = tempfile.mkdtemp(prefix='unigest-test-sorgente-')
+        self.addCleanup(shutil.rmtree, self.cartella, ignore_errors=True)
+
+    def scrivi(self, nome, contenuto, apri=open):
+        percorso = os.path.join(self.cartella, nome)
+        with apri(percorso, 'wt', encoding='utf-8', newline='') as f:
+            f.write(contenuto)
+        return percorso
+
+    def test_dump(self):
+        attese = [
+            (1, "D'ANGELO MARIA", '0571 123', datetime(1950, 3, 1), date(2023, 10, 1), Decimal('25.50'), 1.5, 2),
+            (2, "ROSSI 'PINO'\nSECONDA RIGA", '', None, None, None, 2.0, 1),
+            (3, 'VERDI, ANNA (VINCI)', '0571', None, None, Decimal('0.00'), None, 0),
+        ]
+        for nome, apri in (('vecchio.sql', open), ('vecchio.sql.gz', gzip.open)):
+            with self.subTest(nome):
+                sorgente = apri_sorgente(self.scrivi(nome, DUMP, apri))
+                self.assertIsInstance(sorgente, SorgenteDump)
+                self.assertEqual(list(sorgente.esegui("SELECT * FROM `TAnagrafe`")), attese)
+                self.assertEqual(list(sorgente.esegui("SELECT * FROM TCorsi")), [(10, 'INFORMATICA')])
+                self.assertEqual(
+                    list(sorgente.esegui("SELECT Matr, Moglie FROM `TAnagrafe` WHERE Moglie IS NOT NULL AND Moglie != 0")),
+                    [(1, 2), (2, 1)]
+                )
+                self.assertEqual(
+                    list(sorgente.esegui("SELECT DISTINCT Ore FROM TAnagrafe WHERE Ore IS NOT NULL ORDER BY Ore DESC")),
+                    [(2.0,), (1.5,)]
+                )
+                # Come MySQL: i NULL prima in ordine crescente, stringa confrontata come numero
+                self.assertEqual(
+                    list(sorgente.esegui("SELECT Matr FROM TAnagrafe ORDER BY DataNascita")), [(2,), (3,), (1,)]
+                )
+                self.assertEqual(list(sorgente.esegui("SELECT Matr FROM TAnagrafe WHERE Moglie = '2'")), [(1,)])
+                self.assertEqual(list(sorgente.esegui("SELECT Nominativo FROM TAnagrafe WHERE Telefono = '0571'")),
+                                 [('VERDI, ANNA (VINCI)',)])
+
+    def test_csv(self):
+        self.scrivi('TAnagrafe.csv', '\ufeffMatr;Telefono;Nominativo;Quota;DataNascita\r\n'
+                                     '1;0571123;"ROSSI; MARIO";25.5;1950-03-01\r\n'
+                                     '2;;BIANCHI;;\r\n')
+        self.scrivi('TCorsi.csv', 'Codice,Nome\r\n10,INFORMATICA\r\n')
+        sorgente = apri_sorgente(self.cartella)
+        self.assertIsInstance(sorgente, SorgenteCsv)
+        # BOM tolto dal nome della prima colonna, telefono con lo zero iniziale lasciato come testo
+        self.assertEqual(list(sorgente.esegui("SELECT Matr, Telefono, Nominativo, Quota, DataNascita FROM TAnagrafe")), [
+            (1, '0571123', 'ROSSI; MARIO', 25.5, datetime(1950, 3, 1)),
+            (2, None, 'BIANCHI', None, None),
+        ])
+        self.assertEqual(list(sorgente.esegui("SELECT * FROM tcorsi")), [(10, 'INFORMATICA')])
+
+    def test_query_non_supportate(self):
+        sorgente = apri_sorgente(self.scrivi('vecchio.sql', DUMP))
+        for sql in (
+            "SELECT COUNT(*) FROM TAnagrafe GROUP BY Matr",
+            "SELECT Matr FROM TAnagrafe WHERE Matr > 1",
+            "SELECT Inesistente FROM TAnagrafe",
+            "SELECT * FROM TInesistente",
+        ):
+            with self.subTest(sql), self.assertRaises(CommandError):
+                list(sorgente.esegui(sql))
+        with self.assertRaises(CommandError):
+            apri_sorgente(os.path.join(self.cartella, 'inesistente.sql'))
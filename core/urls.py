@@ -64,6 +64,7 @@ urlpatterns = [
     path('iscrizioni-anno/', views.IscrizioneAnnoListView.as_view(), name='iscrizione_anno_list'),
     path('iscrizioni-anno/nuova/', views.IscrizioneAnnoCreateView.as_view(), name='iscrizione_anno_create'),
     path('export/iscritti-excel/', views.export_iscritti_excel, name='export_iscritti_excel'),
+    path('export/iscritti-csv/', views.export_iscritti_csv, name='export_iscritti_csv'),
     path('iscrizioni-corso/', views.IscrizioneCorsoListView.as_view(), name='iscrizione_corso_list'),
     path('iscrizioni-corso/nuova/', views.IscrizioneCorsoCreateView.as_view(), name='iscrizione_corso_create'),
     
@@ -86,10 +87,15 @@ urlpatterns = [
     path('report/elenco-corsi-anno/<int:anno_id>/', views.elenco_corsi_anno_pdf, name='elenco_corsi_anno_pdf'),
     path('report/rubrica-contatti/<int:anno_id>/', views.rubrica_contatti_pdf, name='rubrica_contatti_pdf'),
     path('report/registro-lezioni/<int:edizione_id>/', views.registro_lezioni_pdf, name='registro_lezioni_pdf'),
+    path('report/edizioni-anno/<int:anno_id>/', views.report_edizioni_zip, name='report_edizioni_zip'),
+    path('report/lavori/<int:pk>/', views.lavoro_report_detail, name='lavoro_report_detail'),
+    path('report/lavori/<int:pk>/stato/', views.lavoro_report_stato, name='lavoro_report_stato'),
+    path('report/lavori/<int:pk>/scarica/', views.lavoro_report_scarica, name='lavoro_report_scarica'),
     
     # ========================================================================
     # UTILITÀ
     # ========================================================================
     path('cerca/', views.ricerca_globale, name='ricerca_globale'),
+    path('iscritti/autocomplete/', views.iscritto_autocomplete, name='iscritto_autocomplete'),
     path('anno-accademico/cambia/', views.cambia_anno_accademico, name='cambia_anno_accademico'),
 ]
@@ -4,19 +4,24 @@ File: core/views.py
 Descrizione: Viste per la gestione dell'applicazione
 """
 
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.db import transaction
 from django.db.models import Q, Count, Sum
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from .models import (
     Iscritto, Docente, Autorita, Corso, EdizioneCorso, AnnoAccademico,
-    IscrizioneAnnoAccademico, IscrizioneCorso, Lezione, PresenzaLezione
+    IscrizioneAnnoAccademico, IscrizioneCorso, Lezione, PresenzaLezione, LavoroReport
 )
+from . import archivio_report, esportazioni, lavori, ricerca, statistiche
+from .middleware import anno_per_id
+from .paginazione import KeysetMixin
 from .forms import (
     IscrittoForm, DocenteForm, AutoritaForm, CorsoForm, EdizioneCorsoForm,
     IscrizioneAnnoForm, IscrizioneCorsoForm, LezioneForm
@@ -31,25 +36,16 @@ def home(request):
     """
     Vista per la home page principale
     """
-    # L'anno_attivo viene dal context processor
-    anno_attivo = request.session.get('anno_accademico_id')
-    if anno_attivo:
-        anno_attivo = AnnoAccademico.objects.filter(id=anno_attivo).first()
+    # Anno risolto una volta per richiesta da AnnoAccademicoMiddleware
+    anno_attivo = request.anno_accademico
 
-    # Statistiche rapide
-    context = {
-        'totale_iscritti': Iscritto.objects.count(),
-        'totale_docenti': Docente.objects.filter(attivo=True).count(),
-        'totale_corsi': Corso.objects.filter(visibile=True).count(),
-    }
+    # Statistiche rapide (dalla cache, invalidata dai segnali dei modelli)
+    context = dict(statistiche.statistiche_generali())
 
     if anno_attivo:
-        context['iscritti_anno_corrente'] = IscrizioneAnnoAccademico.objects.filter(
-            anno_accademico=anno_attivo
-        ).count()
-        context['edizioni_anno_corrente'] = EdizioneCorso.objects.filter(
-            anno_accademico=anno_attivo
-        ).count()
+        stats_anno = statistiche.statistiche_anno(anno_attivo.id)
+        context['iscritti_anno_corrente'] = stats_anno['totale_iscritti']
+        context['edizioni_anno_corrente'] = stats_anno['totale_edizioni']
 
     return render(request, 'home.html', context)
 
@@ -58,43 +54,23 @@ def dashboard(request):
     """
     Dashboard con statistiche dettagliate
     """
-    # Ottieni anno dalla sessione
-    anno_id = request.session.get('anno_accademico_id')
-    anno_attivo = None
-    if anno_id:
-        anno_attivo = AnnoAccademico.objects.filter(id=anno_id).first()
-
-    if not anno_attivo:
-        anno_attivo = AnnoAccademico.objects.filter(attivo=True).first()
+    # Anno selezionato (o attivo), risolto da AnnoAccademicoMiddleware
+    anno_attivo = request.anno_accademico
 
     context = {}
 
     if anno_attivo:
-        # Statistiche iscrizioni
-        context['iscritti_anno'] = IscrizioneAnnoAccademico.objects.filter(
-            anno_accademico=anno_attivo
-        ).count()
+        stats_anno = statistiche.statistiche_anno(anno_attivo.id)
 
-        # AGGIUNGI QUESTA RIGA ⬇️
-        context['edizioni_anno_corrente'] = EdizioneCorso.objects.filter(
-            anno_accademico=anno_attivo
-        ).count()
+        # Statistiche iscrizioni
+        context['iscritti_anno'] = stats_anno['totale_iscritti']
+        context['edizioni_anno_corrente'] = stats_anno['totale_edizioni']
 
         # Edizioni per categoria
-        context['edizioni_per_categoria'] = EdizioneCorso.objects.filter(
-            anno_accademico=anno_attivo
-        ).values(
-            'corso__categoria__nome'
-        ).annotate(
-            totale=Count('id')
-        ).order_by('-totale')
+        context['edizioni_per_categoria'] = stats_anno['edizioni_per_categoria']
 
         # Corsi più frequentati
-        context['corsi_piu_frequentati'] = EdizioneCorso.objects.filter(
-            anno_accademico=anno_attivo
-        ).annotate(
-            num_iscritti=Count('iscrizioni')
-        ).order_by('-num_iscritti')[:10]
+        context['corsi_piu_frequentati'] = stats_anno['top_corsi']
 
     return render(request, 'dashboard.html', context)
 
@@ -103,12 +79,13 @@ def dashboard(request):
 # VIEWS PER ISCRITTI
 # ============================================================================
 
-class IscrittoListView(ListView):
-    """Lista di tutti gli iscritti"""
+class IscrittoListView(KeysetMixin, ListView):
+    """Lista di tutti gli iscritti, paginata a chiave su nominativo"""
     model = Iscritto
     template_name = 'anagrafiche/iscritto_list.html'
     context_object_name = 'iscritti'
     paginate_by = 50
+    chiave_keyset = ['nominativo', 'matricola']
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -140,6 +117,9 @@ class IscrittoDetailView(DetailView):
     model = Iscritto
     template_name = 'anagrafiche/iscritto_detail.html'
     context_object_name = 'iscritto'
+    queryset = Iscritto.objects.select_related(
+        'comune', 'titolo_studio', 'professione_attuale', 'professione_passata', 'coniuge'
+    )
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -153,8 +133,9 @@ class IscrittoDetailView(DetailView):
         context['corsi_frequentati'] = IscrizioneCorso.objects.filter(
             iscritto=self.object
         ).select_related(
+            'anno_accademico',
             'edizione_corso__corso',
-            'edizione_corso__anno_accademico'
+            'edizione_corso__quadrimestre'
         ).order_by('-anno_accademico__anno')
         
         # Corsi come assistente
@@ -194,9 +175,9 @@ class IscrittoDeleteView(DeleteView):
     template_name = 'anagrafiche/iscritto_confirm_delete.html'
     success_url = reverse_lazy('core:iscritto_list')
     
-    def delete(self, request, *args, **kwargs):
-        messages.success(request, 'Iscritto eliminato con successo!')
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        messages.success(self.request, 'Iscritto eliminato con successo!')
+        return super().form_valid(form)
 
 
 # ============================================================================
@@ -393,16 +374,9 @@ class EdizioneCorsoListView(ListView):
         anno = self.request.GET.get('anno')
         if anno:
             queryset = queryset.filter(anno_accademico_id=anno)
-        else:
-            # Default: anno dalla sessione
-            anno_id = self.request.session.get('anno_accademico_id')
-            if anno_id:
-                queryset = queryset.filter(anno_accademico_id=anno_id)
-            else:
-                # Fallback: anno attivo
-                anno_attivo = AnnoAccademico.objects.filter(attivo=True).first()
-                if anno_attivo:
-                    queryset = queryset.filter(anno_accademico=anno_attivo)
+        elif self.request.anno_accademico:
+            # Default: anno selezionato (sessione, poi anno attivo)
+            queryset = queryset.filter(anno_accademico_id=self.request.anno_accademico.id)
 
         # Filtro per quadrimestre
         quadrimestre = self.request.GET.get('quadrimestre')
@@ -414,9 +388,7 @@ class EdizioneCorsoListView(ListView):
             'anno_accademico',
             'quadrimestre',
             'docente'
-        ).annotate(
-            num_iscritti=Count('iscrizioni')
-        )
+        ).order_by('-anno_accademico__anno', 'quadrimestre__numero', 'corso__nome')
 
 
 class EdizioneCorsoDetailView(DetailView):
@@ -477,9 +449,9 @@ def gestione_iscrizioni_corso(request, pk):
     
     # Iscritti disponibili (iscritti all'anno ma non al corso)
     iscritti_disponibili = Iscritto.objects.filter(
-        iscrizioneannoacademico__anno_accademico=edizione.anno_accademico
+        iscrizioneannoaccademico__anno_accademico=edizione.anno_accademico
     ).exclude(
-        id__in=iscritti_corso
+        pk__in=iscritti_corso
     ).order_by('nominativo')
     
     context = {
@@ -494,12 +466,47 @@ def gestione_iscrizioni_corso(request, pk):
 # VIEWS PER ISCRIZIONI
 # ============================================================================
 
-class IscrizioneAnnoListView(ListView):
-    """Lista iscrizioni anno accademico"""
+def filtra_anno(request, queryset):
+    """
+    Filtro ?anno=<id>; in mancanza l'anno selezionato (sessione, poi anno attivo),
+    con ?anno=tutti nessun filtro. Restituisce (queryset, anno applicato o None).
+    """
+    anno = request.GET.get('anno', '')
+    if anno == 'tutti':
+        return queryset, None
+    if anno.isdigit():
+        return queryset.filter(anno_accademico_id=anno), anno_per_id(anno)
+    if request.anno_accademico:
+        return queryset.filter(anno_accademico_id=request.anno_accademico.id), request.anno_accademico
+    return queryset, None
+
+
+class FiltroAnnoMixin:
+    """
+    Per le ListView filtrate con filtra_anno: l'anno applicato finisce nel
+    contesto (anno_filtro) e il template lo mostra con filtro_anno.html
+    """
+
+    def get_queryset(self):
+        queryset, self.anno_filtro = filtra_anno(self.request, super().get_queryset())
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['anno_filtro'] = self.anno_filtro
+        return context
+
+
+class IscrizioneAnnoListView(FiltroAnnoMixin, KeysetMixin, ListView):
+    """Lista iscrizioni dell'anno accademico, paginata a chiave per data di iscrizione"""
     model = IscrizioneAnnoAccademico
     template_name = 'iscrizioni/iscrizione_anno_list.html'
     context_object_name = 'iscrizioni'
     paginate_by = 100
+    chiave_keyset = ['data_iscrizione', 'id']
+    
+    def get_queryset(self):
+        return super().get_queryset().select_related('iscritto', 'anno_accademico')
 
 
 class IscrizioneAnnoCreateView(CreateView):
@@ -509,17 +516,33 @@ class IscrizioneAnnoCreateView(CreateView):
     template_name = 'iscrizioni/iscrizione_anno_form.html'
     success_url = reverse_lazy('core:iscrizione_anno_list')
     
+    def get_initial(self):
+        # Propone l'anno accademico selezionato
+        initial = super().get_initial()
+        if self.request.anno_accademico:
+            initial.setdefault('anno_accademico', self.request.anno_accademico.pk)
+        return initial
+    
     def form_valid(self, form):
         messages.success(self.request, 'Iscrizione anno creata con successo!')
         return super().form_valid(form)
 
 
-class IscrizioneCorsoListView(ListView):
-    """Lista iscrizioni corsi"""
+class IscrizioneCorsoListView(FiltroAnnoMixin, KeysetMixin, ListView):
+    """
+    Lista iscrizioni ai corsi dell'anno accademico, paginata a chiave per
+    edizione e matricola (l'indice univoco anno/edizione/iscritto)
+    """
     model = IscrizioneCorso
     template_name = 'iscrizioni/iscrizione_corso_list.html'
     context_object_name = 'iscrizioni'
     paginate_by = 100
+    chiave_keyset = ['edizione_corso_id', 'iscritto_id']
+    
+    def get_queryset(self):
+        return super().get_queryset().select_related(
+            'iscritto', 'edizione_corso__corso', 'edizione_corso__quadrimestre'
+        )
 
 
 class IscrizioneCorsoCreateView(CreateView):
@@ -529,6 +552,13 @@ class IscrizioneCorsoCreateView(CreateView):
     template_name = 'iscrizioni/iscrizione_corso_form.html'
     success_url = reverse_lazy('core:iscrizione_corso_list')
     
+    def get_initial(self):
+        # Propone l'anno accademico selezionato
+        initial = super().get_initial()
+        if self.request.anno_accademico:
+            initial.setdefault('anno_accademico', self.request.anno_accademico.pk)
+        return initial
+    
     def form_valid(self, form):
         messages.success(self.request, 'Iscrizione corso creata con successo!')
         return super().form_valid(form)
@@ -538,12 +568,16 @@ class IscrizioneCorsoCreateView(CreateView):
 # VIEWS PER LEZIONI
 # ============================================================================
 
-class LezioneListView(ListView):
-    """Lista lezioni"""
+class LezioneListView(KeysetMixin, ListView):
+    """Lista lezioni, dalla più recente, paginata a chiave"""
     model = Lezione
     template_name = 'lezioni/lezione_list.html'
     context_object_name = 'lezioni'
     paginate_by = 50
+    chiave_keyset = ['-data_lezione', 'edizione_corso_id']
+    
+    def get_queryset(self):
+        return super().get_queryset().select_related('edizione_corso__corso', 'docente')
 
 
 class LezioneDetailView(DetailView):
@@ -551,6 +585,7 @@ class LezioneDetailView(DetailView):
     model = Lezione
     template_name = 'lezioni/lezione_detail.html'
     context_object_name = 'lezione'
+    queryset = Lezione.objects.select_related('edizione_corso__corso', 'docente')
 
 
 class LezioneCreateView(CreateView):
@@ -578,38 +613,43 @@ class LezioneUpdateView(UpdateView):
 
 def gestione_presenze(request, pk):
     """
-    Vista per gestire le presenze a una lezione
+    Vista per gestire le presenze a una lezione.
+    Le presenze mancanti vengono create con un solo bulk_create e al salvataggio
+    vengono aggiornate con un solo bulk_update le sole righe cambiate: il numero
+    di query resta costante qualunque sia il numero di iscritti al corso.
     """
     lezione = get_object_or_404(Lezione, pk=pk)
-    
-    # Ottieni tutti gli iscritti al corso
-    iscritti_corso = IscrizioneCorso.objects.filter(
-        edizione_corso=lezione.edizione_corso
-    ).select_related('iscritto')
-    
-    # Crea o ottieni le presenze
-    for iscrizione in iscritti_corso:
-        PresenzaLezione.objects.get_or_create(
-            lezione=lezione,
-            iscritto=iscrizione.iscritto,
-            defaults={'presente': True}
-        )
-    
-    presenze = PresenzaLezione.objects.filter(
-        lezione=lezione
-    ).select_related('iscritto').order_by('iscritto__nominativo')
-    
+    presenze_lezione = PresenzaLezione.objects.filter(lezione=lezione)
+
+    # Crea le presenze degli iscritti al corso che non ne hanno ancora una
+    nuovi = IscrizioneCorso.objects.filter(
+        edizione_corso_id=lezione.edizione_corso_id
+    ).exclude(
+        iscritto_id__in=presenze_lezione.values('iscritto_id')
+    ).order_by().values_list('iscritto_id', flat=True).distinct()
+    PresenzaLezione.objects.bulk_create(
+        [PresenzaLezione(lezione=lezione, iscritto_id=iscritto_id, presente=True) for iscritto_id in nuovi],
+        ignore_conflicts=True
+    )
+
+    presenze = list(presenze_lezione.select_related('iscritto').order_by('iscritto__nominativo'))
+
     if request.method == 'POST':
-        # Aggiorna presenze
-        for presenza in presenze:
-            campo = f'presenza_{presenza.id}'
-            presenza.presente = campo in request.POST
-            presenza.save()
-        
-        # Aggiorna conteggio
-        lezione.numero_presenti = presenze.filter(presente=True).count()
-        lezione.save()
-        
+        with transaction.atomic():
+            # Aggiorna solo le presenze il cui stato è cambiato
+            modificate = []
+            for presenza in presenze:
+                presente = f'presenza_{presenza.id}' in request.POST
+                if presenza.presente != presente:
+                    presenza.presente = presente
+                    modificate.append(presenza)
+            if modificate:
+                PresenzaLezione.objects.bulk_update(modificate, ['presente'])
+
+            # Aggiorna conteggio
+            lezione.numero_presenti = presenze_lezione.filter(presente=True).count()
+            lezione.save(update_fields=['numero_presenti', 'data_modifica'])
+
         messages.success(request, 'Presenze salvate con successo!')
         return redirect('core:lezione_detail', pk=lezione.pk)
     
@@ -627,11 +667,7 @@ def gestione_presenze(request, pk):
 
 def report_menu(request):
     """Menu dei report disponibili"""
-    # Ottieni anno dalla sessione
-    anno_id = request.session.get('anno_accademico_id')
-    anno_attivo = None
-    if anno_id:
-        anno_attivo = AnnoAccademico.objects.filter(id=anno_id).first()
+    anno_attivo = request.anno_accademico
 
     # Edizioni dell'anno per i modal
     edizioni = []
@@ -641,92 +677,121 @@ def report_menu(request):
         ).select_related('corso', 'docente', 'quadrimestre').order_by('corso__nome')
 
     context = {
-        'edizioni': edizioni
+        'edizioni': edizioni,
+        # Ultimi report richiesti, per ritrovare quelli generati in background
+        'lavori': LavoroReport.objects.order_by('-data_creazione')[:10],
     }
 
     return render(request, 'report/menu.html', context)
 
 
-def foglio_presenze_pdf(request, edizione_id):
-    """Genera foglio presenze PDF"""
-    from core.models import EdizioneCorso
-    from .reports import foglio_presenze_pdf as genera_pdf
+def _accoda_report(request, tipo, descrizione, **parametri):
+    """
+    Accoda il report per worker_report e rimanda alla pagina del lavoro, che
+    avvia il download a file pronto. Con REPORT_IN_BACKGROUND=False (default,
+    nessun worker avviato) il file viene generato nella richiesta e inviato
+    subito, senza LavoroReport né copie in MEDIA_ROOT che nessuno ripulirebbe.
+    Un PDF già generato con gli stessi dati viene scaricato subito dall'archivio.
+    """
+    if not settings.REPORT_IN_BACKGROUND:
+        contenuto, nome_file = lavori.genera(tipo, **parametri)
+        contenuto.seek(0)
+        return FileResponse(contenuto, as_attachment=True, filename=nome_file)
 
-    edizione = get_object_or_404(EdizioneCorso, pk=edizione_id)
-    buffer = genera_pdf(edizione)
+    chiave = archivio_report.chiave(tipo, **parametri)
+    percorso = archivio_report.cerca(chiave) if chiave else None
+    if percorso:
+        try:
+            return FileResponse(open(percorso, 'rb'), as_attachment=True, filename=percorso.name)
+        except FileNotFoundError:
+            pass  # Cancellato dall'archivio proprio ora: si rigenera
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="presenze_{edizione.corso.nome}.pdf"'
-    response.write(buffer.getvalue())
+    return redirect(lavori.accoda(tipo, descrizione, request.user, **parametri))
 
-    return response
 
+def _edizione_report(edizione_id):
+    return get_object_or_404(
+        EdizioneCorso.objects.select_related('corso', 'anno_accademico', 'quadrimestre'), pk=edizione_id
+    )
 
-def elenco_iscritti_pdf(request, edizione_id):
-    """Genera elenco iscritti PDF"""
-    from core.models import EdizioneCorso
-    from .reports import elenco_iscritti_pdf as genera_pdf
 
-    edizione = get_object_or_404(EdizioneCorso, pk=edizione_id)
-    buffer = genera_pdf(edizione)
+def foglio_presenze_pdf(request, edizione_id):
+    """Genera foglio presenze PDF (in background)"""
+    edizione = _edizione_report(edizione_id)
+    return _accoda_report(request, 'foglio_presenze', str(edizione), edizione_id=edizione.pk)
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="iscritti_{edizione.corso.nome}.pdf"'
-    response.write(buffer.getvalue())
 
-    return response
+def elenco_iscritti_pdf(request, edizione_id):
+    """Genera elenco iscritti PDF (in background)"""
+    edizione = _edizione_report(edizione_id)
+    return _accoda_report(request, 'elenco_iscritti', str(edizione), edizione_id=edizione.pk)
 
 
 def elenco_corsi_anno_pdf(request, anno_id):
-    """Genera elenco corsi anno PDF"""
-    from core.models import AnnoAccademico
-    from .reports import elenco_corsi_anno_pdf as genera_pdf
-
+    """Genera elenco corsi anno PDF (in background)"""
     anno = get_object_or_404(AnnoAccademico, pk=anno_id)
-    buffer = genera_pdf(anno)
+    return _accoda_report(request, 'elenco_corsi_anno', anno.anno, anno_id=anno.pk)
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="corsi_{anno.anno}.pdf"'
-    response.write(buffer.getvalue())
 
-    return response
+def rubrica_contatti_pdf(request, anno_id):
+    """Genera rubrica contatti PDF (in background)"""
+    anno = get_object_or_404(AnnoAccademico, pk=anno_id)
+    return _accoda_report(request, 'rubrica_contatti', anno.anno, anno_id=anno.pk)
 
 
-def rubrica_contatti_pdf(request, anno_id):
-    """Genera rubrica contatti PDF"""
-    from core.models import AnnoAccademico
-    from .reports import rubrica_contatti_pdf as genera_pdf
+def registro_lezioni_pdf(request, edizione_id):
+    """Genera registro lezioni PDF (in background)"""
+    edizione = _edizione_report(edizione_id)
+    return _accoda_report(request, 'registro_lezioni', str(edizione), edizione_id=edizione.pk)
 
-    anno = get_object_or_404(AnnoAccademico, pk=anno_id)
-    buffer = genera_pdf(anno)
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="rubrica_{anno.anno}.pdf"'
-    response.write(buffer.getvalue())
+def report_edizioni_zip(request, anno_id):
+    """Report PDF di tutte le edizioni dell'anno (o di un quadrimestre) in uno ZIP (in background)"""
+    anno = get_object_or_404(AnnoAccademico, pk=anno_id)
+    quadrimestre = request.GET.get('quadrimestre')
+    if quadrimestre not in ('0', '1', '2', '3'):
+        return _accoda_report(request, 'pacchetto_edizioni', anno.anno, anno_id=anno.pk)
+    return _accoda_report(
+        request, 'pacchetto_edizioni', f'{anno.anno} Q{quadrimestre}',
+        anno_id=anno.pk, quadrimestre=int(quadrimestre)
+    )
 
-    return response
 
+def lavoro_report_detail(request, pk):
+    """Stato di un report in background; a file pronto il download parte da solo"""
+    lavoro = get_object_or_404(LavoroReport, pk=pk)
+    return render(request, 'report/lavoro_detail.html', {'lavoro': lavoro})
 
-def registro_lezioni_pdf(request, edizione_id):
-    """Genera registro lezioni PDF"""
-    from core.models import EdizioneCorso
-    from .reports import registro_lezioni_pdf as genera_pdf
 
-    edizione = get_object_or_404(EdizioneCorso, pk=edizione_id)
-    buffer = genera_pdf(edizione)
+def lavoro_report_stato(request, pk):
+    """Stato di un report in background in JSON, interrogato dalla pagina del lavoro"""
+    lavoro = get_object_or_404(LavoroReport, pk=pk)
+    return JsonResponse({
+        'stato': lavoro.stato,
+        'descrizione_stato': lavoro.get_stato_display(),
+        'in_attesa': lavoro.in_attesa,
+        'url_scarica': reverse('core:lavoro_report_scarica', kwargs={'pk': lavoro.pk}) if lavoro.scaricabile else None,
+    })
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="registro_{edizione.corso.nome}.pdf"'
-    response.write(buffer.getvalue())
 
-    return response
+def lavoro_report_scarica(request, pk):
+    """Download del file di un report completato, finché non è scaduto"""
+    lavoro = get_object_or_404(LavoroReport, pk=pk)
+    if not lavoro.scaricabile:
+        messages.error(request, 'Il report non è disponibile: è ancora in preparazione, non è riuscito o è scaduto')
+        return redirect(lavoro)
+    return FileResponse(lavoro.file.open('rb'), as_attachment=True, filename=lavoro.nome_file)
 
 # ============================================================================
 # UTILITÀ
 # ============================================================================
 
 def ricerca_globale(request):
-    """Ricerca globale nel database"""
+    """
+    Ricerca globale nel database, sull'indice full-text (core/ricerca.py):
+    senza distinzione di accenti, con le parole anche come prefisso e i
+    risultati ordinati per rilevanza
+    """
     query = request.GET.get('q', '')
     
     risultati = {
@@ -736,19 +801,9 @@ def ricerca_globale(request):
     }
     
     if query:
-        risultati['iscritti'] = Iscritto.objects.filter(
-            Q(nominativo__icontains=query) |
-            Q(codice_fiscale__icontains=query)
-        )[:10]
-        
-        risultati['docenti'] = Docente.objects.filter(
-            nome__icontains=query
-        )[:10]
-        
-        risultati['corsi'] = Corso.objects.filter(
-            Q(nome__icontains=query) |
-            Q(descrizione__icontains=query)
-        )[:10]
+        risultati['iscritti'] = ricerca.cerca_oggetti(query, 'iscritto')
+        risultati['docenti'] = ricerca.cerca_oggetti(query, 'docente')
+        risultati['corsi'] = ricerca.cerca_oggetti(query, 'corso')
     
     return render(request, 'ricerca.html', {
         'query': query,
@@ -756,16 +811,45 @@ def ricerca_globale(request):
     })
 
 
+def iscritto_autocomplete(request):
+    """
+    Iscritti in JSON per i campi IscrittoAutocomplete, a pagine di
+    AUTOCOMPLETE_PER_PAGINA: nominativo, matricola e codice fiscale cercati
+    anche come prefisso sull'indice full-text. Con ?assistenti=1 solo gli
+    iscritti che possono essere assistenti.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        pagina = max(int(request.GET.get('pagina', 1)), 1)
+    except ValueError:
+        pagina = 1
+    per_pagina = settings.AUTOCOMPLETE_PER_PAGINA
+    
+    iscritti = Iscritto.objects.only('matricola', 'nominativo').order_by('nominativo', 'matricola')
+    if request.GET.get('assistenti'):
+        iscritti = iscritti.filter(e_assistente=True)
+    if query:
+        iscritti = ricerca.filtra(iscritti, query, 'iscritto')
+    
+    # Un elemento in più dice se esiste la pagina successiva, senza COUNT
+    inizio = (pagina - 1) * per_pagina
+    blocco = list(iscritti[inizio:inizio + per_pagina + 1])
+    return JsonResponse({
+        'risultati': [{'id': i.pk, 'testo': str(i)} for i in blocco[:per_pagina]],
+        'altri': len(blocco) > per_pagina,
+    })
+
+
 def cambia_anno_accademico(request):
     """Cambia l'anno accademico nella sessione"""
     if request.method == 'POST':
         anno_id = request.POST.get('anno_id')
         if anno_id:
-            try:
-                anno = AnnoAccademico.objects.get(pk=anno_id)
+            anno = anno_per_id(anno_id)
+            if anno:
                 request.session['anno_accademico_id'] = anno.id
                 messages.success(request, f'Anno accademico cambiato: {anno.anno}')
-            except AnnoAccademico.DoesNotExist:
+            else:
                 messages.error(request, 'Anno accademico non trovato')
 
     # Redirect alla pagina precedente o home
@@ -775,87 +859,24 @@ def cambia_anno_accademico(request):
 
 def export_iscritti_excel(request):
     """
-    Esporta iscritti in Excel
+    Esporta iscritti in Excel (in background, write-only a memoria limitata)
     """
-    from openpyxl import Workbook
-    from django.http import HttpResponse
-
-    # Crea workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Iscritti"
-
-    # Header
-    headers = ['Matricola', 'Nominativo', 'Sesso', 'Data Nascita',
-               'Comune', 'Telefono', 'Cellulare', 'Email']
-    ws.append(headers)
-
-    # Dati
-    iscritti = Iscritto.objects.all().select_related('comune')
-    for iscritto in iscritti:
-        ws.append([
-            iscritto.matricola,
-            iscritto.nominativo,
-            iscritto.get_sesso_display(),
-            iscritto.data_nascita.strftime('%d/%m/%Y') if iscritto.data_nascita else '',
-            str(iscritto.comune) if iscritto.comune else '',
-            iscritto.telefono or '',
-            iscritto.cellulare or '',
-            iscritto.email or ''
-        ])
-
-    # Response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=iscritti.xlsx'
-    wb.save(response)
+    return _accoda_report(request, 'iscritti_excel', 'tutti gli iscritti')
 
-    return response
+
+def export_iscritti_csv(request):
+    """
+    Esporta iscritti in CSV, inviato man mano che viene generato
+    """
+    return esportazioni.risposta_csv_iscritti()
 
 def statistiche_anno(request, anno_id):
     """Mostra statistiche anno accademico"""
-    from django.db.models import Count, Avg
-
     anno = get_object_or_404(AnnoAccademico, pk=anno_id)
 
-    # Statistiche generali
-    stats = {
-        'anno': anno,
-        'totale_iscritti': IscrizioneAnnoAccademico.objects.filter(anno_accademico=anno).count(),
-        'totale_edizioni': EdizioneCorso.objects.filter(anno_accademico=anno).count(),
-        'totale_iscrizioni_corso': IscrizioneCorso.objects.filter(anno_accademico=anno).count(),
-        'totale_lezioni': Lezione.objects.filter(edizione_corso__anno_accademico=anno).count(),
-    }
-
-    # Iscrizioni per categoria
-    stats['per_categoria'] = EdizioneCorso.objects.filter(
-        anno_accademico=anno
-    ).values(
-        'corso__categoria__nome'
-    ).annotate(
-        num_edizioni=Count('id'),
-        num_iscritti=Count('iscrizioni')
-    ).order_by('-num_iscritti')
-
-    # Corsi più frequentati
-    stats['top_corsi'] = EdizioneCorso.objects.filter(
-        anno_accademico=anno
-    ).annotate(
-        num_iscritti=Count('iscrizioni')
-    ).order_by('-num_iscritti')[:10]
-
-    # Presenze medie
-    lezioni_con_presenze = Lezione.objects.filter(
-        edizione_corso__anno_accademico=anno,
-        numero_presenti__gt=0
-    )
-    if lezioni_con_presenze.exists():
-        stats['presenza_media'] = lezioni_con_presenze.aggregate(
-            Avg('numero_presenti')
-        )['numero_presenti__avg']
-    else:
-        stats['presenza_media'] = 0
+    # Statistiche generali, per categoria, corsi più frequentati e presenze medie
+    # (dalla cache o dalla riga precalcolata di StatisticheAnno) e confronto con gli altri anni
+    stats = dict(statistiche.statistiche_anno(anno.id), anno=anno, confronto=statistiche.confronto_anni())
 
     return render(request, 'report/statistiche.html', stats)
 
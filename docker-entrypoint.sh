@@ -12,6 +12,19 @@ wait_for_db() {
 # Attendi il DB
 wait_for_db
 
+# Con un comando esplicito (es. il servizio worker di docker-compose) esegue solo quello:
+# migrazioni e file statici restano al servizio web
+if [ "$#" -gt 0 ]; then
+    # Con ATTENDI_MIGRAZIONI il comando parte solo dopo le migrazioni applicate dal servizio web
+    if [ -n "$ATTENDI_MIGRAZIONI" ]; then
+        echo "In attesa delle migrazioni..."
+        until python manage.py migrate --check > /dev/null 2>&1; do
+            sleep 2
+        done
+    fi
+    exec "$@"
+fi
+
 # Applica le migrazioni
 echo "Applicazione delle migrazioni..."
 python manage.py migrate --noinput
@@ -11,6 +11,7 @@ django.setup()
 
 from django.db import connections
 from core.models import Iscritto
+from core.management.commands.collega_coniugi import collega_coppie
 
 def collega_coniugi():
     print("="*70)
@@ -44,7 +45,8 @@ def collega_coniugi():
 
     print("\n3. Collegamento coniugi...")
 
-    # Prendi tutti con Moglie != NULL
+    # Prendi tutti con Moglie != NULL e collega in un solo passaggio
+    # (mappa matricole in memoria + bulk_update, vedi manage.py collega_coniugi)
     cursor.execute("""
         SELECT Matr, Moglie
         FROM TAnagrafe
@@ -52,38 +54,9 @@ def collega_coniugi():
         AND Moglie != 0
     """)
 
-    collegati = 0
-    non_trovati = 0
-
-    for row in cursor.fetchall():
-        matricola = row[0]
-        matricola_coniuge = row[1]
-
-        try:
-            # Trova iscritto
-            iscritto = Iscritto.objects.filter(matricola=matricola).first()
-            if not iscritto:
-                non_trovati += 1
-                continue
-
-            # Trova coniuge
-            coniuge = Iscritto.objects.filter(matricola=matricola_coniuge).first()
-            if not coniuge:
-                non_trovati += 1
-                continue
-
-            # Collega (solo se non già collegato)
-            if not iscritto.coniuge:
-                iscritto.coniuge = coniuge
-                iscritto.save()
-                collegati += 1
-
-                if collegati % 10 == 0:
-                    print(f"   Collegati: {collegati}")
-
-        except Exception as e:
-            if non_trovati == 0:
-                print(f"   ⚠️ Errore: {e}")
+    esito = collega_coppie(cursor.fetchall(), sovrascrivi=False)
+    collegati = esito['collegati']
+    non_trovati = esito['non_trovati']
 
     print("\n" + "="*70)
     print("RISULTATO")